@@ -0,0 +1,150 @@
+# python3: BoxClock.py
+"""
+name: BoxClock.py
+goal: one clock for the state machine timeouts, the run loops, Treadmill, FlipperOutput and the loggers
+description:
+    RealClock is a thin wrapper around time and threading.Timer and is the default.
+    VirtualClock is a discrete-event clock: nothing happens between two scheduled callbacks, so
+    sleep()/wait_for() jump straight to the next callback instead of waiting for it. all scheduled
+    callbacks (state timeouts, treadmill samples, flipper edges, the simulated mouse) run in order
+    in the thread that advances the clock, so a whole session replays in seconds and a run with the
+    same seeds produces the same logs every time.
+    the logs of a virtual run have the same format as those of a real-time run, but not the same
+    bytes: a real run stamps every event with the time it actually happened (scheduling delay,
+    treadmill read time, the animal), a virtual run with the exact deadline. compare a virtual run
+    with another virtual run, or a real run's event sequence rather than its timestamps.
+
+    the clock in use is module-wide: set_clock() it once before the box is created (BehavBox does
+    it when session_info['virtual_clock'] is True) and get_clock() it everywhere else. the task
+    protocols time their states with ClockTimeout and their run scripts sleep and check the session
+    end on task.box.clock; a plain time.sleep()/time.time() in a task would stay on real time.
+
+"""
+import heapq
+import time
+from threading import Timer, Lock
+
+
+class RealClock(object):
+    is_virtual = False
+
+    def time(self):
+        return time.time()
+
+    def time_ns(self):
+        return time.time_ns()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def monotonic_ns(self):
+        return time.monotonic_ns()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, timeout=None):
+        """Wait for a threading.Event, return its state."""
+        return event.wait(timeout)
+
+    def call_later(self, delay, function, *args):
+        """Run function(*args) after delay seconds in a timer thread; the handle has cancel()."""
+        timer = Timer(delay, function, args=args)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+
+class VirtualTimer(object):
+    def __init__(self, when_ns, function, args):
+        self.when_ns = when_ns
+        self.function = function
+        self.args = args
+        self.cancelled = False
+        self.finished = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def is_alive(self):
+        return not (self.cancelled or self.finished)
+
+
+class VirtualClock(object):
+    is_virtual = True
+
+    def __init__(self, start_time=None):
+        if start_time is None:
+            start_time = time.time()
+        self._wall_offset_ns = int(start_time * 1e9)
+        self._now_ns = 0  # monotonic time, starts at 0
+        self._queue = []  # heap of (when_ns, sequence, VirtualTimer)
+        self._sequence = 0
+        self._lock = Lock()
+
+    def time(self):
+        return (self._wall_offset_ns + self._now_ns) / 1e9
+
+    def time_ns(self):
+        return self._wall_offset_ns + self._now_ns
+
+    def monotonic(self):
+        return self._now_ns / 1e9
+
+    def monotonic_ns(self):
+        return self._now_ns
+
+    def call_later(self, delay, function, *args):
+        with self._lock:
+            timer = VirtualTimer(self._now_ns + max(int(delay * 1e9), 0), function, args)
+            self._sequence += 1
+            heapq.heappush(self._queue, (timer.when_ns, self._sequence, timer))
+        return timer
+
+    def _run_next(self, deadline_ns):
+        """Advance to and run the next callback due by deadline_ns; return False if there is none."""
+        with self._lock:
+            while self._queue and self._queue[0][2].cancelled:
+                heapq.heappop(self._queue)
+            if not self._queue or self._queue[0][0] > deadline_ns:
+                return False
+            when_ns, _, timer = heapq.heappop(self._queue)
+            self._now_ns = max(self._now_ns, when_ns)
+        timer.finished = True
+        timer.function(*timer.args)
+        return True
+
+    def sleep(self, seconds):
+        deadline_ns = self._now_ns + int(seconds * 1e9)
+        while self._run_next(deadline_ns):
+            pass
+        self._now_ns = max(self._now_ns, deadline_ns)
+
+    def wait_for(self, predicate, timeout=None):
+        """Advance until predicate() is true or timeout (s) elapsed; return predicate().
+
+        without a timeout the clock stops at the last scheduled callback.
+        """
+        deadline_ns = None if timeout is None else self._now_ns + int(timeout * 1e9)
+        while not predicate():
+            if not self._run_next(deadline_ns if deadline_ns is not None else float("inf")):
+                if deadline_ns is not None:
+                    self._now_ns = max(self._now_ns, deadline_ns)
+                break
+        return predicate()
+
+    def wait(self, event, timeout=None):
+        return self.wait_for(event.is_set, timeout)
+
+
+_clock = RealClock()
+
+
+def get_clock():
+    return _clock
+
+
+def set_clock(clock):
+    global _clock
+    _clock = clock
+    return clock
@@ -0,0 +1,22 @@
+# python3: ClockTimeout.py
+"""
+name: ClockTimeout.py
+goal: transitions Timeout state whose timer runs on the BoxClock instead of a threading.Timer
+description:
+    drop-in replacement for transitions.extensions.states.Timeout. with the default RealClock the
+    behaviour is the same; with a VirtualClock the timeout fires when the virtual time reaches it.
+
+"""
+from transitions import State
+from transitions.extensions.states import Timeout
+
+import BoxClock
+
+
+class ClockTimeout(Timeout):
+    def enter(self, event_data):
+        if self.timeout > 0:
+            self.runner[id(event_data.model)] = BoxClock.get_clock().call_later(
+                self.timeout, self._process_timeout, event_data
+            )
+        return State.enter(self, event_data)
@@ -0,0 +1,143 @@
+# python3: EdgeFilter.py
+"""
+name: EdgeFilter.py
+goal: debounce the lick and IR inputs before their edges reach the event ring, the logs and the task
+description:
+    every raw entry/exit edge from the gpiozero callbacks goes through EdgeFilter.edge(). an edge
+    that passes is handed to emit(source, edge, monotonic_ns) with its original timestamp; an edge
+    that does not is only counted. per input:
+        refractory: an entry that comes less than refractory s after the last reported exit is
+            dropped (the exit was contact chatter, not the end of the lick)
+        min_pulse: an entry is reported right away, but its exit is only reported once the input has
+            been in for min_pulse s. the edges of a shorter pulse are held back: if the input comes
+            back in, they were chatter and are dropped; if it stays out, the held exit is reported
+            at entry + min_pulse with the timestamp of the real exit edge
+        repeated edges (an entry while in, an exit while out) are always dropped
+    so a chattering lick gives one entry and one exit, and the entry latency is not increased.
+
+    settings are per input name (left, center, right, IR_1 .. IR_5) or per group (lick, IR), in s,
+    e.g. session_info['debounce'] = {'lick': {'min_pulse': 0.01, 'refractory': 0.02}}.
+
+"""
+from threading import RLock
+
+import BoxClock
+from EventRing import SOURCE_NAMES, SOURCE_ID, LEFT, CENTER, RIGHT, IR_1, IR_2, IR_3, IR_4, IR_5, ENTRY, EXIT
+
+GROUPS = {
+    "lick": (LEFT, CENTER, RIGHT),
+    "IR": (IR_1, IR_2, IR_3, IR_4, IR_5),
+}
+
+DEFAULT_SETTINGS = {
+    "lick": {"min_pulse": 0.01, "refractory": 0.02},
+    "IR": {"min_pulse": 0.005, "refractory": 0.0},
+}
+
+
+class EdgeFilter(object):
+    def __init__(self, emit, settings=None):
+        self.emit = emit  # emit(source, edge, monotonic_ns), called for every edge that passes
+        self.clock = BoxClock.get_clock()
+        self._lock = RLock()
+
+        n_sources = len(SOURCE_NAMES)
+        self.min_pulse_ns = [0] * n_sources
+        self.refractory_ns = [0] * n_sources
+        self.active = [False] * n_sources  # debounced state of each input
+        self._entry_ns = [0] * n_sources  # time of the last reported entry
+        self._exit_ns = [None] * n_sources  # time of the last reported exit
+        self._held_exit_ns = [None] * n_sources  # exit of a pulse shorter than min_pulse
+        self._release_timer = [None] * n_sources
+
+        # raw edges seen and dropped, per source and edge
+        self.raw_count = [[0, 0] for _ in range(n_sources)]
+        self.suppressed_count = [[0, 0] for _ in range(n_sources)]
+
+        self.configure(DEFAULT_SETTINGS)
+        if settings:
+            self.configure(settings)
+
+    def configure(self, settings):
+        """Set min_pulse/refractory (s) from {input or group name: {'min_pulse': s, 'refractory': s}}."""
+        for name, values in settings.items():
+            sources = GROUPS[name] if name in GROUPS else (SOURCE_ID[name],)
+            for source in sources:
+                if "min_pulse" in values:
+                    self.min_pulse_ns[source] = int(values["min_pulse"] * 1e9)
+                if "refractory" in values:
+                    self.refractory_ns[source] = int(values["refractory"] * 1e9)
+
+    def disable(self):
+        """Pass every edge that changes the input state, without min_pulse or refractory."""
+        self.min_pulse_ns = [0] * len(SOURCE_NAMES)
+        self.refractory_ns = [0] * len(SOURCE_NAMES)
+
+    def edge(self, source, edge, monotonic_ns=None):
+        """Filter one raw edge; return True if it was passed on to emit()."""
+        if monotonic_ns is None:
+            monotonic_ns = self.clock.monotonic_ns()
+        with self._lock:
+            self.raw_count[source][edge] += 1
+            if edge == ENTRY:
+                accept = self._entry(source, monotonic_ns)
+            else:
+                accept = self._exit(source, monotonic_ns)
+            if accept:
+                self.emit(source, edge, monotonic_ns)
+            else:
+                self.suppressed_count[source][edge] += 1
+        return accept
+
+    def _entry(self, source, monotonic_ns):
+        if self._held_exit_ns[source] is not None:
+            # back in before min_pulse: the held exit was chatter
+            self._held_exit_ns[source] = None
+            return False
+        if self.active[source]:
+            return False
+        exit_ns = self._exit_ns[source]
+        if exit_ns is not None and monotonic_ns - exit_ns < self.refractory_ns[source]:
+            return False
+        self.active[source] = True
+        self._entry_ns[source] = monotonic_ns
+        return True
+
+    def _exit(self, source, monotonic_ns):
+        if not self.active[source]:
+            return False
+        release_ns = self._entry_ns[source] + self.min_pulse_ns[source]
+        if monotonic_ns < release_ns:
+            self._held_exit_ns[source] = monotonic_ns
+            timer = self._release_timer[source]
+            if timer is None or not timer.is_alive():
+                delay = (release_ns - self.clock.monotonic_ns()) / 1e9
+                self._release_timer[source] = self.clock.call_later(max(delay, 0), self._release, source)
+            return False
+        self._held_exit_ns[source] = None
+        self.active[source] = False
+        self._exit_ns[source] = monotonic_ns
+        return True
+
+    def _release(self, source):
+        with self._lock:
+            self._release_timer[source] = None
+            exit_ns = self._held_exit_ns[source]
+            if exit_ns is None:
+                return
+            delay = (self._entry_ns[source] + self.min_pulse_ns[source] - self.clock.monotonic_ns()) / 1e9
+            if delay > 0:
+                # a late timer from an earlier pulse
+                self._release_timer[source] = self.clock.call_later(delay, self._release, source)
+                return
+            # the input stayed out: report the held exit after all
+            self._held_exit_ns[source] = None
+            self.active[source] = False
+            self._exit_ns[source] = exit_ns
+            self.suppressed_count[source][EXIT] -= 1
+            self.emit(source, EXIT, exit_ns)
+
+    def summary(self):
+        """[(source name, raw edges, suppressed edges)] for the inputs that saw any edge."""
+        return [(SOURCE_NAMES[source], sum(self.raw_count[source]), sum(self.suppressed_count[source]))
+                for source in range(len(SOURCE_NAMES)) if sum(self.raw_count[source])]
@@ -0,0 +1,178 @@
+# python3: EventLogger.py
+"""
+name: EventLogger.py
+goal: keep string formatting and file/console I/O off the GPIO callback and task threads
+description:
+    log() only appends a small tuple to a deque (append/popleft are atomic, no lock is taken) and
+    returns. a background writer thread drains the queue every flush_interval seconds, packs the
+    entries into fixed-width binary records and appends them to <basename>.bin in one write.
+    tag and event strings are stored as ids; the id -> string table is kept in <basename>.names.
+    export_text() turns the binary log back into the usual ';time;[tag];event;flag' lines.
+
+"""
+import io
+import json
+import math
+import os
+import struct
+from collections import deque
+from threading import Thread, Event, Lock
+
+import BoxClock
+
+# wall_ns, monotonic_ns, tag id, event id, flag (-1: none, 0: False, 1: True), value (nan: none)
+RECORD = struct.Struct("<qqHHbd3x")
+FLAG_NONE = -1
+
+
+class EventLogger(object):
+    def __init__(self, basename, flush_interval=0.5):
+        self.basename = basename
+        self.binary_filename = basename + ".bin"
+        self.names_filename = basename + ".names"
+        self.flush_interval = flush_interval
+
+        self._queue = deque()
+        self._names = [""]  # id 0 is the empty string
+        self._name_id = {"": 0}
+        self._names_lock = Lock()
+        self._names_dirty = True
+
+        self._file = None
+        self._writer_thread = None
+        self._stopping = Event()
+        self._closed = False
+        self.clock = BoxClock.get_clock()
+
+        self.record_count = 0
+        self.batch_count = 0
+
+    def start(self):
+        self._file = io.open(self.binary_filename, "ab")
+        self._stopping.clear()
+        self._writer_thread = Thread(target=self._write_loop, daemon=True)
+        self._writer_thread.start()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._stopping.set()
+        if self._writer_thread is not None:
+            self._writer_thread.join(5)
+            self._writer_thread = None
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    ###############################################################################################
+    # producer side - safe to call from any thread
+    ###############################################################################################
+    def _intern(self, name):
+        name_id = self._name_id.get(name)
+        if name_id is None:
+            with self._names_lock:
+                name_id = self._name_id.get(name)
+                if name_id is None:
+                    name_id = len(self._names)
+                    self._names.append(name)
+                    self._name_id[name] = name_id
+                    self._names_dirty = True
+        return name_id
+
+    def log(self, tag, event, flag=None, value=None):
+        """Queue one ';time;[tag];event;flag' entry. value (a number) is logged after the event."""
+        if self._closed:
+            return
+        self._queue.append(
+            (self.clock.time_ns(), self.clock.monotonic_ns(), self._intern(tag), self._intern(event),
+             FLAG_NONE if flag is None else int(bool(flag)),
+             math.nan if value is None else value)
+        )
+
+    ###############################################################################################
+    # writer side - background thread
+    ###############################################################################################
+    def _write_loop(self):
+        while not self._stopping.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        queue = self._queue
+        count = len(queue)
+        if count and self._file is not None:
+            batch = bytearray(count * RECORD.size)
+            offset = 0
+            for _ in range(count):
+                RECORD.pack_into(batch, offset, *queue.popleft())
+                offset += RECORD.size
+            # the names table is written first so every id in the binary file can be resolved
+            self._write_names()
+            self._file.write(batch)
+            self._file.flush()
+            self.record_count += count
+            self.batch_count += 1
+        else:
+            self._write_names()
+
+    def _write_names(self):
+        if not self._names_dirty:
+            return
+        with self._names_lock:
+            names = list(self._names)
+            self._names_dirty = False
+        temp_filename = self.names_filename + ".tmp"
+        with io.open(temp_filename, "w") as f:
+            json.dump(names, f)
+        os.replace(temp_filename, self.names_filename)
+
+    ###############################################################################################
+    # reading / export
+    ###############################################################################################
+    def read(self):
+        return read_records(self.binary_filename, self.names_filename)
+
+    def export_text(self, filename=None):
+        if filename is None:
+            filename = self.basename + ".log"
+        return export_text(self.binary_filename, self.names_filename, filename)
+
+
+def read_records(binary_filename, names_filename):
+    """Yield (time, monotonic_ns, tag, event, flag, value) from a binary event log.
+
+    flag is None/True/False and value None when not logged. a trailing partial record (e.g. after
+    a power loss) is ignored.
+    """
+    with io.open(names_filename, "r") as f:
+        names = json.load(f)
+    with io.open(binary_filename, "rb") as f:
+        data = f.read()
+    usable = len(data) - len(data) % RECORD.size
+    for wall_ns, monotonic_ns, tag_id, event_id, flag, value in RECORD.iter_unpack(data[:usable]):
+        yield (wall_ns / 1e9, monotonic_ns, names[tag_id], names[event_id],
+               None if flag == FLAG_NONE else bool(flag),
+               None if math.isnan(value) else value)
+
+
+def format_record(wall_time, tag, event, flag=None, value=None):
+    line = ";" + str(wall_time) + ";[" + tag + "];"
+    fields = []
+    if event:
+        fields.append(event)
+    if value is not None:
+        fields.append(str(value))
+    if flag is not None:
+        fields.append(str(flag))
+    return line + ";".join(fields)
+
+
+def export_text(binary_filename, names_filename, filename):
+    """Write the binary event log as the text ';time;[tag];event;flag' lines; return the line count."""
+    count = 0
+    with io.open(filename, "w") as f:
+        for wall_time, _, tag, event, flag, value in read_records(binary_filename, names_filename):
+            f.write(format_record(wall_time, tag, event, flag, value) + "\n")
+            count += 1
+    return count
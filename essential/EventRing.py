@@ -0,0 +1,246 @@
+# python3: EventRing.py
+"""
+name: EventRing.py
+goal: fixed-capacity, timestamped event buffer shared by the BehavBox callbacks and the task
+description:
+    the gpiozero callbacks write (monotonic_ns, wall_ns, source, edge, seq) straight into a
+    preallocated numpy structured array, so an input edge costs no python object allocation
+    and the task sees exactly when the edge happened. memory is bounded by the capacity; when
+    the task falls behind, the oldest unread events are overwritten and counted in overflow_count.
+
+"""
+import sys
+from threading import Condition
+
+import numpy as np
+
+import BoxClock
+
+# input sources, the index is the value stored in the 'source' field
+SOURCE_NAMES = (
+    "left",
+    "center",
+    "right",
+    "IR_1",
+    "IR_2",
+    "IR_3",
+    "IR_4",
+    "IR_5",
+    "treadmill",  # pushed by the treadmill sampler, see Treadmill.subscribe_distance()
+)
+SOURCE_ID = {name: index for index, name in enumerate(SOURCE_NAMES)}
+LEFT, CENTER, RIGHT, IR_1, IR_2, IR_3, IR_4, IR_5, TREADMILL = range(len(SOURCE_NAMES))
+
+# edge types, the index is the value stored in the 'edge' field
+EDGE_NAMES = (
+    "entry",
+    "exit",
+    "threshold",  # a distance threshold was crossed ("treadmill_threshold")
+)
+EDGE_ID = {name: index for index, name in enumerate(EDGE_NAMES)}
+ENTRY = EDGE_ID["entry"]
+EXIT = EDGE_ID["exit"]
+THRESHOLD = EDGE_ID["threshold"]
+
+# event names as used by the tasks ("left_entry", "IR_2_exit", ...), indexed [source][edge]
+# interned so they are the same objects as the string literals in the task code
+EVENT_NAMES = tuple(
+    tuple(sys.intern(source + "_" + edge) for edge in EDGE_NAMES) for source in SOURCE_NAMES
+)
+EVENT_ID = {
+    EVENT_NAMES[source][edge]: (source, edge)
+    for source in range(len(SOURCE_NAMES))
+    for edge in range(len(EDGE_NAMES))
+}
+
+EVENT_DTYPE = np.dtype(
+    [
+        ("monotonic_ns", np.int64),  # time.monotonic_ns() at the callback entry
+        ("wall_ns", np.int64),  # time.time_ns() at the callback entry
+        ("source", np.uint8),  # index into SOURCE_NAMES
+        ("edge", np.uint8),  # index into EDGE_NAMES
+        ("seq", np.uint64),  # running sequence number, gaps mean overwritten events
+        ("tag", np.int64),  # set by the producer, e.g. the DistanceSubscription id of a threshold event
+    ]
+)
+
+
+class EventRing(object):
+    def __init__(self, capacity=1024):
+        # round the capacity up to a power of two so the slot index is a bit mask
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.capacity = size
+        self._mask = size - 1
+        self._buffer = np.zeros(size, dtype=EVENT_DTYPE)
+        # column views, writing into them does not create a record object
+        self._monotonic_ns = self._buffer["monotonic_ns"]
+        self._wall_ns = self._buffer["wall_ns"]
+        self._source = self._buffer["source"]
+        self._edge = self._buffer["edge"]
+        self._seq = self._buffer["seq"]
+        self._tag = self._buffer["tag"]
+
+        self._head = 0  # total number of events written
+        self._tail = 0  # total number of events read
+        self._condition = Condition()
+        self._wake_pending = False  # set by notify() so a wake-up is not lost between two waits
+
+        self.overflow_count = 0  # events overwritten before the task read them
+        self.source_overflow = np.zeros(len(SOURCE_NAMES), dtype=np.int64)
+
+        self.latency = None  # optional LatencyMonitor, gets the enqueue and dequeue times
+        self.clock = BoxClock.get_clock()
+
+    ###############################################################################################
+    # writer side - called from the gpiozero callback threads
+    ###############################################################################################
+    def push(self, source, edge, monotonic_ns=None, wall_ns=None, tag=0):
+        if monotonic_ns is None:
+            monotonic_ns = self.clock.monotonic_ns()
+        if wall_ns is None:
+            wall_ns = self.clock.time_ns()
+        with self._condition:
+            head = self._head
+            if head - self._tail >= self.capacity:
+                # ring is full: drop the oldest unread event
+                self.overflow_count += 1
+                self.source_overflow[self._source[self._tail & self._mask]] += 1
+                self._tail += 1
+            slot = head & self._mask
+            self._monotonic_ns[slot] = monotonic_ns
+            self._wall_ns[slot] = wall_ns
+            self._source[slot] = source
+            self._edge[slot] = edge
+            self._seq[slot] = head
+            self._tag[slot] = tag
+            self._head = head + 1
+            self._condition.notify_all()
+        if self.latency is not None:
+            self.latency.enqueued(source, monotonic_ns)
+        return head
+
+    def push_name(self, event_name):
+        source, edge = EVENT_ID[event_name]
+        return self.push(source, edge)
+
+    ###############################################################################################
+    # reader side - called from the task
+    ###############################################################################################
+    def __len__(self):
+        return self._head - self._tail
+
+    def __bool__(self):
+        return self._head != self._tail
+
+    def pop(self):
+        """Return the oldest unread event as a numpy record, or None if the ring is empty."""
+        with self._condition:
+            if self._head == self._tail:
+                return None
+            record = self._buffer[self._tail & self._mask].copy()
+            self._tail += 1
+        if self.latency is not None:
+            self.latency.dequeued(record["source"], record["monotonic_ns"])
+        return record
+
+    def pop_into(self, out):
+        """Copy up to len(out) unread events into the EVENT_DTYPE array out; return the count."""
+        with self._condition:
+            count = min(self._head - self._tail, len(out))
+            for index in range(count):
+                out[index] = self._buffer[(self._tail + index) & self._mask]
+            self._tail += count
+        if self.latency is not None:
+            for index in range(count):
+                self.latency.dequeued(out[index]["source"], out[index]["monotonic_ns"])
+        return count
+
+    def peek(self):
+        """Return the oldest unread event without consuming it, or None."""
+        with self._condition:
+            if self._head == self._tail:
+                return None
+            return self._buffer[self._tail & self._mask].copy()
+
+    def wait(self, timeout=None):
+        """Block until an unread event is available, notify() is called or timeout (s) expires.
+
+        Returns True if an unread event is available.
+        """
+        if self.clock.is_virtual:
+            # nothing can happen until the next scheduled callback: advance the clock instead of blocking
+            self.clock.wait_for(self._ready, timeout)
+        with self._condition:
+            if self._head == self._tail and not self._wake_pending and not self.clock.is_virtual:
+                self._condition.wait(timeout)
+            self._wake_pending = False
+            return self._head != self._tail
+
+    def _ready(self):
+        return self._head != self._tail or self._wake_pending
+
+    def notify(self):
+        """Wake up a reader blocked in wait() without adding an event (treadmill sample, timeout...)."""
+        with self._condition:
+            self._wake_pending = True
+            self._condition.notify_all()
+
+    def clear(self):
+        """Discard all unread events (the overflow counters are kept)."""
+        with self._condition:
+            self._tail = self._head
+
+    def last(self, n=None):
+        """Return a copy of the last n written events (read or not), oldest first."""
+        with self._condition:
+            available = min(self._head, self.capacity)
+            if n is None or n > available:
+                n = available
+            index = np.arange(self._head - n, self._head) & self._mask
+            return self._buffer[index].copy()
+
+    @staticmethod
+    def event_name(record):
+        return EVENT_NAMES[record["source"]][record["edge"]]
+
+    @staticmethod
+    def event_time(record):
+        """Wall-clock time of the event in seconds, comparable with time.time()."""
+        return record["wall_ns"] / 1e9
+
+
+class EventNameQueue(object):
+    """Deque-like view of an EventRing for the tasks that still pop bare event names.
+
+    popleft() consumes the oldest event of the ring and returns its name ("left_entry", ...).
+    """
+
+    def __init__(self, ring):
+        self.ring = ring
+
+    def __len__(self):
+        return len(self.ring)
+
+    def __bool__(self):
+        return bool(self.ring)
+
+    def __repr__(self):
+        with self.ring._condition:
+            count = min(len(self.ring), self.ring.capacity)
+            index = np.arange(self.ring._tail, self.ring._tail + count) & self.ring._mask
+            records = self.ring._buffer[index]
+        return "EventNameQueue(" + str([EventRing.event_name(record) for record in records]) + ")"
+
+    def append(self, event_name):
+        self.ring.push_name(event_name)
+
+    def popleft(self):
+        record = self.ring.pop()
+        if record is None:
+            raise IndexError("pop from an empty EventNameQueue")
+        return EventRing.event_name(record)
+
+    def clear(self):
+        self.ring.clear()
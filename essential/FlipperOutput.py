@@ -1,9 +1,10 @@
 from gpiozero import DigitalOutputDevice
 from threading import Thread, Event
 import io
-import time
 import random
 
+import BoxClock
+
 
 class FlipperOutput(DigitalOutputDevice):
     def __init__(self, session_info, pin=None):
@@ -15,14 +16,22 @@ class FlipperOutput(DigitalOutputDevice):
             raise
         # Additional properties and methods
         self._flip_thread = None
+        self._flip_timer = None  # pending flip on a virtual clock
         self._running = False
 
         self._flipper_file = self.session_info['flipper_filename'] + '.csv'
         self._flipper_timestamp = []
+        self.clock = BoxClock.get_clock()
+        # session_info['flipper_seed'] makes the flip sequence reproducible (e.g. with a virtual clock)
+        self.random = random.Random(self.session_info.get('flipper_seed'))
 
     def flip(self, time_min=0.5, time_max=2, n=None, background=True):
         self._stop_flip()
         self._running = True
+        if self.clock.is_virtual:
+            # the flips are scheduled on the virtual clock instead of running in a thread
+            self._flip_virtual(True, time_min, time_max)
+            return
         self._flip_thread = Thread(
             target=self._flip_device, args=(time_min, time_max, n)
         )
@@ -34,10 +43,11 @@ class FlipperOutput(DigitalOutputDevice):
 
     def close(self):
         try:
-            self._flip_thread.stopping.set()
-            print("Attempts to close the flipper thread!")
-            self._flip_thread.join(5)
-            self._flip_thread = None
+            if self._flip_thread is not None:
+                self._flip_thread.stopping.set()
+                print("Attempts to close the flipper thread!")
+                self._flip_thread.join(5)
+                self._flip_thread = None
             self._stop_flip()
             self.off()
             self.flipper_flush()
@@ -48,6 +58,9 @@ class FlipperOutput(DigitalOutputDevice):
     def _stop_flip(self):
         print("Entered _stop_flip")
         self._running = False
+        if self._flip_timer is not None:
+            self._flip_timer.cancel()
+            self._flip_timer = None
         # if getattr(self, '_flip_thread', None):
         #     # print("enter _flip_thread.stop()")
         #     self._flip_thread.stop()
@@ -55,23 +68,31 @@ class FlipperOutput(DigitalOutputDevice):
 
     def _flip_device(self, time_min, time_max, n):
         while self._running == True:
-            on_time = round(random.uniform(time_min, time_max), 3)
-            off_time = round(random.uniform(time_min, time_max), 3)
+            on_time = round(self.random.uniform(time_min, time_max), 3)
+            off_time = round(self.random.uniform(time_min, time_max), 3)
 
             self._write(True)
             pin_state = self.is_active
-            timestamp = (pin_state, time.time())
+            timestamp = (pin_state, self.clock.time())
             self._flipper_timestamp.append(timestamp)
             if self._flip_thread.stopping.wait(on_time):
                 break
 
             self._write(False)
             pin_state = self.is_active
-            timestamp = (pin_state, time.time())
+            timestamp = (pin_state, self.clock.time())
             self._flipper_timestamp.append(timestamp)
             if self._flip_thread.stopping.wait(off_time):
                 break
 
+    def _flip_virtual(self, state, time_min, time_max):
+        if not self._running:
+            return
+        self._write(state)
+        self._flipper_timestamp.append((self.is_active, self.clock.time()))
+        duration = round(self.random.uniform(time_min, time_max), 3)
+        self._flip_timer = self.clock.call_later(duration, self._flip_virtual, not state, time_min, time_max)
+
     def flipper_flush(self):
         print("Flushing: " + self._flipper_file)
         with io.open(self._flipper_file, 'w') as f:
@@ -0,0 +1,142 @@
+# python3: I2CBus.py
+"""
+name: I2CBus.py
+goal: one owner for /dev/i2c-1, shared by the treadmill, the ADC and any other I2C device
+description:
+    every transfer of every device goes through I2CBus.transfer(), which holds the bus lock for
+    the transfer only. a transfer that fails with an IOError (e.g. the treadmill Arduino stretching
+    the clock or a loose cable) is retried up to `retries` times, with an exponential backoff
+    (backoff, 2 * backoff, ... at most max_backoff s) during which the bus is free for the other
+    devices; then the IOError is raised to the caller, which skips that sample. this replaces the
+    i2cdetect subprocess that used to be called on the treadmill sampling thread.
+    per device address: transfers, errors, retries, failures and the transfer latency (log-spaced
+    histogram with the bins of LatencyMonitor).
+
+    I2CBus has the smbus methods used by the box (read_i2c_block_data, write_i2c_block_data), so it
+    can be passed wherever an smbus.SMBus was; get_i2c_device() gives the Adafruit_GPIO.I2C device
+    interface used by ADS1x15 (box.ADC() is ADS1x15.ADS1015(i2c=box.i2c_bus)).
+
+"""
+import io
+import math
+from threading import Lock
+
+import numpy as np
+
+import BoxClock
+import LatencyMonitor
+
+
+class DeviceStats(object):
+    def __init__(self):
+        self.histogram = np.zeros(LatencyMonitor.N_BINS, dtype=np.int64)
+        self.count = 0  # successful transfers
+        self.errors = 0  # failed attempts, retried or not
+        self.retries = 0
+        self.failures = 0  # transfers given up after the last retry
+        self.max_ns = 0
+
+    def record(self, latency_ns):
+        self.histogram[int(np.searchsorted(LatencyMonitor.BIN_EDGES_NS, latency_ns))] += 1
+        self.count += 1
+        if latency_ns > self.max_ns:
+            self.max_ns = latency_ns
+
+    def percentile(self, q):
+        """Upper bound (ns) of the bin holding the q-th percentile, nan without transfers."""
+        if self.count == 0:
+            return math.nan
+        index = int(np.searchsorted(np.cumsum(self.histogram), q / 100.0 * self.count))
+        return min(LatencyMonitor.BIN_EDGES_NS[index], float(self.max_ns))
+
+
+class I2CBus(object):
+    def __init__(self, bus=None, bus_number=1, retries=3, backoff=0.002, max_backoff=0.05):
+        if bus is None:
+            import smbus
+            bus = smbus.SMBus(bus_number)  # "On all recent (since 2014) raspberries the GPIO pin's I2C device is /dev/i2c-1"
+        self.bus = bus  # anything with the smbus methods, e.g. SimulatedHardware.FakeTreadmillBus
+        self.retries = retries
+        self.backoff = backoff  # s
+        self.max_backoff = max_backoff  # s
+        self.stats = {}  # address -> DeviceStats
+        self._lock = Lock()
+        self.clock = BoxClock.get_clock()
+
+    def _device_stats(self, address):
+        stats = self.stats.get(address)
+        if stats is None:
+            stats = self.stats.setdefault(address, DeviceStats())
+        return stats
+
+    def transfer(self, address, function, *args):
+        """Run function(*args) (e.g. an smbus method) under the bus lock, retrying an IOError."""
+        stats = self._device_stats(address)
+        for attempt in range(self.retries + 1):
+            start_ns = self.clock.monotonic_ns()
+            try:
+                with self._lock:
+                    result = function(*args)
+            except IOError:
+                stats.errors += 1
+                if attempt == self.retries:
+                    stats.failures += 1
+                    raise
+                stats.retries += 1
+                # back off without the lock, the other devices keep the bus meanwhile
+                self.clock.sleep(min(self.backoff * 2 ** attempt, self.max_backoff))
+                continue
+            stats.record(self.clock.monotonic_ns() - start_ns)
+            return result
+
+    ###############################################################################################
+    # smbus interface
+    ###############################################################################################
+    def read_i2c_block_data(self, address, cmd, length=32):
+        return self.transfer(address, self.bus.read_i2c_block_data, address, cmd, length)
+
+    def write_i2c_block_data(self, address, cmd, data):
+        return self.transfer(address, self.bus.write_i2c_block_data, address, cmd, data)
+
+    def get_i2c_device(self, address, **kwargs):
+        """Adafruit_GPIO.I2C style device on this bus (the i2c argument of ADS1x15)."""
+        return I2CDevice(self, address)
+
+    def close(self):
+        close = getattr(self.bus, "close", None)
+        if close is not None:
+            close()
+
+    ###############################################################################################
+    # statistics
+    ###############################################################################################
+    def summary(self):
+        """List of (address, count, errors, retries, failures, p50_ms, p99_ms, max_ms) per device."""
+        return [(address, stats.count, stats.errors, stats.retries, stats.failures,
+                 stats.percentile(50) / 1e6, stats.percentile(99) / 1e6, stats.max_ns / 1e6)
+                for address, stats in sorted(self.stats.items())]
+
+    def dump(self, filename):
+        """Write the per device summary as csv and print it."""
+        rows = self.summary()
+        with io.open(filename, 'w') as f:
+            f.write('address, count, errors, retries, failures, p50_ms, p99_ms, max_ms\n')
+            for row in rows:
+                f.write('0x%02x, %d, %d, %d, %d, %f, %f, %f\n' % row)
+        print("I2C transfers:")
+        for row in rows:
+            print("    0x%02x n=%-7d errors=%-4d retries=%-4d failures=%-4d p50=%7.3f p99=%7.3f max=%7.3f ms" % row)
+
+
+class I2CDevice(object):
+    """The part of the Adafruit_GPIO.I2C.Device interface used by ADS1x15, through an I2CBus."""
+
+    def __init__(self, bus, address):
+        self._bus = bus
+        self._address = address
+
+    def writeList(self, register, data):
+        self._bus.write_i2c_block_data(self._address, register, list(data))
+
+    def readList(self, register, length):
+        return bytearray(self._bus.read_i2c_block_data(self._address, register, length))
@@ -0,0 +1,129 @@
+# python3: LatencyMonitor.py
+"""
+name: LatencyMonitor.py
+goal: measure how long it takes from an input edge until the task acts on it
+description:
+    every latency is measured from the gpiozero callback entry of the edge (the monotonic_ns stored
+    in the event ring) to a later stage:
+        enqueue: the event is written into box.event_ring
+        dequeue: the task loop pops the event from the ring
+        transition: the event triggers a state transition of the task
+        output: the resulting output pin write (e.g. pump.reward) has been issued
+    latencies are accumulated per input source and stage in fixed log-spaced histograms (20 bins per
+    decade from 1 us to 10 s), so memory and update cost stay constant for the whole session.
+
+"""
+import io
+import math
+from threading import Lock
+
+import numpy as np
+
+import BoxClock
+from EventRing import SOURCE_NAMES
+
+STAGE_NAMES = (
+    "enqueue",
+    "dequeue",
+    "transition",
+    "output",
+)
+ENQUEUE, DEQUEUE, TRANSITION, OUTPUT = range(len(STAGE_NAMES))
+
+BINS_PER_DECADE = 20
+MIN_EXPONENT = 3  # 1 us in ns
+MAX_EXPONENT = 10  # 10 s in ns
+N_BINS = (MAX_EXPONENT - MIN_EXPONENT) * BINS_PER_DECADE + 2  # + underflow and overflow bins
+# upper edge of each bin in ns, the underflow bin ends at 1 us and the overflow bin is unbounded
+BIN_EDGES_NS = np.concatenate((
+    10.0 ** (MIN_EXPONENT + np.arange(N_BINS - 1) / BINS_PER_DECADE),
+    [np.inf],
+))
+
+
+class LatencyMonitor(object):
+    def __init__(self):
+        shape = (len(SOURCE_NAMES), len(STAGE_NAMES))
+        self.histogram = np.zeros(shape + (N_BINS,), dtype=np.int64)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.max_ns = np.zeros(shape, dtype=np.int64)
+        self.last_ns = np.zeros(shape, dtype=np.int64)
+        self._lock = Lock()
+        self.clock = BoxClock.get_clock()
+
+    def record(self, source, stage, edge_ns, now_ns=None):
+        """Add the latency between the edge (monotonic ns) and now to the source/stage histogram."""
+        if now_ns is None:
+            now_ns = self.clock.monotonic_ns()
+        latency = now_ns - edge_ns
+        if latency < 10 ** MIN_EXPONENT:
+            index = 0
+        else:
+            index = min(int((math.log10(latency) - MIN_EXPONENT) * BINS_PER_DECADE) + 1, N_BINS - 1)
+        with self._lock:
+            self.histogram[source, stage, index] += 1
+            self.count[source, stage] += 1
+            self.last_ns[source, stage] = latency
+            if latency > self.max_ns[source, stage]:
+                self.max_ns[source, stage] = latency
+        return latency
+
+    def enqueued(self, source, edge_ns):
+        return self.record(source, ENQUEUE, edge_ns)
+
+    def dequeued(self, source, edge_ns):
+        return self.record(source, DEQUEUE, edge_ns)
+
+    def percentile(self, source, stage, q):
+        """Upper bound (ns) of the histogram bin holding the q-th percentile, nan without samples."""
+        counts = self.histogram[source, stage]
+        total = counts.sum()
+        if total == 0:
+            return math.nan
+        index = int(np.searchsorted(np.cumsum(counts), q / 100.0 * total))
+        # the overflow bin has no upper edge, report the observed maximum instead
+        return min(BIN_EDGES_NS[index], float(self.max_ns[source, stage]))
+
+    def summary(self):
+        """List of (source, stage, count, p50_ms, p99_ms, max_ms) for every source/stage with samples."""
+        rows = []
+        for source in range(len(SOURCE_NAMES)):
+            for stage in range(len(STAGE_NAMES)):
+                if self.count[source, stage] == 0:
+                    continue
+                rows.append((
+                    SOURCE_NAMES[source],
+                    STAGE_NAMES[stage],
+                    int(self.count[source, stage]),
+                    self.percentile(source, stage, 50) / 1e6,
+                    self.percentile(source, stage, 99) / 1e6,
+                    self.max_ns[source, stage] / 1e6,
+                ))
+        return rows
+
+    def summary_text(self, stage=DEQUEUE):
+        """One-line live counter for the sources that saw the given stage."""
+        fields = []
+        for source in range(len(SOURCE_NAMES)):
+            if self.count[source, stage] == 0:
+                continue
+            fields.append("%s %.1f/%.1f/%.1f" % (
+                SOURCE_NAMES[source],
+                self.percentile(source, stage, 50) / 1e6,
+                self.percentile(source, stage, 99) / 1e6,
+                self.max_ns[source, stage] / 1e6,
+            ))
+        if not fields:
+            return STAGE_NAMES[stage] + " latency: no events yet"
+        return STAGE_NAMES[stage] + " p50/p99/max ms: " + ", ".join(fields)
+
+    def dump(self, filename):
+        """Write the per source/stage latency summary as csv and print it."""
+        rows = self.summary()
+        with io.open(filename, 'w') as f:
+            f.write('source, stage, count, p50_ms, p99_ms, max_ms\n')
+            for row in rows:
+                f.write('%s, %s, %d, %f, %f, %f\n' % row)
+        print("Latency since the input edge (ms):")
+        for row in rows:
+            print("    %-8s %-10s n=%-6d p50=%8.3f p99=%8.3f max=%8.3f" % row)
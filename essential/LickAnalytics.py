@@ -0,0 +1,275 @@
+# python3: LickAnalytics.py
+"""
+name: LickAnalytics.py
+goal: online lick statistics for the task logic and the live plot, without re-scanning the session
+description:
+    fed with every debounced lick (entry edge of the left, center and right lick inputs) by
+    BehavBox.accept_edge(), and with the task state and trial boundaries by the task. keeps:
+        - the last `capacity` lick times per spout (ring buffer, for plots and recent rates)
+        - inter-lick-interval histograms per spout (log spaced, 10 bins per decade, 10 ms - 100 s)
+        - lick bouts per spout: a bout ends when no lick came for bout_gap s
+        - licks and dwell time per task state -> lick rate per state
+        - per trial: licks per spout in the trial and the latency of the first lick after the
+          trial's reference time (e.g. entering reward_available)
+    every update is O(1) on fixed-size numpy buffers; queries read the buffers directly.
+    the licks of the current state (lick_threshold) are counted by the task itself with
+    state_lick(), when it handles the lick event: set_state() and state_lick() both run on the task
+    thread, so a lick is always counted in the state that handles it.
+    plot_text() is the lick line of the LivePlot (licks and median ILI per spout, bouts, rate).
+
+"""
+import math
+from threading import Lock
+
+import numpy as np
+
+import BoxClock
+from EventRing import LEFT, CENTER, RIGHT, SOURCE_NAMES
+
+LICK_SOURCES = (LEFT, CENTER, RIGHT)
+N_SPOUTS = len(LICK_SOURCES)
+
+ILI_BINS_PER_DECADE = 10
+ILI_MIN_EXPONENT = -2  # 10 ms
+ILI_MAX_EXPONENT = 2  # 100 s
+ILI_N_BINS = (ILI_MAX_EXPONENT - ILI_MIN_EXPONENT) * ILI_BINS_PER_DECADE + 2  # + underflow and overflow bins
+# upper edge of each bin in s, the last (overflow) bin is unbounded
+ILI_BIN_EDGES = np.concatenate((
+    10.0 ** (ILI_MIN_EXPONENT + np.arange(ILI_N_BINS - 1) / ILI_BINS_PER_DECADE),
+    [np.inf],
+))
+
+BOUT_DTYPE = np.dtype([
+    ("start_ns", np.int64),
+    ("end_ns", np.int64),
+    ("licks", np.int32),
+    ("source", np.uint8),
+])
+
+MAX_STATES = 32
+NO_LATENCY = -1
+
+
+def ili_bin(interval_s):
+    """Histogram bin of one inter-lick interval, O(1)."""
+    if interval_s <= 0:
+        return 0
+    index = int(math.floor((math.log10(interval_s) - ILI_MIN_EXPONENT) * ILI_BINS_PER_DECADE)) + 1
+    return min(max(index, 0), ILI_N_BINS - 1)
+
+
+class LickAnalytics(object):
+    def __init__(self, capacity=4096, bout_gap=0.5, max_trials=4096, max_bouts=4096):
+        self.clock = BoxClock.get_clock()
+        self.capacity = capacity
+        self.bout_gap_ns = int(bout_gap * 1e9)
+        self.max_trials = max_trials
+        self.max_bouts = max_bouts
+        self._lock = Lock()
+
+        # recent licks per spout
+        self.lick_ns = np.zeros((N_SPOUTS, capacity), dtype=np.int64)
+        self.lick_count = np.zeros(N_SPOUTS, dtype=np.int64)  # total licks, also the ring write index
+        self.ili_counts = np.zeros((N_SPOUTS, ILI_N_BINS), dtype=np.int64)
+
+        # bouts
+        self.bouts = np.zeros(max_bouts, dtype=BOUT_DTYPE)  # closed bouts, ring buffer
+        self.bout_count = 0
+        self._bout_start_ns = np.zeros(N_SPOUTS, dtype=np.int64)
+        self._bout_licks = np.zeros(N_SPOUTS, dtype=np.int32)  # licks in the open bout, 0: no bout
+
+        # task states
+        self.state_names = []
+        self._state_id = {}
+        self.state_licks = np.zeros((MAX_STATES, N_SPOUTS), dtype=np.int64)
+        self.state_dwell_ns = np.zeros(MAX_STATES, dtype=np.int64)
+        self._state = None
+        self._state_entered_ns = 0
+        self.current_state_licks = np.zeros(N_SPOUTS, dtype=np.int64)  # state_lick() since the last set_state()
+
+        # trials
+        self.trial = -1  # current trial, row trial % max_trials of the trial buffers
+        self.trial_licks = np.zeros((max_trials, N_SPOUTS), dtype=np.int32)
+        self.trial_latency_ns = np.full(max_trials, NO_LATENCY, dtype=np.int64)
+        self.trial_first_source = np.full(max_trials, -1, dtype=np.int8)
+        self._reference_ns = None
+
+    ###############################################################################################
+    # updates
+    ###############################################################################################
+    def lick(self, source, monotonic_ns=None):
+        """Add one lick of a lick source (EventRing.LEFT/CENTER/RIGHT)."""
+        if source not in LICK_SOURCES:
+            return
+        if monotonic_ns is None:
+            monotonic_ns = self.clock.monotonic_ns()
+        spout = LICK_SOURCES.index(source)
+        with self._lock:
+            count = self.lick_count[spout]
+            if count:
+                interval_ns = monotonic_ns - self.lick_ns[spout, (count - 1) % self.capacity]
+                self.ili_counts[spout, ili_bin(interval_ns / 1e9)] += 1
+                if interval_ns > self.bout_gap_ns:
+                    self._close_bout(spout)
+            self.lick_ns[spout, count % self.capacity] = monotonic_ns
+            self.lick_count[spout] = count + 1
+
+            if self._bout_licks[spout] == 0:
+                self._bout_start_ns[spout] = monotonic_ns
+            self._bout_licks[spout] += 1
+
+            if self._state is not None:
+                self.state_licks[self._state, spout] += 1
+            if self.trial >= 0:
+                row = self.trial % self.max_trials
+                self.trial_licks[row, spout] += 1
+                if (self._reference_ns is not None and monotonic_ns >= self._reference_ns
+                        and self.trial_latency_ns[row] == NO_LATENCY):
+                    self.trial_latency_ns[row] = monotonic_ns - self._reference_ns
+                    self.trial_first_source[row] = source
+
+    def _close_bout(self, spout):
+        if self._bout_licks[spout] == 0:
+            return
+        bout = self.bouts[self.bout_count % self.max_bouts]
+        bout["start_ns"] = self._bout_start_ns[spout]
+        bout["end_ns"] = self.lick_ns[spout, (self.lick_count[spout] - 1) % self.capacity]
+        bout["licks"] = self._bout_licks[spout]
+        bout["source"] = LICK_SOURCES[spout]
+        self.bout_count += 1
+        self._bout_licks[spout] = 0
+
+    def set_state(self, name, monotonic_ns=None):
+        """The task entered state name."""
+        if monotonic_ns is None:
+            monotonic_ns = self.clock.monotonic_ns()
+        with self._lock:
+            if self._state is not None:
+                self.state_dwell_ns[self._state] += monotonic_ns - self._state_entered_ns
+            state = self._state_id.get(name)
+            if state is None and len(self.state_names) < MAX_STATES:
+                state = len(self.state_names)
+                self.state_names.append(name)
+                self._state_id[name] = state
+            self._state = state
+            self._state_entered_ns = monotonic_ns
+            self.current_state_licks[:] = 0
+
+    def state_lick(self, source):
+        """Count a lick event handled by the task in its current state; return the count of source."""
+        if source not in LICK_SOURCES:
+            return 0
+        spout = LICK_SOURCES.index(source)
+        self.current_state_licks[spout] += 1
+        return int(self.current_state_licks[spout])
+
+    def start_trial(self):
+        """Start a new trial row; the lick latency is measured from the next set_reference()."""
+        with self._lock:
+            self.trial += 1
+            row = self.trial % self.max_trials
+            self.trial_licks[row] = 0
+            self.trial_latency_ns[row] = NO_LATENCY
+            self.trial_first_source[row] = -1
+            self._reference_ns = None
+
+    def set_reference(self, monotonic_ns=None):
+        """Measure this trial's lick latency from now (e.g. when the reward becomes available)."""
+        if monotonic_ns is None:
+            monotonic_ns = self.clock.monotonic_ns()
+        self._reference_ns = monotonic_ns
+
+    ###############################################################################################
+    # queries
+    ###############################################################################################
+    def licks(self, source):
+        """Lick times (monotonic ns) of a source still in the buffer, oldest first."""
+        spout = LICK_SOURCES.index(source)
+        count = int(self.lick_count[spout])
+        if count <= self.capacity:
+            return self.lick_ns[spout, :count].copy()
+        start = count % self.capacity
+        return np.concatenate((self.lick_ns[spout, start:], self.lick_ns[spout, :start]))
+
+    def recent_licks(self, source, seconds, now_ns=None):
+        """Number of licks of a source in the last seconds (walks back from the newest lick)."""
+        if now_ns is None:
+            now_ns = self.clock.monotonic_ns()
+        spout = LICK_SOURCES.index(source)
+        since_ns = now_ns - int(seconds * 1e9)
+        count = int(self.lick_count[spout])
+        n = 0
+        while n < min(count, self.capacity) and self.lick_ns[spout, (count - 1 - n) % self.capacity] >= since_ns:
+            n += 1
+        return n
+
+    def state_lick_count(self, source):
+        """Lick events of a source handled by the task since it entered its current state."""
+        return int(self.current_state_licks[LICK_SOURCES.index(source)])
+
+    def ili_histogram(self, source=None):
+        """(counts, upper bin edges in s) of the inter-lick intervals of one source or all sources."""
+        if source is None:
+            return self.ili_counts.sum(axis=0), ILI_BIN_EDGES
+        return self.ili_counts[LICK_SOURCES.index(source)].copy(), ILI_BIN_EDGES
+
+    def recent_bouts(self):
+        """The closed bouts still in the buffer, oldest first."""
+        count = self.bout_count
+        if count <= self.max_bouts:
+            return self.bouts[:count].copy()
+        start = count % self.max_bouts
+        return np.concatenate((self.bouts[start:], self.bouts[:start]))
+
+    def open_bout_licks(self, source):
+        return int(self._bout_licks[LICK_SOURCES.index(source)])
+
+    def state_rates(self, now_ns=None):
+        """{state: licks/s over all spouts} for every state seen so far."""
+        if now_ns is None:
+            now_ns = self.clock.monotonic_ns()
+        dwell_ns = self.state_dwell_ns[:len(self.state_names)].copy()
+        if self._state is not None:
+            dwell_ns[self._state] += now_ns - self._state_entered_ns
+        licks = self.state_licks[:len(self.state_names)].sum(axis=1)
+        return {name: (licks[i] / (dwell_ns[i] / 1e9) if dwell_ns[i] > 0 else 0.0)
+                for i, name in enumerate(self.state_names)}
+
+    def trial_latencies(self):
+        """First-lick latency (s) of the trials in the buffer, oldest first; nan without a lick."""
+        n = self.trial + 1
+        rows = np.arange(max(n - self.max_trials, 0), n) % self.max_trials
+        latency = self.trial_latency_ns[rows]
+        return np.where(latency == NO_LATENCY, np.nan, latency / 1e9)
+
+    def median_ili(self, source):
+        """Upper edge (s) of the histogram bin holding the median inter-lick interval, nan without one."""
+        counts = self.ili_counts[LICK_SOURCES.index(source)]
+        total = counts.sum()
+        if total == 0:
+            return math.nan
+        return float(ILI_BIN_EDGES[int(np.searchsorted(np.cumsum(counts), total / 2.0))])
+
+    def plot_text(self, now_ns=None):
+        """Licks and median ILI per spout, bouts and the lick rate of the current state, on one line."""
+        parts = []
+        for spout, source in enumerate(LICK_SOURCES):
+            if self.lick_count[spout]:
+                parts.append("%s %d ILI %.2f s" % (SOURCE_NAMES[source], self.lick_count[spout],
+                                                     self.median_ili(source)))
+        parts.append("bouts %d" % self.bout_count)
+        if self._state is not None:
+            name = self.state_names[self._state]
+            parts.append("%s %.1f licks/s" % (name, self.state_rates(now_ns)[name]))
+        return "licks: " + ", ".join(parts)
+
+    def summary_text(self):
+        parts = []
+        for spout, source in enumerate(LICK_SOURCES):
+            if self.lick_count[spout]:
+                parts.append("%s %d" % (SOURCE_NAMES[source], self.lick_count[spout]))
+        latencies = self.trial_latencies()
+        if latencies.size and not np.all(np.isnan(latencies)):
+            parts.append("latency median %.3f s" % np.nanmedian(latencies))
+        parts.append("bouts %d" % self.bout_count)
+        return "licks: " + ", ".join(parts)
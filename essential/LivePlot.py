@@ -0,0 +1,246 @@
+# python3: LivePlot.py
+"""
+name: LivePlot.py
+goal: session plot in the pygame window whose per-trial cost and memory do not grow with the session
+description:
+    the figure and its axes are created once:
+        top: cumulative number of choice licks on the left and right spouts over the session time
+        bottom: number of trials per outcome (correct_trial and the error types)
+    the lines and bars are animated artists: every update() only changes their data in place,
+    restores the saved background and redraws them (FigureCanvasPygame blitting). the background
+    (axes, ticks, labels) is only redrawn when an axis limit has to grow, and the limits grow by
+    doubling, so that happens O(log n) times per session.
+    when the box runs a StatusDisplay, update() only publishes the data to the renderer process,
+    which keeps its own LivePlot; the task process then only draws the figure for save().
+    with a treadmill trace, a third panel shows the min/max decimated running speed of the last
+    trace.window s (a fixed number of points, see TreadmillTrace). update_treadmill() refreshes it
+    at most treadmill_fps times per s and can be called on every treadmill sample.
+    with a LickAnalytics, a text line above the top panel shows its plot_text() (licks and median
+    inter-lick interval per spout, bouts, lick rate of the current state), read at every update().
+    the lick trajectories are kept in fixed-size numpy buffers: when a buffer is full every other
+    point is dropped, so each line has at most max_points points however long the session is.
+
+"""
+import numpy as np
+
+import StartupProfile
+
+plt = StartupProfile.lazy_pyplot()
+
+OUTCOMES = (
+    "correct_trial",
+    "early_lick_error",
+    "initiate_error",
+    "cue_state_error",
+    "no_choice_error",
+    "wrong_choice_error",
+)
+SIDES = ("left", "right")
+SIDE_COLORS = ("b", "r")
+
+
+class Trajectory(object):
+    """Cumulative count over time, decimated to at most max_points points (+ the newest one)."""
+
+    def __init__(self, max_points):
+        self.max_points = max_points - max_points % 2
+        self.time = np.zeros(self.max_points)
+        self.count = np.zeros(self.max_points)
+        self.size = 0
+        self.total = 0
+        self.last_time = 0.0
+        self._stride = 1  # every stride-th point is kept
+
+    def add(self, time):
+        self.total += 1
+        self.last_time = time
+        if (self.total - 1) % self._stride:
+            return
+        if self.size == self.max_points:
+            half = self.max_points // 2
+            self.time[:half] = self.time[0::2]
+            self.count[:half] = self.count[0::2]
+            self.size = half
+            self._stride *= 2
+        self.time[self.size] = time
+        self.count[self.size] = self.total
+        self.size += 1
+
+    def data(self):
+        """(time, count) arrays of the kept points and the newest point."""
+        if self.size == 0 or self.count[self.size - 1] == self.total:
+            return self.time[:self.size], self.count[:self.size]
+        return (np.append(self.time[:self.size], self.last_time),
+                np.append(self.count[:self.size], self.total))
+
+
+class LivePlot(object):
+    def __init__(self, box, max_points=200, outcomes=OUTCOMES, treadmill_trace=None, treadmill_fps=2.0,
+                 lick_analytics=None):
+        self.box = box
+        self.lick_analytics = lick_analytics
+        self.lick_text = ""
+        self.max_points = max_points
+        self.outcomes = list(outcomes)
+        self.outcome_counts = np.zeros(len(self.outcomes), dtype=np.int64)
+        self.trajectories = [Trajectory(max_points) for _ in SIDES]
+        self.start_time = None
+        self._outcomes_seen = 0
+
+        # running speed panel
+        self.treadmill_trace = treadmill_trace
+        self.treadmill_interval = 1.0 / treadmill_fps
+        self._treadmill_shown = None  # clock time of the last treadmill refresh
+        if treadmill_trace is not None:
+            self.speed_time, self.speed = treadmill_trace.decimated()
+
+        self.figure = None
+        self.lines = []
+        self.bars = []
+        self.speed_line = None
+        self.lick_label = None
+        self._time_limit = 60.0  # s, doubled when reached
+        self._count_limit = 10
+        self._outcome_limit = 10
+        self._speed_limit = 10.0  # cm/s
+        self._speed_negative = False  # running backwards shown
+
+    def _create(self):
+        if self.treadmill_trace is None:
+            self.figure, (self.choice_axes, self.outcome_axes) = plt.subplots(2, 1)
+        else:
+            self.figure, (self.choice_axes, self.outcome_axes, self.speed_axes) = plt.subplots(
+                3, 1, figsize=(8, 5.7), gridspec_kw={"hspace": 0.9})
+            self.speed_axes.set_xlim(-self.treadmill_trace.window, 0)
+            self.speed_axes.set_ylim(0, self._speed_limit)
+            self.speed_axes.set_xlabel("time before now (s)")
+            self.speed_axes.set_ylabel("cm/s")
+            self.speed_line = self.speed_axes.plot([], [], color="g", label="running_speed", animated=True)[0]
+        self.choice_axes.set_xlim(0, self._time_limit)
+        self.choice_axes.set_ylim(0, self._count_limit)
+        self.choice_axes.set_xlabel("time (s)")
+        self.lines = [
+            self.choice_axes.plot([], [], color=color, marker="o", label=side + "_lick_trajectory",
+                                  animated=True)[0]
+            for side, color in zip(SIDES, SIDE_COLORS)
+        ]
+        self.lick_label = self.choice_axes.text(0.0, 1.03, "", transform=self.choice_axes.transAxes,
+                                                fontsize=8, va="bottom", animated=True)
+        self._create_bars()
+        self.figure.canvas.blit()  # from now on draw() only redraws the animated artists
+
+    def _create_bars(self):
+        for bar in self.bars:
+            bar.remove()
+        ticks = range(len(self.outcomes))
+        self.bars = list(self.outcome_axes.bar(ticks, self.outcome_counts, align='center', animated=True))
+        self.outcome_axes.set_xticks(ticks)
+        self.outcome_axes.set_xticklabels(labels=self.outcomes, rotation=70)
+        self.outcome_axes.set_ylim(0, self._outcome_limit)
+
+    ###############################################################################################
+    # data - O(1) per call
+    ###############################################################################################
+    def add_choice(self, side, time):
+        """A choice lick on side ('left'/'right') at time (s)."""
+        if self.start_time is None:
+            self.start_time = time
+        self.trajectories[SIDES.index(side)].add(time - self.start_time)
+
+    def add_outcome(self, outcome):
+        if outcome not in self.outcomes:
+            self.outcomes.append(outcome)
+            self.outcome_counts = np.append(self.outcome_counts, 0)
+            if self.figure is not None:
+                self._create_bars()
+                self.figure.canvas.invalidate_background()
+        self.outcome_counts[self.outcomes.index(outcome)] += 1
+
+    def add_outcomes(self, outcome_list):
+        """Add the outcomes appended to outcome_list (e.g. task.error_list) since the last call."""
+        for outcome in outcome_list[self._outcomes_seen:]:
+            self.add_outcome(outcome)
+        self._outcomes_seen = len(outcome_list)
+
+    ###############################################################################################
+    # drawing
+    ###############################################################################################
+    def _grow_limits(self):
+        grown = False
+        last_time = max(t.last_time for t in self.trajectories)
+        while last_time >= self._time_limit:
+            self._time_limit *= 2
+            grown = True
+        while max(t.total for t in self.trajectories) >= self._count_limit:
+            self._count_limit *= 2
+            grown = True
+        while self.outcome_counts.max(initial=0) >= self._outcome_limit:
+            self._outcome_limit *= 2
+            grown = True
+        if self.speed_line is not None and not np.all(np.isnan(self.speed)):
+            while np.nanmax(np.abs(self.speed)) >= self._speed_limit:
+                self._speed_limit *= 2
+                grown = True
+            if not self._speed_negative and np.nanmin(self.speed) < 0:
+                self._speed_negative = True
+                grown = True
+        if grown:
+            self.choice_axes.set_xlim(0, self._time_limit)
+            self.choice_axes.set_ylim(0, self._count_limit)
+            self.outcome_axes.set_ylim(0, self._outcome_limit)
+            if self.speed_line is not None:
+                self.speed_axes.set_ylim(-self._speed_limit if self._speed_negative else 0, self._speed_limit)
+            self.figure.canvas.invalidate_background()
+
+    def _set_artists(self):
+        if self.figure is None:
+            self._create()
+        for line, trajectory in zip(self.lines, self.trajectories):
+            line.set_data(*trajectory.data())
+        for bar, count in zip(self.bars, self.outcome_counts):
+            bar.set_height(count)
+        if self.speed_line is not None:
+            self.speed_line.set_data(self.speed_time, self.speed)
+        self.lick_label.set_text(self.lick_text)
+        self._grow_limits()
+
+    def _read_treadmill(self):
+        if self.treadmill_trace is not None:
+            self.speed_time, self.speed = self.treadmill_trace.decimated()
+            self._treadmill_shown = self.treadmill_trace.clock.monotonic()
+
+    def _read_lick_analytics(self):
+        if self.lick_analytics is not None:
+            self.lick_text = self.lick_analytics.plot_text()
+
+    def update(self):
+        """Update the artists in place and show the figure in the box window."""
+        self._read_treadmill()
+        self._read_lick_analytics()
+        self.redraw()
+
+    def update_treadmill(self):
+        """Refresh the running speed panel, at most once per 1 / treadmill_fps s; True if it did."""
+        if self.treadmill_trace is None:
+            return False
+        if (self._treadmill_shown is not None
+                and self.treadmill_trace.clock.monotonic() - self._treadmill_shown < self.treadmill_interval):
+            return False
+        self.update()
+        return True
+
+    def redraw(self):
+        """Show the current data without reading new treadmill samples."""
+        status_display = getattr(self.box, "status_display", None)
+        if status_display is not None:
+            # the renderer process draws the figure, only hand it the data
+            status_display.publish(self, self.box.status_text())
+            return
+        self._set_artists()
+        self.box.check_plot(self.figure)
+
+    def save(self, filename):
+        self._read_treadmill()
+        self._read_lick_analytics()
+        self._set_artists()
+        self.figure.savefig(filename)
@@ -0,0 +1,246 @@
+# python3: PulseScheduler.py
+"""
+name: PulseScheduler.py
+goal: valve, sound and LED pulses with a width that does not depend on the system load
+description:
+    gpiozero's blink() starts a thread per call and times the pulse with sleeps, so a busy box
+    opens a valve for longer than asked. here one scheduler thread owns every timed output
+    (pump1..4, pump_air, pump_vacuum, sound1/2, cueLED1..4, ...): pulse() turns a pulse train into
+    absolute onset deadlines (monotonic ns) in a heap; the off deadline of a pulse is its actual
+    onset + width. the thread sleeps until `spin` s (1 ms) before the next deadline and polls the
+    clock for the rest, giving up the GIL between two polls so the task thread is not stalled, then
+    switches the output. the thread asks for real-time priority (SCHED_FIFO), which needs root or
+    CAP_SYS_NICE; without it, it runs at normal priority.
+    a pulse on an output that is not registered (e.g. sound3, whose pin is not set up) is logged and
+    skipped, like a reward from an unknown pump.
+
+    the outputs are switched under the scheduler lock. cancel() bumps the generation of the output,
+    so a pulse that was already taken off the queue when cancel() ran is dropped too; an off edge
+    only switches the output off if its pulse is still the one that last switched it on (a late
+    onset can make two pulses of one output overlap, the later one then ends on its own off edge).
+
+    every edge is logged to the EventLogger as ("pulse", "<output>_on" / "<output>_off") when it
+    happened; the value is the onset lateness (on) or the pulse width error (off), in ms.
+    per output: pulse count, mean width error and the |width error| histogram (bins of LatencyMonitor),
+    printed by summary_text() and written by dump().
+
+    with a VirtualClock the edges are scheduled on the clock instead (no thread, no error).
+
+"""
+import heapq
+import io
+import logging
+import math
+import os
+import time
+from threading import Thread, Event, Lock
+
+import numpy as np
+
+import BoxClock
+import LatencyMonitor
+
+
+class Pulse(object):
+    def __init__(self, name, width_ns, on_deadline_ns, generation):
+        self.name = name
+        self.width_ns = width_ns
+        self.on_deadline_ns = on_deadline_ns
+        self.generation = generation  # generation of the output when the pulse was asked for
+        self.on_ns = None  # when the output was actually switched on
+        self.cancelled = False
+
+
+class PulseStats(object):
+    def __init__(self):
+        self.histogram = np.zeros(LatencyMonitor.N_BINS, dtype=np.int64)  # |width error|
+        self.count = 0
+        self.error_sum_ns = 0  # signed, mean error = error_sum_ns / count
+        self.max_error_ns = 0  # largest |width error|
+        self.max_lateness_ns = 0  # largest onset lateness
+
+    def record(self, error_ns, lateness_ns):
+        self.histogram[int(np.searchsorted(LatencyMonitor.BIN_EDGES_NS, abs(error_ns)))] += 1
+        self.count += 1
+        self.error_sum_ns += error_ns
+        self.max_error_ns = max(self.max_error_ns, abs(error_ns))
+        self.max_lateness_ns = max(self.max_lateness_ns, lateness_ns)
+
+    def percentile(self, q):
+        """Upper bound (ns) of the bin holding the q-th percentile of |width error|, nan without pulses."""
+        if self.count == 0:
+            return math.nan
+        index = int(np.searchsorted(np.cumsum(self.histogram), q / 100.0 * self.count))
+        return min(LatencyMonitor.BIN_EDGES_NS[index], float(self.max_error_ns))
+
+
+class PulseScheduler(object):
+    def __init__(self, event_logger=None, spin=0.001, priority=50):
+        self.event_logger = event_logger
+        self.spin = spin  # s polled before every deadline
+        self.priority = priority  # SCHED_FIFO priority of the scheduler thread
+        self.clock = BoxClock.get_clock()
+        self.outputs = {}  # name -> device with on() and off()
+        self.stats = {}  # name -> PulseStats
+        self._generation = {}  # name -> count of cancel() calls, under _lock
+        self._current = {}  # name -> Pulse that last switched the output on, None once off, under _lock
+
+        self._queue = []  # heap of (deadline_ns, sequence, Pulse, state)
+        self._sequence = 0
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._stopping = Event()
+        self._thread = None
+
+    def register(self, name, device):
+        self.outputs[name] = device
+        self.stats[name] = PulseStats()
+        self._generation[name] = 0
+        self._current[name] = None
+
+    def pulse(self, name, on_time, off_time=0.1, n=1, delay=0.0):
+        """Switch output name on for on_time s, n times every on_time + off_time s, from delay s on."""
+        if name not in self.outputs:
+            logging.info(";" + str(self.clock.time()) + ";[warning];unknown_output_" + str(name))
+            return
+        width_ns = int(on_time * 1e9)
+        period_ns = width_ns + int(off_time * 1e9)
+        start_ns = self.clock.monotonic_ns() + int(delay * 1e9)
+        generation = self._generation[name]
+        pulses = [Pulse(name, width_ns, start_ns + index * period_ns, generation) for index in range(n)]
+        if self.clock.is_virtual:
+            for pulse in pulses:
+                self._schedule_virtual(pulse, True, pulse.on_deadline_ns)
+            return
+        with self._lock:
+            for pulse in pulses:
+                self._push(pulse, True, pulse.on_deadline_ns)
+        if self._thread is None:
+            self.start()
+        self._wakeup.set()
+
+    def cancel(self, name):
+        """Drop the pending pulses of output name and switch it off."""
+        device = self.outputs.get(name)
+        if device is None:
+            return
+        with self._lock:
+            self._generation[name] += 1  # also drops the pulses the scheduler already popped
+            for _, _, pulse, _ in self._queue:
+                if pulse.name == name:
+                    pulse.cancelled = True
+            self._current[name] = None
+            device.off()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+        with self._lock:
+            pending = [pulse.name for _, _, pulse, _ in self._queue if not pulse.cancelled]
+            self._queue = []
+        for name in set(pending):
+            self.outputs[name].off()  # never leave a valve open
+
+    ###############################################################################################
+    # scheduler side
+    ###############################################################################################
+    def _push(self, pulse, state, deadline_ns):
+        self._sequence += 1
+        heapq.heappush(self._queue, (deadline_ns, self._sequence, pulse, state))
+
+    def _schedule_virtual(self, pulse, state, deadline_ns):
+        delay = (deadline_ns - self.clock.monotonic_ns()) / 1e9
+        self.clock.call_later(delay, self._switch, pulse, state, deadline_ns)
+
+    def _raise_priority(self):
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.priority))  # this thread only
+        except (AttributeError, OSError) as error_message:
+            print("pulse scheduler priority issue, running at normal priority\n")
+            print(str(error_message))
+
+    def _run(self):
+        self._raise_priority()
+        while not self._stopping.is_set():
+            with self._lock:
+                deadline_ns = self._queue[0][0] if self._queue else None
+                self._wakeup.clear()  # pulse() sets it after pushing, under the same lock
+            if deadline_ns is None:
+                self._wakeup.wait()
+                continue
+            remaining = (deadline_ns - self.clock.monotonic_ns()) / 1e9 - self.spin
+            if remaining > 0:
+                self._wakeup.wait(remaining)  # woken early by a pulse() with an earlier deadline
+                continue
+            monotonic_ns = self.clock.monotonic_ns
+            while monotonic_ns() < deadline_ns:
+                time.sleep(0)  # releases the GIL, returns at once
+            with self._lock:
+                due = []
+                while self._queue and self._queue[0][0] <= deadline_ns:
+                    due.append(heapq.heappop(self._queue))
+            for deadline_ns, _, pulse, state in due:
+                self._switch(pulse, state, deadline_ns)
+
+    def _switch(self, pulse, state, deadline_ns):
+        device = self.outputs[pulse.name]
+        with self._lock:
+            # checked under the lock: cancel() may have run since the pulse left the queue
+            if pulse.cancelled or pulse.generation != self._generation[pulse.name]:
+                return
+            if state:
+                device.on()
+                pulse.on_ns = self.clock.monotonic_ns()
+                self._current[pulse.name] = pulse
+                # the width counts from the actual onset: a late onset delays the pulse, never shortens it
+                if not self.clock.is_virtual:
+                    self._push(pulse, False, pulse.on_ns + pulse.width_ns)
+            else:
+                if self._current[pulse.name] is not pulse:
+                    return  # a later pulse switched the output on, its own off edge ends it
+                device.off()
+                off_ns = self.clock.monotonic_ns()
+                self._current[pulse.name] = None
+        if state:
+            if self.clock.is_virtual:
+                self._schedule_virtual(pulse, False, pulse.on_ns + pulse.width_ns)
+            if self.event_logger is not None:
+                self.event_logger.log("pulse", pulse.name + "_on", value=(pulse.on_ns - deadline_ns) / 1e6)
+            return
+        error_ns = off_ns - pulse.on_ns - pulse.width_ns
+        self.stats[pulse.name].record(error_ns, pulse.on_ns - pulse.on_deadline_ns)
+        if self.event_logger is not None:
+            self.event_logger.log("pulse", pulse.name + "_off", value=error_ns / 1e6)
+
+    ###############################################################################################
+    # statistics
+    ###############################################################################################
+    def summary(self):
+        """List of (output, count, mean_error_ms, p50_ms, p99_ms, max_ms, max_lateness_ms) per pulsed output."""
+        return [(name, stats.count, stats.error_sum_ns / stats.count / 1e6, stats.percentile(50) / 1e6,
+                 stats.percentile(99) / 1e6, stats.max_error_ns / 1e6, stats.max_lateness_ns / 1e6)
+                for name, stats in sorted(self.stats.items()) if stats.count]
+
+    def summary_text(self):
+        lines = ["pulse width error (|actual - requested|):"]
+        for row in self.summary():
+            lines.append("    %-12s n=%-6d mean=%+8.3f p50=%7.3f p99=%7.3f max=%7.3f ms, onset late max=%7.3f ms" % row)
+        return "\n".join(lines)
+
+    def dump(self, filename):
+        """Write the per output summary as csv and print it."""
+        with io.open(filename, 'w') as f:
+            f.write('output, count, mean_error_ms, p50_ms, p99_ms, max_ms, max_lateness_ms\n')
+            for row in self.summary():
+                f.write('%s, %d, %f, %f, %f, %f, %f\n' % row)
+        print(self.summary_text())
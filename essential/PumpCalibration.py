@@ -0,0 +1,127 @@
+# python3: PumpCalibration.py
+"""
+name: PumpCalibration.py
+goal: reward volume -> valve open duration per pump, fitted once at box init instead of per reward
+description:
+    a Calibration maps the reward size (ul, as passed to Pump.reward) to the solenoid open time (s):
+        linear / poly: polynomial in the calibration volume (highest power first, as np.polyfit)
+        spline: monotone cubic (PCHIP) through measured (volume, duration) points
+    the calibration volume is reward_size * volume_scale (0.001: the calibration.csv fluid weights).
+    the map is sampled once into a lookup table over volume_range, so duration() is a table lookup
+    and a linear interpolation whatever the kind. at build time the map must be finite and must not
+    decrease over volume_range (negative durations are clipped to 0); a reward outside volume_range
+    is clipped to the range and counted in out_of_range_count (duration(..., clip=False) raises).
+
+    session_info['pump_calibration'] (optional):
+        {'filename': calibration.csv, 'kind': 'linear' | 'poly' | 'spline', 'degree': 2}
+        fitted per pump from the csv columns pump_number, weight_fluid, iteration, on_time
+    without it, or if the file can not be read, session_info['calibration_coefficient'][pump]
+    (polynomial coefficients) is used, and DEFAULT_COEFFICIENTS for a pump not listed there.
+
+"""
+import numpy as np
+
+DEFAULT_COEFFICIENTS = [0.13, 0]  # the template default, for session_info without calibration_coefficient
+LUT_SIZE = 1024
+DEFAULT_VOLUME_RANGE = (0.0, 100.0)  # ul, for calibrations given only as coefficients
+VOLUME_SCALE = 0.001  # reward size (ul) -> calibration volume
+
+
+class Calibration(object):
+    def __init__(self, function, description, volume_range=DEFAULT_VOLUME_RANGE, volume_scale=VOLUME_SCALE):
+        """function: vectorized calibration volume -> duration; description: shown in the reward log."""
+        self.description = description
+        self.volume_range = (float(volume_range[0]), float(volume_range[1]))
+        self.volume_scale = volume_scale
+        self.out_of_range_count = 0
+
+        low, high = self.volume_range
+        if not high > low:
+            raise ValueError("empty volume range " + str(volume_range))
+        durations = np.asarray(function(np.linspace(low, high, LUT_SIZE) * volume_scale), dtype=np.float64)
+        if not np.all(np.isfinite(durations)):
+            raise ValueError("calibration " + description + " is not finite over " + str(volume_range))
+        if np.any(np.diff(durations) < -1e-12):
+            raise ValueError("calibration " + description + " decreases over " + str(volume_range))
+        self._table = np.maximum(durations, 0.0).tolist()  # python floats: no numpy per reward
+        self._low = low
+        self._step = (high - low) / (LUT_SIZE - 1)
+
+    def __str__(self):
+        return self.description
+
+    def duration(self, reward_size, clip=True):
+        """Valve open time (s) for reward_size (ul)."""
+        low, high = self.volume_range
+        if not low <= reward_size <= high:
+            if not clip:
+                raise ValueError("reward size %s outside the calibrated range %s" % (reward_size, self.volume_range))
+            self.out_of_range_count += 1
+            reward_size = min(max(reward_size, low), high)
+        position = (reward_size - self._low) / self._step
+        index = min(int(position), LUT_SIZE - 2)
+        fraction = position - index
+        return self._table[index] + fraction * (self._table[index + 1] - self._table[index])
+
+
+def polynomial(coefficients, volume_range=DEFAULT_VOLUME_RANGE, volume_scale=VOLUME_SCALE):
+    """Calibration from polynomial coefficients, highest power first (a linear fit is [slope, offset])."""
+    coefficients = [float(c) for c in coefficients]
+    return Calibration(lambda volume: np.polyval(coefficients, volume), str(coefficients), volume_range, volume_scale)
+
+
+def monotone_spline(volumes, durations, volume_scale=VOLUME_SCALE):
+    """Calibration through measured points (calibration volume, s), over the measured volumes."""
+    from scipy.interpolate import PchipInterpolator
+    order = np.argsort(volumes)
+    volumes = np.asarray(volumes, dtype=np.float64)[order]
+    durations = np.asarray(durations, dtype=np.float64)[order]
+    if len(np.unique(volumes)) != len(volumes) or len(volumes) < 2:
+        raise ValueError("a spline calibration needs at least 2 distinct volumes")
+    if np.any(np.diff(durations) < 0):
+        raise ValueError("the measured durations decrease with the volume")
+    spline = PchipInterpolator(volumes, durations)  # monotone between monotone points
+    return Calibration(spline, "spline(%d points)" % len(volumes),
+                       (volumes[0] / volume_scale, volumes[-1] / volume_scale), volume_scale)
+
+
+def fit_calibration(volumes, durations, kind="linear", degree=2, volume_scale=VOLUME_SCALE):
+    """Calibration of one pump from its measurements (calibration volume per pulse, on time)."""
+    if kind == "spline":
+        return monotone_spline(volumes, durations, volume_scale)
+    degree = 1 if kind == "linear" else degree
+    coefficients = np.polyfit(volumes, durations, degree)  # output with highest power first
+    # allow some extrapolation above the largest measured volume
+    volume_range = (0.0, 1.5 * float(np.max(volumes)) / volume_scale)
+    return polynomial(coefficients, volume_range, volume_scale)
+
+
+def load_calibrations(filename, kind="linear", degree=2, pumps=("1", "2", "3", "4")):
+    """{pump: Calibration} fitted from a calibration.csv (pump_number, weight_fluid, iteration, on_time)."""
+    data = np.genfromtxt(filename, delimiter=",", names=True, ndmin=1)  # no pandas import at box start
+    calibrations = {}
+    for pump in pumps:
+        rows = data[data['pump_number'] == int(pump)]
+        mg_per_pulse = rows['weight_fluid'] / rows['iteration']
+        calibrations[pump] = fit_calibration(mg_per_pulse, rows['on_time'], kind, degree)
+    return calibrations
+
+
+def session_calibrations(session_info, pumps=("1", "2", "3", "4")):
+    """{pump: Calibration} for the box: fitted from session_info['pump_calibration'] if it works,
+    else from the session_info['calibration_coefficient'] polynomials or DEFAULT_COEFFICIENTS."""
+    calibrations = {}
+    setup = session_info.get("pump_calibration")
+    if setup:
+        try:
+            calibrations = load_calibrations(setup["filename"], setup.get("kind", "linear"),
+                                             setup.get("degree", 2), pumps)
+        except Exception as error_message:
+            print("pump calibration issue, using calibration_coefficient\n")
+            print(str(error_message))
+    coefficients = session_info.get("calibration_coefficient", {})
+    for pump in pumps:
+        if pump not in calibrations:
+            calibrations[pump] = polynomial(coefficients.get(pump, DEFAULT_COEFFICIENTS))
+    return calibrations
+
@@ -0,0 +1,324 @@
+# python3: SessionReport.py
+"""
+name: SessionReport.py
+goal: session summary figures rendered off the box, for one session or a whole cohort
+description:
+    builds the end-of-session summary of every given session directory (e.g. on the external
+    storage) from the files the box already writes:
+        <basename>_events.bin/.names   choice licks in reward_available, outcomes ('error' events)
+        <basename>.log                 rewards ('[reward];pumpN_reward(... reward_amount: X' lines)
+        <basename>_treadmill_output.csv  running speed (min/max decimated, see TreadmillTrace)
+    and saves <basename>_report.png (choice trajectory, outcome breakdown, reward totals, running
+    speed) and <basename>_report.json (summary numbers and the cache key) into the session directory.
+
+    the sessions are rendered with the Agg backend in a process pool. the cache key of a session is
+    the sha1 of its input files and REPORT_VERSION; a session whose key did not change is skipped.
+    the (size, mtime) of every input is stored with its hash, so unchanged files are not even read
+    again: re-running over hundreds of sessions only hashes and renders the new or changed ones.
+    --cohort <file> additionally writes <file>.csv (one row per session) and <file>.png.
+
+    usage:
+        python SessionReport.py <session dir> [<session dir> ...] [--workers N] [--force] [--cohort FILE]
+
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import EventLogger
+import TreadmillTrace
+
+REPORT_VERSION = 1  # bump when the figure or the summary changes, invalidates every cache
+SPEED_BUCKETS = 500  # min/max pairs in the running speed panel
+SIDES = ("left", "right")
+SIDE_COLORS = ("b", "r")
+REWARD_PATTERN = re.compile(r"\[reward\];(\w+?)_reward\(.*?reward_amount: ([0-9.eE+-]+?)(?:duration|\))")
+
+
+def session_files(session_dir):
+    """{input name: path} of the report inputs of a session directory (missing files included)."""
+    basename = os.path.basename(os.path.normpath(session_dir))
+    prefix = os.path.join(session_dir, basename)
+    return OrderedDict([
+        ("events_bin", prefix + "_events.bin"),
+        ("events_names", prefix + "_events.names"),
+        ("log", prefix + ".log"),
+        ("treadmill", prefix + "_treadmill_output.csv"),
+    ])
+
+
+def report_paths(session_dir):
+    basename = os.path.basename(os.path.normpath(session_dir))
+    prefix = os.path.join(session_dir, basename)
+    return prefix + "_report.json", prefix + "_report.png"
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _sha1(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with io.open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_cache(session_dir):
+    json_path, png_path = report_paths(session_dir)
+    if not os.path.exists(png_path):
+        return None
+    try:
+        with io.open(json_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_current(session_dir, cache=None):
+    """True if the cached report was built from inputs with the same size and mtime (no hashing)."""
+    cache = cache if cache is not None else read_cache(session_dir)
+    if cache is None or cache.get("version") != REPORT_VERSION:
+        return False
+    inputs = cache.get("inputs", {})
+    return all(inputs.get(name, {}).get("stat") == _stat(path)
+               for name, path in session_files(session_dir).items())
+
+
+def hash_inputs(session_dir, cache=None):
+    """{input name: {'stat', 'sha1'}}; the cached hash is reused for a file with the same stat."""
+    cached = (cache or {}).get("inputs", {})
+    inputs = OrderedDict()
+    for name, path in session_files(session_dir).items():
+        stat = _stat(path)
+        if stat is None:
+            inputs[name] = {"stat": None, "sha1": None}
+        elif cached.get(name, {}).get("stat") == stat:
+            inputs[name] = cached[name]
+        else:
+            inputs[name] = {"stat": stat, "sha1": _sha1(path)}
+    return inputs
+
+
+def cache_key(inputs):
+    digest = hashlib.sha1(str(REPORT_VERSION).encode())
+    for name, entry in inputs.items():
+        digest.update((name + ":" + str(entry["sha1"]) + ";").encode())
+    return digest.hexdigest()
+
+
+###############################################################################################
+# session data
+###############################################################################################
+def load_events(files):
+    """(choice times per side, outcome counts, session start) from the binary event log."""
+    choices = {side: [] for side in SIDES}
+    outcomes = OrderedDict()
+    start = None
+    if not (os.path.exists(files["events_bin"]) and os.path.exists(files["events_names"])):
+        return choices, outcomes, start
+    in_reward_available = False
+    for wall_time, _, tag, event, _, _ in EventLogger.read_records(files["events_bin"], files["events_names"]):
+        if start is None:
+            start = wall_time
+        if tag == "transition":
+            if event == "enter_reward_available":
+                in_reward_available = True
+            elif event == "exit_reward_available":
+                in_reward_available = False
+        elif tag == "action" and in_reward_available and event in ("left_entry", "right_entry"):
+            choices[event.split("_")[0]].append(wall_time)
+        elif tag == "error":
+            outcomes[event] = outcomes.get(event, 0) + 1
+    return choices, outcomes, start
+
+
+def load_rewards(files):
+    """{pump: [number of rewards, total amount]} from the session log."""
+    rewards = OrderedDict()
+    if not os.path.exists(files["log"]):
+        return rewards
+    with io.open(files["log"], "r", errors="replace") as f:
+        for line in f:
+            match = REWARD_PATTERN.search(line)
+            if match:
+                entry = rewards.setdefault(match.group(1), [0, 0.0])
+                entry[0] += 1
+                entry[1] += float(match.group(2))
+    return rewards
+
+
+def load_treadmill(files):
+    """(time, distance_cm) arrays of the treadmill output, empty when there is none."""
+    if not os.path.exists(files["treadmill"]) or os.path.getsize(files["treadmill"]) == 0:
+        return np.zeros(0), np.zeros(0)
+    data = np.loadtxt(files["treadmill"], delimiter=",", skiprows=1, ndmin=2)
+    if data.shape[0] == 0:
+        return np.zeros(0), np.zeros(0)
+    return data[:, 0], data[:, 2]
+
+
+###############################################################################################
+# rendering - runs in the worker processes
+###############################################################################################
+def render_report(session_dir, figure_filename):
+    """Build the summary figure of a session with Agg; return the summary numbers."""
+    from matplotlib.figure import Figure  # no pyplot: no GUI backend and no global figure state
+    files = session_files(session_dir)
+    choices, outcomes, start = load_events(files)
+    rewards = load_rewards(files)
+    time, distance = load_treadmill(files)
+    if start is None:
+        start = float(time[0]) if len(time) else 0.0
+
+    figure = Figure(figsize=(11, 8))
+    (choice_axes, outcome_axes), (reward_axes, speed_axes) = figure.subplots(2, 2)
+    figure.suptitle(os.path.basename(os.path.normpath(session_dir)))
+
+    for side, color in zip(SIDES, SIDE_COLORS):
+        side_time = np.asarray(choices[side]) - start
+        choice_axes.step(side_time, np.arange(1, len(side_time) + 1), where="post", color=color,
+                         label=side + "_lick_trajectory")
+    choice_axes.set_xlabel("time (s)")
+    choice_axes.set_ylabel("choice licks")
+    choice_axes.legend(loc="upper left")
+
+    ticks = range(len(outcomes))
+    outcome_axes.bar(ticks, list(outcomes.values()), align="center")
+    outcome_axes.set_xticks(ticks)
+    outcome_axes.set_xticklabels(labels=list(outcomes), rotation=70)
+    outcome_axes.set_ylabel("trials")
+
+    ticks = range(len(rewards))
+    reward_axes.bar(ticks, [amount for _, amount in rewards.values()], align="center", color="c")
+    reward_axes.set_xticks(ticks)
+    reward_axes.set_xticklabels(labels=["%s (%d)" % (pump, n) for pump, (n, _) in rewards.items()])
+    reward_axes.set_ylabel("total reward")
+
+    speed_time, speed = TreadmillTrace.speed_from_distance(time, distance)
+    if len(speed_time):
+        bucket_time, values = TreadmillTrace.minmax_decimate(
+            speed_time, speed, speed_time[0], speed_time[-1] + 1e-9, SPEED_BUCKETS)
+        speed_axes.plot(bucket_time - start, values, color="g", linewidth=0.8, label="running_speed")
+    speed_axes.set_xlabel("time (s)")
+    speed_axes.set_ylabel("cm/s")
+
+    figure.tight_layout()
+    figure.savefig(figure_filename)
+
+    trials = sum(outcomes.values())
+    return OrderedDict([
+        ("trials", trials),
+        ("correct_trial", outcomes.get("correct_trial", 0)),
+        ("correct_rate", outcomes.get("correct_trial", 0) / trials if trials else float("nan")),
+        ("left_choices", len(choices["left"])),
+        ("right_choices", len(choices["right"])),
+        ("outcomes", outcomes),
+        ("rewards", sum(n for n, _ in rewards.values())),
+        ("reward_amount", sum(amount for _, amount in rewards.values())),
+        ("distance_cm", float(distance[-1] - distance[0]) if len(distance) else 0.0),
+        ("duration", float(time[-1] - time[0]) if len(time) else 0.0),
+    ])
+
+
+def build_report(session_dir, force=False):
+    """Worker: hash the inputs, render if the cache key changed; return (session_dir, summary, rendered)."""
+    import matplotlib
+    matplotlib.use("Agg")
+    cache = read_cache(session_dir)
+    inputs = hash_inputs(session_dir, cache)
+    key = cache_key(inputs)
+    if not force and cache is not None and cache.get("key") == key:
+        if cache["inputs"] != inputs:  # touched but unchanged files: only refresh the stats
+            cache["inputs"] = inputs
+            _write_json(report_paths(session_dir)[0], cache)
+        return session_dir, cache["summary"], False
+    json_path, png_path = report_paths(session_dir)
+    summary = render_report(session_dir, png_path)
+    _write_json(json_path, OrderedDict([
+        ("version", REPORT_VERSION), ("key", key), ("inputs", inputs), ("summary", summary)]))
+    return session_dir, summary, True
+
+
+def _write_json(path, content):
+    temporary = path + ".tmp"
+    with io.open(temporary, "w") as f:
+        json.dump(content, f, indent=1)
+    os.replace(temporary, path)  # a killed run never leaves a half-written cache
+
+
+###############################################################################################
+# cohort
+###############################################################################################
+def write_cohort(filename, summaries):
+    """<filename>.csv with one row per session and <filename>.png with the per-session trends."""
+    from matplotlib.figure import Figure
+    columns = ["trials", "correct_trial", "correct_rate", "left_choices", "right_choices",
+               "rewards", "reward_amount", "distance_cm", "duration"]
+    names = [os.path.basename(os.path.normpath(session_dir)) for session_dir in summaries]
+    with io.open(filename + ".csv", "w") as f:
+        f.write("session, " + ", ".join(columns) + "\n")
+        for name, summary in zip(names, summaries.values()):
+            f.write(name + ", " + ", ".join(str(summary[column]) for column in columns) + "\n")
+
+    figure = Figure(figsize=(11, 8))
+    axes = figure.subplots(3, 1, sharex=True)
+    index = np.arange(len(names))
+    for ax, column, color in zip(axes, ("correct_rate", "reward_amount", "distance_cm"), ("k", "c", "g")):
+        ax.plot(index, [summaries[session_dir][column] for session_dir in summaries], color=color, marker="o")
+        ax.set_ylabel(column)
+    axes[-1].set_xticks(index)
+    axes[-1].set_xticklabels(labels=names, rotation=70, fontsize=6)
+    figure.tight_layout()
+    figure.savefig(filename + ".png")
+
+
+def run(session_dirs, workers=None, force=False, cohort=None):
+    summaries = OrderedDict()
+    pending = []
+    for session_dir in session_dirs:
+        cache = None if force else read_cache(session_dir)
+        if cache is not None and is_current(session_dir, cache):
+            summaries[session_dir] = cache["summary"]  # nothing changed: no hashing, no worker
+        else:
+            pending.append(session_dir)
+    rendered = 0
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(build_report, session_dir, force): session_dir for session_dir in pending}
+            for future in as_completed(futures):
+                try:
+                    session_dir, summary, new = future.result()
+                except Exception as error:  # one broken session does not stop the cohort
+                    print("report failed:", futures[future], error, file=sys.stderr)
+                    continue
+                summaries[session_dir] = summary
+                rendered += new
+    print("%d sessions, %d rendered, %d cached" % (len(session_dirs), rendered, len(summaries) - rendered))
+    if cohort is not None:
+        ordered = OrderedDict((d, summaries[d]) for d in session_dirs if d in summaries)
+        write_cohort(cohort, ordered)
+    return summaries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="session summary figures, cached by input file hash")
+    parser.add_argument("session_dirs", nargs="+", help="session directories (<basedir>/<basename>)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="worker processes (default: all cpus)")
+    parser.add_argument("-f", "--force", action="store_true", help="ignore the cache and render every session")
+    parser.add_argument("-c", "--cohort", default=None, help="also write <cohort>.csv and <cohort>.png")
+    args = parser.parse_args()
+    run(args.session_dirs, args.workers, args.force, args.cohort)
@@ -0,0 +1,258 @@
+# python3: SimulatedHardware.py
+"""
+name: SimulatedHardware.py
+goal: run full BehavBox sessions on a plain linux machine, without a RPi, I2C treadmill, screen or video RPi
+description:
+    selected with session_info['simulation'] = True. BehavBox then
+        - calls setup(), which installs the gpiozero mock pin factory and a headless SDL display
+        - reads the treadmill through FakeTreadmillBus instead of smbus, or replays a recorded
+          treadmill log with session_info['treadmill_replay'] (see TreadmillReplay)
+        - shows gratings on StubVisualStim instead of the rpg screen
+        - sends the video RPi commands to LocalVideoPi, which only logs the remote (ssh) commands
+        - drives the input pins from a VirtualMouse that licks, pokes and runs
+    the behaviour of the virtual mouse is set by session_info['virtual_mouse'], see VIRTUAL_MOUSE_DEFAULTS.
+
+"""
+import heapq
+import logging
+import math
+import os
+import random
+import struct
+from collections import OrderedDict
+from threading import Thread, Event, Lock
+
+import BoxClock
+
+VIRTUAL_MOUSE_DEFAULTS = {
+    'seed': None,  # random seed, set it for reproducible sessions
+    'lick_bout_rate': 0.2,  # lick bouts per second
+    'bout_licks': 5,  # mean number of licks per bout (geometric distribution)
+    'lick_rate': 7.0,  # licks per second within a bout
+    'lick_duration': 0.03,  # s the lick circuit stays closed
+    'left_fraction': 0.5,  # fraction of the bouts on the left spout, the rest goes right
+    'poke_rate': 0.0,  # nose pokes per second, spread over IR_rx1..3
+    'poke_duration': 0.2,  # s
+    'running_speed': 10.0,  # cm/s while running
+    'running_fraction': 0.5,  # fraction of the time spent running
+    'running_bout': 5.0,  # mean duration of a running or resting period in s
+}
+
+
+def setup(session_info):
+    """Switch gpiozero and pygame to their simulated backends. Call before any pin is created."""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    from gpiozero import Device
+    from gpiozero.pins.mock import MockFactory, MockPWMPin
+    Device.pin_factory = MockFactory(pin_class=MockPWMPin)
+    logging.info(";" + str(BoxClock.get_clock().time()) + ";[initialization];simulated_hardware")
+
+
+class FakeTreadmillBus(object):
+    """Stand-in for smbus.SMBus: returns the treadmill Arduino's float distance (in bits)."""
+
+    def __init__(self, mouse=None, treadmill_calibrate=9.14):
+        self.mouse = mouse
+        self.treadmill_calibrate = treadmill_calibrate  # bit per cm, as in Treadmill
+        self.distance_cm = 0.0
+        self.clock = BoxClock.get_clock()
+        self._last_read = self.clock.monotonic()
+        self._lock = Lock()
+
+    def read_i2c_block_data(self, address, cmd, length=32):
+        with self._lock:
+            now = self.clock.monotonic()
+            speed = self.mouse.running_speed if self.mouse is not None else 0.0
+            self.distance_cm += speed * (now - self._last_read)
+            self._last_read = now
+            block = struct.pack("<f", self.distance_cm * self.treadmill_calibrate)
+        return list(block) + [0] * (length - len(block))
+
+    def close(self):
+        pass
+
+
+class StubScreen(object):
+    """Stand-in for rpg.Screen."""
+
+    def __init__(self):
+        self.grey_level = None
+
+    def load_grating(self, grating_file):
+        return grating_file
+
+    def display_grating(self, grating):
+        pass
+
+    def display_greyscale(self, grey_level):
+        self.grey_level = grey_level
+
+    def close(self):
+        pass
+
+
+class StubVisualStim(object):
+    """Stand-in for visualstim.VisualStim with the same attributes and methods."""
+
+    def __init__(self, session_info):
+        self.session_info = session_info
+        self.gratings = OrderedDict()
+        self.myscreen = StubScreen()
+        self.myscreen.display_greyscale(self.session_info.get("gray_level"))
+        for filepath in self.session_info.get("vis_gratings", []):
+            self.load_grating_file(filepath)
+
+    def load_grating_file(self, grating_file):
+        fname = os.path.split(grating_file)
+        self.gratings.update({fname[1]: self.myscreen.load_grating(grating_file)})
+
+    def load_grating_dir(self, grating_directory):
+        for fname in sorted(os.listdir(grating_directory)):
+            self.gratings.update({fname: self.myscreen.load_grating(fname)})
+
+    def load_session_gratings(self):
+        for filepath in self.session_info.get("vis_gratings", []):
+            self.load_grating_file(filepath)
+
+    def list_gratings(self):
+        print(self.gratings)
+
+    def clear_gratings(self):
+        self.gratings = {}
+
+    def show_grating(self, grating_name):
+        logging.info(";" + str(BoxClock.get_clock().time()) + ";[stimulus];" + str(grating_name) + "_on")
+
+    def process_function(self, grating_name):
+        self.show_grating(grating_name)
+
+
+class LocalVideoPi(object):
+    """Stand-in for the video RPi: ssh commands are only logged, local commands still run."""
+
+    def __init__(self, session_info):
+        self.session_info = session_info
+        self.commands = []
+
+    def system(self, command):
+        self.commands.append(command)
+        if command.startswith("ssh ") or " pi@" in command:
+            logging.info(";" + str(BoxClock.get_clock().time()) + ";[simulation];video_pi;" + command)
+            return 0
+        return os.system(command)
+
+
+class VirtualMouse(object):
+    """Drives the mock input pins of a BehavBox with licks, nose pokes and running.
+
+    licks come in bouts (Poisson bout onsets, geometric number of licks per bout), pokes are
+    Poisson, and the mouse alternates between running at running_speed and resting.
+    """
+
+    def __init__(self, box, config=None):
+        self.box = box
+        self.config = dict(VIRTUAL_MOUSE_DEFAULTS)
+        if config:
+            self.config.update(config)
+        self.random = random.Random(self.config['seed'])
+
+        self.running_speed = 0.0  # cm/s, read by FakeTreadmillBus
+        self.lick_count = 0
+        self.poke_count = 0
+
+        self._schedule = []  # heap of (time, sequence, action)
+        self._sequence = 0
+        self._thread = None
+        self._stopping = Event()
+        self.clock = BoxClock.get_clock()
+
+    ###############################################################################################
+    # pin helpers - the lick inputs are active high and report a lick (entry) on release
+    ###############################################################################################
+    def _lick_pins(self):
+        return (self.box.lick1.pin, self.box.lick2.pin)
+
+    def _poke_pins(self):
+        return (self.box.IR_rx1.pin, self.box.IR_rx2.pin, self.box.IR_rx3.pin)
+
+    def start(self):
+        self.stop()
+        # idle level of the lick circuits is high (open), IR beams are not broken
+        for pin in self._lick_pins():
+            pin.drive_high()
+        now = self.clock.monotonic()
+        self._schedule = []
+        self._stopping.clear()
+        self._at(now + self._exponential(self.config['lick_bout_rate']), self._lick_bout)
+        self._at(now + self._exponential(self.config['poke_rate']), self._poke)
+        self._at(now, self._switch_running)
+        if not self.clock.is_virtual:
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+        self.running_speed = 0.0
+
+    def _exponential(self, rate):
+        if rate <= 0:
+            return math.inf
+        return self.random.expovariate(rate)
+
+    def _at(self, when, action):
+        if math.isinf(when):
+            return
+        if self.clock.is_virtual:
+            # the virtual clock runs the action itself, in time order with everything else
+            self.clock.call_later(when - self.clock.monotonic(), self._run_action, action, when)
+            return
+        self._sequence += 1
+        heapq.heappush(self._schedule, (when, self._sequence, action))
+
+    def _run_action(self, action, when):
+        if not self._stopping.is_set():
+            action(when)
+
+    def _run(self):
+        while self._schedule and not self._stopping.is_set():
+            when, _, action = heapq.heappop(self._schedule)
+            if self._stopping.wait(max(when - self.clock.monotonic(), 0)):
+                break
+            action(when)
+
+    ###############################################################################################
+    # behaviour
+    ###############################################################################################
+    def _lick_bout(self, now):
+        left = self.random.random() < self.config['left_fraction']
+        pin = self._lick_pins()[0 if left else 1]
+        n_licks = 1
+        mean = max(self.config['bout_licks'], 1)
+        while self.random.random() > 1.0 / mean:
+            n_licks += 1
+        interval = 1.0 / self.config['lick_rate']
+        for lick in range(n_licks):
+            onset = now + lick * interval
+            self._at(onset, lambda when, pin=pin: self._lick_on(pin))
+            self._at(onset + self.config['lick_duration'], lambda when, pin=pin: pin.drive_high())
+        self._at(now + n_licks * interval + self._exponential(self.config['lick_bout_rate']), self._lick_bout)
+
+    def _lick_on(self, pin):
+        self.lick_count += 1
+        pin.drive_low()
+
+    def _poke(self, now):
+        pin = self.random.choice(self._poke_pins())
+        self.poke_count += 1
+        pin.drive_high()
+        self._at(now + self.config['poke_duration'], lambda when, pin=pin: pin.drive_low())
+        self._at(now + self._exponential(self.config['poke_rate']), self._poke)
+
+    def _switch_running(self, now):
+        running = self.random.random() < self.config['running_fraction']
+        self.running_speed = self.config['running_speed'] if running else 0.0
+        self._at(now + self._exponential(1.0 / self.config['running_bout']), self._switch_running)
@@ -0,0 +1,145 @@
+# python3: StartupProfile.py
+"""
+name: StartupProfile.py
+goal: keep the box start time low and measurable
+description:
+    lazy_import() returns a stand-in for a module that is only imported on first attribute access,
+    so subsystems that a session does not enable (pygame plotting, matplotlib, scipy, the screen)
+    never pay their import cost.
+
+    the import time of every lazy module, and the time spent between two lap() calls (imports of
+    the task modules, init of the pins, pump, flipper, treadmill, pygame, visualstim ...), are
+    always recorded. the lazy imports that happen inside a lap are counted as imports, not in the
+    lap itself. the table is printed and written to <file_basename>_startup.csv when the run script
+    is started with --profile-startup (or session_info['profile_startup'] = True), and a warning is
+    logged when the total goes over session_info['startup_budget'] seconds.
+
+"""
+import importlib
+import io
+import logging
+import sys
+import time
+import types
+from threading import RLock
+
+import BoxClock
+
+IMPORT = "import"
+INIT = "init"
+
+_records = []  # (kind, name, seconds)
+_lazy_seconds = 0.0  # lazy import time, subtracted from the lap it happened in
+_lap_start = time.perf_counter()
+_lap_lazy_seconds = 0.0
+
+
+def requested(session_info=None):
+    """True if the startup profile should be reported."""
+    if "--profile-startup" in sys.argv:
+        return True
+    return bool(session_info and session_info.get("profile_startup", False))
+
+
+def mark():
+    """Start a new lap without recording the time since the last one."""
+    global _lap_start, _lap_lazy_seconds
+    _lap_start = time.perf_counter()
+    _lap_lazy_seconds = _lazy_seconds
+
+
+def lap(kind, name):
+    """Record the time since the last lap()/mark() under (kind, name) and start a new lap."""
+    global _lap_start, _lap_lazy_seconds
+    now = time.perf_counter()
+    _records.append((kind, name, now - _lap_start - (_lazy_seconds - _lap_lazy_seconds)))
+    _lap_start = now
+    _lap_lazy_seconds = _lazy_seconds
+
+
+def records():
+    return list(_records)
+
+
+def total():
+    return sum(seconds for _, _, seconds in _records)
+
+
+def report(filename=None, budget=None):
+    """Print the startup profile, optionally write it as csv and check it against budget (s)."""
+    rows = records()
+    if filename is not None:
+        with io.open(filename, 'w') as f:
+            f.write('kind, name, seconds\n')
+            for row in rows:
+                f.write('%s, %s, %f\n' % row)
+    print("Startup profile (s):")
+    for row in rows:
+        print("    %-6s %-24s %8.3f" % row)
+    print("    %-6s %-24s %8.3f" % ("", "total", total()))
+    if budget is not None and total() > budget:
+        logging.warning(";" + str(BoxClock.get_clock().time()) + ";[initialization];startup_over_budget;" +
+                        "%.3f s > %.3f s" % (total(), budget))
+    return rows
+
+
+class LazyModule(types.ModuleType):
+    """Module stand-in; the real module is imported by the first attribute access."""
+
+    def __init__(self, name, before=None):
+        super(LazyModule, self).__init__(name)
+        self.__dict__["_lazy_before"] = before
+        self.__dict__["_lazy_module"] = None
+        self.__dict__["_lazy_lock"] = RLock()
+
+    def _lazy_load(self):
+        global _lazy_seconds
+        module = self.__dict__["_lazy_module"]
+        if module is not None:
+            return module
+        with self.__dict__["_lazy_lock"]:
+            module = self.__dict__["_lazy_module"]
+            if module is None:
+                start = time.perf_counter()
+                if self.__dict__["_lazy_before"] is not None:
+                    self.__dict__["_lazy_before"]()
+                module = importlib.import_module(self.__name__)
+                seconds = time.perf_counter() - start
+                _records.append((IMPORT, self.__name__, seconds))
+                _lazy_seconds += seconds
+                self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._lazy_load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._lazy_load(), attribute, value)
+
+    def __dir__(self):
+        return dir(self._lazy_load())
+
+    def __repr__(self):
+        if self.__dict__["_lazy_module"] is None:
+            return "<lazy module '%s' (not imported)>" % self.__name__
+        return repr(self.__dict__["_lazy_module"])
+
+
+def lazy_import(name, before=None):
+    """Return a LazyModule for name; before() runs right before the real import."""
+    module = sys.modules.get(name)
+    if module is not None:
+        if before is not None:
+            before()
+        return module
+    return LazyModule(name, before)
+
+
+def _use_pygame_backend():
+    import matplotlib
+    matplotlib.use('module://pygame_matplotlib.backend_pygame')
+
+
+def lazy_pyplot():
+    """matplotlib.pyplot on the pygame backend, imported when the first plot is drawn."""
+    return lazy_import("matplotlib.pyplot", before=_use_pygame_backend)
@@ -0,0 +1,247 @@
+# python3: StatusDisplay.py
+"""
+name: StatusDisplay.py
+goal: keep matplotlib rendering and the pygame frame limiter off the task thread
+description:
+    StatusDisplay (in the task process) starts this file as a separate renderer process that owns
+    the pygame window. the task process only publishes a snapshot of the session statistics (lick
+    trajectories, outcome counts, running speed, lick statistics, status line) into a shared memory block, which
+    costs a few array copies. the renderer reads the snapshot at a fixed low rate and redraws the
+    LivePlot figure when it changed.
+    key presses in the pygame window are written back by the renderer on its stdout, one
+    'type key' line per event, and queued by a reader thread in the task process;
+    BehavBox.check_keybd() takes them from key_queue instead of pygame.event.get().
+
+    the snapshot is guarded by a sequence number (odd while it is written), so the renderer never
+    shows a half-written snapshot.
+
+    usage of the renderer process:
+        python StatusDisplay.py <shared memory name> <max_points> <fps> <caption> <speed points> <speed window>
+
+"""
+import os
+import queue
+import subprocess
+import sys
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+from threading import Thread
+
+import numpy as np
+
+KeyEvent = namedtuple("KeyEvent", ["type", "key"])
+
+MAX_OUTCOMES = 16
+STATUS_LENGTH = 512
+KEY_POLL_FPS = 50  # renderer loop rate, the figure itself is redrawn at the fps given to StatusDisplay
+
+
+def snapshot_dtype(max_points, speed_points=0):
+    points = max_points + 1  # the decimated points + the newest one
+    return np.dtype([
+        ("seq", np.uint64),
+        ("sizes", np.int64, (2,)),
+        ("time", np.float64, (2, points)),
+        ("count", np.float64, (2, points)),
+        ("n_outcomes", np.int64),
+        ("outcome_names", "S32", (MAX_OUTCOMES,)),
+        ("outcome_counts", np.int64, (MAX_OUTCOMES,)),
+        ("speed_time", np.float64, (speed_points,)),
+        ("speed", np.float64, (speed_points,)),
+        ("status", "S%d" % STATUS_LENGTH),
+        ("licks", "S%d" % STATUS_LENGTH),
+    ])
+
+
+class StatusDisplay(object):
+    """Task process side: publishes snapshots, starts/stops the renderer and queues its key events."""
+
+    def __init__(self, session_info, max_points=200, fps=5, treadmill_trace=None):
+        self.max_points = max_points
+        # running speed panel: the renderer only needs the layout of the trace
+        speed_points = treadmill_trace.points if treadmill_trace is not None else 0
+        speed_window = treadmill_trace.window if treadmill_trace is not None else 0
+        self.dtype = snapshot_dtype(max_points, speed_points)
+        self._memory = shared_memory.SharedMemory(create=True, size=self.dtype.itemsize)
+        self.snapshot = np.ndarray((), dtype=self.dtype, buffer=self._memory.buf)
+        self.snapshot[()] = np.zeros((), dtype=self.dtype)
+        self.key_queue = queue.Queue()
+        self.publish_count = 0
+
+        self._process = subprocess.Popen(
+            [sys.executable, "-u", os.path.abspath(__file__), self._memory.name, str(max_points), str(fps),
+             str(session_info.get("box_name", "behavbox")), str(speed_points), str(speed_window)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True,
+        )
+        self._reader_thread = Thread(target=self._read_keys, daemon=True)
+        self._reader_thread.start()
+
+    def _read_keys(self):
+        for line in self._process.stdout:
+            fields = line.split()
+            if len(fields) == 3 and fields[0] == "key":
+                self.key_queue.put(KeyEvent(int(fields[1]), int(fields[2])))
+
+    def key_events(self):
+        """All key events received since the last call, oldest first."""
+        events = []
+        while True:
+            try:
+                events.append(self.key_queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def publish(self, live_plot, status=""):
+        """Copy the LivePlot data and a status text into the shared snapshot; nothing once closed."""
+        snapshot = self.snapshot
+        if snapshot is None:
+            return  # e.g. a state entered by a timeout still armed after video_stop()
+        snapshot["seq"] += 1  # odd: being written
+        for side, trajectory in enumerate(live_plot.trajectories):
+            time, count = trajectory.data()
+            size = min(len(time), self.max_points + 1)
+            snapshot["time"][side, :size] = time[-size:]
+            snapshot["count"][side, :size] = count[-size:]
+            snapshot["sizes"][side] = size
+        n_outcomes = min(len(live_plot.outcomes), MAX_OUTCOMES)
+        snapshot["n_outcomes"] = n_outcomes
+        snapshot["outcome_names"][:n_outcomes] = [name.encode()[:32] for name in live_plot.outcomes[:n_outcomes]]
+        snapshot["outcome_counts"][:n_outcomes] = live_plot.outcome_counts[:n_outcomes]
+        if live_plot.treadmill_trace is not None:
+            snapshot["speed_time"] = live_plot.speed_time
+            snapshot["speed"] = live_plot.speed
+        snapshot["status"] = status.encode()[:STATUS_LENGTH]
+        snapshot["licks"] = live_plot.lick_text.encode()[:STATUS_LENGTH]
+        snapshot["seq"] += 1  # even: complete
+        self.publish_count += 1
+
+    def close(self):
+        if self.snapshot is None:
+            return  # already closed, e.g. a second end_session()
+        try:
+            self._process.stdin.write("quit\n")
+            self._process.stdin.flush()
+            self._process.wait(5)
+        except Exception:  # the renderer is stuck or already gone
+            self._process.kill()
+        self.snapshot = None
+        self._memory.close()
+        self._memory.unlink()
+
+
+def read_snapshot(snapshot):
+    """Consistent copy of the shared snapshot, or None while it is being written."""
+    for _ in range(10):
+        seq = int(snapshot["seq"])
+        if seq % 2:
+            continue
+        copy = snapshot.copy()
+        if int(snapshot["seq"]) == seq:
+            return copy
+    return None
+
+
+###############################################################################################
+# renderer process
+###############################################################################################
+class RendererWindow(object):
+    """The pygame window of the renderer process; plays the role of the box for LivePlot."""
+
+    status_display = None
+
+    def __init__(self, caption):
+        import pygame
+        self.pygame = pygame
+        pygame.init()
+        self.main_display = pygame.display.set_mode((800, 600))
+        pygame.display.set_caption(caption)
+        self.main_display.fill((255, 255, 255))
+        pygame.display.update()
+        self.font = pygame.font.Font(None, 18)
+        self.status = ""
+
+    def check_plot(self, figure):
+        figure.canvas.draw()
+        self.main_display.blit(figure, (0, 0))
+        rects = figure.canvas.pop_dirty_rects()
+        rects.append(self.draw_status())
+        self.pygame.display.update(rects)
+
+    def draw_status(self):
+        text_surface = self.font.render(self.status, True, (0, 0, 0), (255, 255, 255))
+        line = self.pygame.Rect(0, self.main_display.get_height() - text_surface.get_height() - 5,
+                                self.main_display.get_width(), text_surface.get_height())
+        self.main_display.fill((255, 255, 255), line)
+        self.main_display.blit(text_surface, (5, line.y))
+        return line
+
+
+def _watch_stdin(stop):
+    for line in sys.stdin:
+        if line.strip() == "quit":
+            break
+    stop.append(True)
+
+
+def run_renderer(memory_name, max_points, fps, caption, speed_points=0, speed_window=0.0):
+    import LivePlot
+    import TreadmillTrace
+    memory = shared_memory.SharedMemory(name=memory_name)
+    # the block belongs to the task process, which unlinks it; don't let this process' resource
+    # tracker unlink it as well when the renderer exits
+    resource_tracker.unregister(memory._name, "shared_memory")
+    snapshot = np.ndarray((), dtype=snapshot_dtype(max_points, speed_points), buffer=memory.buf)
+    window = RendererWindow(caption)
+    pygame = window.pygame
+    # room for the max_points + 1 points of the snapshot, the renderer never decimates itself;
+    # the speed samples come from the snapshot too, the trace only sets up the panel
+    trace = TreadmillTrace.TreadmillTrace(speed_window, speed_points, capacity=2) if speed_points else None
+    plot = LivePlot.LivePlot(window, max_points + 2, treadmill_trace=trace)
+    clock = pygame.time.Clock()
+    stop = []
+    Thread(target=_watch_stdin, args=(stop,), daemon=True).start()
+
+    last_seq = 0
+    last_render = 0
+    render_interval = int(1000 / fps)  # ms
+    while not stop:
+        # keys are polled at KEY_POLL_FPS, the figure is redrawn at most at fps
+        for event in pygame.event.get():
+            if event.type in (pygame.KEYDOWN, pygame.KEYUP):
+                print("key %d %d" % (event.type, event.key), flush=True)
+        if pygame.time.get_ticks() - last_render >= render_interval:
+            state = read_snapshot(snapshot)
+            if state is not None and int(state["seq"]) != last_seq:
+                last_seq = int(state["seq"])
+                last_render = pygame.time.get_ticks()
+                load_snapshot(plot, state)
+                window.status = state["status"].item().decode()
+                plot.redraw()
+        clock.tick(KEY_POLL_FPS)
+    snapshot = None
+    memory.close()
+    pygame.quit()
+
+
+def load_snapshot(plot, state):
+    """Put the data of a snapshot into the renderer's LivePlot."""
+    for side, trajectory in enumerate(plot.trajectories):
+        size = int(state["sizes"][side])
+        trajectory.time[:size] = state["time"][side, :size]
+        trajectory.count[:size] = state["count"][side, :size]
+        trajectory.size = size
+        trajectory.total = int(state["count"][side, size - 1]) if size else 0
+        trajectory.last_time = float(state["time"][side, size - 1]) if size else 0.0
+    n_outcomes = int(state["n_outcomes"])
+    outcomes = [name.decode() for name in state["outcome_names"][:n_outcomes].tolist()]
+    for outcome in outcomes[len(plot.outcomes):]:
+        plot.add_outcome(outcome)  # new bars
+    plot.outcome_counts[:n_outcomes] = state["outcome_counts"][:n_outcomes]
+    if plot.treadmill_trace is not None:
+        plot.speed_time = state["speed_time"].copy()
+        plot.speed = state["speed"].copy()
+    plot.lick_text = state["licks"].item().decode()
+
+
+if __name__ == "__main__":
+    run_renderer(sys.argv[1], int(sys.argv[2]), float(sys.argv[3]), sys.argv[4], int(sys.argv[5]), float(sys.argv[6]))
@@ -0,0 +1,103 @@
+# python3: TaskDispatcher.py
+"""
+name: TaskDispatcher.py
+goal: event-driven replacement for the `while task.trial_running: task.run()` spin in the run scripts
+description:
+    the dispatcher sleeps on the box event ring until something happens and only then hands it to
+    the task. it is woken up by:
+        - a hardware event written into box.event_ring by the gpiozero callbacks
+        - a new treadmill sample (Treadmill.on_sample), unless the task sets
+          wake_on_treadmill_sample = False because it subscribes to distance thresholds instead
+          (Treadmill.subscribe_distance(), the crossing arrives as a treadmill_threshold event)
+        - a state change of the task state machine, which includes the Timeout states expiring
+          (their timer thread triggers the transition)
+        - the keyboard poll interval, while the pygame key capture window is active (not with a
+          virtual clock, where the keyboard is not polled)
+    tasks that define handle_event(event) get every event record from the ring (and None when they
+    were woken up without a new event). any other task keeps working unchanged: its run() method is
+    called once per wake-up and again for every pending event.
+    a task can also define idle() for work that must not delay an event (e.g. refreshing a plot):
+    it is called at most every keyboard_interval s, and only once the ring is empty.
+
+"""
+import BoxClock
+
+
+class TaskDispatcher(object):
+    def __init__(self, task, keyboard_interval=0.02, idle_timeout=0.5):
+        self.task = task
+        self.box = task.box
+        self.ring = self.box.event_ring
+        self.clock = BoxClock.get_clock()
+        self.keyboard_interval = keyboard_interval  # s between two pygame keyboard polls
+        self.idle_timeout = idle_timeout  # s, upper bound on a single sleep when nothing else is due
+
+        self._native = callable(getattr(task, "handle_event", None))
+        idle = getattr(task, "idle", None)
+        self._idle = idle if callable(idle) else None
+
+        # dispatcher statistics
+        self.wakeup_count = 0
+        self.event_count = 0
+
+        # wake up on every treadmill sample
+        treadmill = getattr(self.box, "treadmill", False)
+        if treadmill and getattr(task, "wake_on_treadmill_sample", True):
+            treadmill.on_sample = self.ring.notify
+
+        # wake up on every state change, including the ones triggered by a Timeout state
+        machine = getattr(task, "machine", None)
+        if machine is not None:
+            machine.after_state_change = machine.after_state_change + [self._on_state_change]
+
+    def _on_state_change(self, *args, **kwargs):
+        self.ring.notify()
+
+    def wake(self):
+        """Wake up the dispatcher from any thread."""
+        self.ring.notify()
+
+    def run_trial(self):
+        """Dispatch events to the task until task.trial_running goes False."""
+        next_keyboard = next_idle = self.clock.monotonic()
+        while self.task.trial_running:
+            keyboard = getattr(self.box, "keyboard_active", False) and not self.clock.is_virtual
+            if keyboard:
+                timeout = min(max(next_keyboard - self.clock.monotonic(), 0), self.idle_timeout)
+            else:
+                timeout = self.idle_timeout
+            self.ring.wait(timeout)
+            self.wakeup_count += 1
+            self.dispatch()
+
+            if keyboard and self.clock.monotonic() >= next_keyboard:
+                if self._native:
+                    # run() based tasks poll the keyboard themselves
+                    self.box.check_keybd()
+                next_keyboard = self.clock.monotonic() + self.keyboard_interval
+
+            if (self._idle is not None and self.task.trial_running and not self.ring
+                    and self.clock.monotonic() >= next_idle):
+                self._idle()
+                next_idle = self.clock.monotonic() + self.keyboard_interval
+
+    def dispatch(self):
+        """Hand all pending events to the task."""
+        if self._native:
+            event = self.ring.pop()
+            if event is None:
+                self.task.handle_event(None)
+            while event is not None:
+                self.event_count += 1
+                self.task.handle_event(event)
+                if not self.task.trial_running:
+                    break
+                event = self.ring.pop()
+        else:
+            # compatibility shim: run() pops at most one event per call
+            pending = len(self.ring)
+            self.task.run()
+            self.event_count += min(pending, 1)
+            while self.ring and self.task.trial_running:
+                self.task.run()
+                self.event_count += 1
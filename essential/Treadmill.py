@@ -20,34 +20,97 @@ def dacval():
 """
 
 # import datetime as dt
-import io
-from threading import Thread, Event
-import subprocess
-import smbus
-import time
+import itertools
+import math
+import os
+from collections import namedtuple
+from threading import Thread, Event, Lock
 import struct
 
+import numpy as np
+
+import BoxClock
+import EventRing
+import I2CBus
+import LatencyMonitor
+import TreadmillKinematics
+import TreadmillLog
+import TreadmillTrace
+
+# monotonic: s, midpoint of the I2C read; time: wall clock s (for the csv output)
+# speed (cm/s) and acceleration (cm/s^2): causal estimate at the sample, nan until the filter is full
+TreadmillSample = namedtuple("TreadmillSample", ["monotonic", "time", "distance_bit", "distance_cm",
+                                                 "speed", "acceleration"])
+
 
 def dacval(bus, address):
-    try:
-        block = bus.read_i2c_block_data(address, 1)
-        distance = struct.unpack("<f", bytes(block[:4]))[0]
-    except IOError:
-        subprocess.call(['i2cdetect', '-y', '1'])
-        block = bus.read_i2c_block_data(address, 1)
-        distance = struct.unpack("<f", bytes(block[:4]))[0]
-    return distance
+    # an IOError is retried with backoff by the I2CBus, and raised if the read keeps failing
+    block = bus.read_i2c_block_data(address, 1, 4)
+    return struct.unpack("<f", bytes(block[:4]))[0]
+
+
+class JitterStats(object):
+    """Lateness of the samples behind their deadlines, in the log-spaced bins of LatencyMonitor."""
+
+    def __init__(self):
+        self.histogram = np.zeros(LatencyMonitor.N_BINS, dtype=np.int64)
+        self.count = 0
+        self.missed = 0  # deadlines skipped because a read overran a whole period
+        self.max_ns = 0
+        self._sum_ns = 0
+
+    def record(self, late_ns):
+        late_ns = max(late_ns, 0)
+        self.histogram[int(np.searchsorted(LatencyMonitor.BIN_EDGES_NS, late_ns))] += 1
+        self.count += 1
+        self._sum_ns += late_ns
+        if late_ns > self.max_ns:
+            self.max_ns = late_ns
+
+    def percentile(self, q):
+        """Upper bound (ns) of the bin holding the q-th percentile, nan without samples."""
+        if self.count == 0:
+            return math.nan
+        index = int(np.searchsorted(np.cumsum(self.histogram), q / 100.0 * self.count))
+        return min(LatencyMonitor.BIN_EDGES_NS[index], float(self.max_ns))
+
+    def summary_text(self):
+        if self.count == 0:
+            return "treadmill jitter: no samples yet"
+        return "treadmill jitter n=%d mean/p99/max ms: %.3f/%.3f/%.3f, missed %d" % (
+            self.count, self._sum_ns / self.count / 1e6, self.percentile(99) / 1e6, self.max_ns / 1e6,
+            self.missed)
+
+
+class DistanceSubscription(object):
+    """A pending distance threshold of Treadmill.subscribe_distance(); cancel() withdraws it.
+
+    its treadmill_threshold event carries the subscription id in the event's tag, so an event that
+    was already queued when the subscription was cancelled can be told from a current one.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, treadmill, target_cm):
+        self.treadmill = treadmill
+        self.target_cm = target_cm
+        self.id = next(DistanceSubscription._ids)
+        self.crossed_sample = None  # the TreadmillSample that reached the target
+
+    def cancel(self):
+        self.treadmill._remove_subscription(self)
 
 
 class Treadmill(object):
-    def __init__(self, session_info):
+    def __init__(self, session_info, bus=None):
         try:
             self.session_info = session_info
         except:
             self.close()
             raise
         self.treadmill_calibrate = 9.14  # bit per cm
-        self.bus = smbus.SMBus(1)  # "On all recent (since 2014) raspberries the GPIO pin's I2C device is /dev/i2c-1"
+        if bus is None:
+            bus = I2CBus.I2CBus()
+        self.bus = bus  # normally the box's shared I2CBus; anything with read_i2c_block_data() works
         # This is the address we setup in the Arduino Program
         self.address = 0x08
         self.treadmill_filename = self.session_info['basedir'] + "/" + self.session_info['basename'] + "/" + \
@@ -55,17 +118,45 @@ class Treadmill(object):
         print(self.treadmill_filename)
 
         self._dacval_thread = None
+        self._sample_timer = None  # pending sample on a virtual clock
         self._running = False
+        self.clock = BoxClock.get_clock()
 
-        self.treadmill_log = []
-        self.delay = 0.3
+        # samples are streamed to <...>_treadmill_output.bin while the session runs, the csv is
+        # exported from it in treadmill_flush()
+        self.treadmill_log = TreadmillLog.TreadmillLog(os.path.splitext(self.treadmill_filename)[0])
+        # samples are taken on a fixed grid of absolute deadlines, so the I2C read time does not
+        # add up to a drift
+        self.rate = self.session_info.get("treadmill_rate", 100)  # Hz
+        self.delay = 1.0 / self.rate
+        self.jitter = JitterStats()
+        self._latest = None  # TreadmillSample, replaced (never mutated) by every sample
+        # running speed and acceleration of every sample, see TreadmillKinematics
+        self.kinematics = TreadmillKinematics.TreadmillKinematics(**self.session_info.get("treadmill_kinematics", {}))
+        # recent samples for the live running speed panel (LivePlot); unless set, the buffer holds
+        # the whole window at the sampling rate
+        trace_setup = dict(self.session_info.get("treadmill_trace", {}))
+        trace_setup.setdefault("capacity", TreadmillTrace.capacity_for(
+            trace_setup.get("window", TreadmillTrace.DEFAULT_WINDOW), self.rate))
+        self.trace = TreadmillTrace.TreadmillTrace(**trace_setup)
 
         self.distance_bit = None
         self.distance_cm = None
 
+        self.on_sample = None  # optional callable run after every new sample (e.g. to wake up the task loop)
+        self.event_ring = None  # box.event_ring, gets a treadmill_threshold event per crossed subscription
+        self._subscriptions = []
+        self._subscription_lock = Lock()
+
     def start(self, background=True):
         self._stop_dacval()
+        self.treadmill_log.start()
         self._running = True
+        if self.clock.is_virtual:
+            # the samples are scheduled on the virtual clock instead of running in a thread
+            self._deadline = self.clock.monotonic() + self.delay
+            self._sample_timer = self.clock.call_later(self.delay, self._sample_virtual)
+            return
         self._dacval_thread = Thread(target=self.run)
         self._dacval_thread.stopping = Event()
         self._dacval_thread.start()
@@ -76,47 +167,119 @@ class Treadmill(object):
 
     def close(self):
         try:
-            self._dacval_thread.stopping.set()
-            print("Attempts to close the treadmill thread!")
-            self._dacval_thread.join(5)
-            self._dacval_thread = None
+            if self._dacval_thread is not None:
+                self._dacval_thread.stopping.set()
+                print("Attempts to close the treadmill thread!")
+                self._dacval_thread.join(5)
+                self._dacval_thread = None
             self._stop_dacval()
             self.treadmill_flush()
-        except:
-            pass
+        except Exception as error_message:
+            # the samples written so far stay in the .bin file, see TreadmillLog.py to export them
+            print("treadmill close issue\n")
+            print(str(error_message))
 
     def _stop_dacval(self):
         print("Entered _stop_dacval")
         self._running = False
+        if self._sample_timer is not None:
+            self._sample_timer.cancel()
+            self._sample_timer = None
         # if getattr(self, '_stop_dacval', None):
         #     print("enter _stop_dacval.stop()")
         #     self._dacval_thread.stop()
         # self._dacval_thread = None
 
     def run(self):
+        stopping = self._dacval_thread.stopping
+        deadline = self.clock.monotonic() + self.delay
         while self._running == True:
-            time.sleep(self.delay)
+            # wait for the absolute deadline, not for delay after the previous read
+            if self.clock.wait(stopping, max(deadline - self.clock.monotonic(), 0)):
+                break
+            self.sample(deadline)
+            deadline = self._next_deadline(deadline)
+
+    def _sample_virtual(self):
+        if self._running:
+            self.sample(self._deadline)
+            self._deadline = self._next_deadline(self._deadline)
+            self._sample_timer = self.clock.call_later(max(self._deadline - self.clock.monotonic(), 0),
+                                                       self._sample_virtual)
+
+    def _next_deadline(self, deadline):
+        """The next deadline on the grid; deadlines already passed (a slow read) are skipped."""
+        deadline += self.delay
+        behind = self.clock.monotonic() - deadline
+        if behind > 0:
+            skipped = int(behind // self.delay) + 1
+            self.jitter.missed += skipped
+            deadline += skipped * self.delay
+        return deadline
+
+    def sample(self, deadline=None):
+        read_start = self.clock.monotonic()
+        try:
             self.distance_bit = dacval(self.bus, self.address)
-            self.distance_cm = self.distance_bit / self.treadmill_calibrate
-            self.treadmill_log.append(
-                (time.time(),
-                 self.distance_bit,
-                 self.distance_cm)
-            )
-
-    # save the element list
-    def treadmill_flush(self):
-        print("Flushing: " + self.treadmill_filename)
-        with io.open(self.treadmill_filename, 'w') as f:
-            f.write('time.time(), distance_bit, distance_cm\n')
-            for entry in self.treadmill_log:
-                f.write('%f, %f, %f\n' % entry)
+        except IOError:
+            return  # counted by the I2CBus, the next deadline reads again
+        read_end = self.clock.monotonic()
+        self.distance_cm = self.distance_bit / self.treadmill_calibrate
+        monotonic = (read_start + read_end) / 2
+        _, speed, acceleration = self.kinematics.update(monotonic, self.distance_cm)
+        sample = TreadmillSample(monotonic, self.clock.time(), self.distance_bit, self.distance_cm, speed, acceleration)
+        self._latest = sample
+        if deadline is not None:
+            self.jitter.record(int((read_start - deadline) * 1e9))
+        self.treadmill_log.add(sample.time, sample.monotonic, sample.distance_bit, sample.distance_cm)
+        self.trace.add(sample.monotonic, sample.distance_cm)
+        if self._subscriptions:
+            self._check_subscriptions(sample)
+        if self.on_sample is not None:
+            self.on_sample()
 
+    ###############################################################################################
+    # distance thresholds
+    ###############################################################################################
+    def subscribe_distance(self, advance_cm, baseline_cm=None):
+        """Push one treadmill_threshold event into event_ring once the distance advanced advance_cm.
 
-"""
-for each element in the element_list, calculate the consecutive differences
-for the consecutive differences, we can yield a velocity of the displacment
-And from the velocity of the displacement we can get the direction and the acceleration
+        the distance is counted from baseline_cm (default: the latest sample). the event carries the
+        time of the first sample at or past the target, and the subscription ends with it.
+        """
+        if baseline_cm is None:
+            sample = self._latest
+            baseline_cm = sample.distance_cm if sample is not None else 0.0
+        subscription = DistanceSubscription(self, baseline_cm + advance_cm)
+        with self._subscription_lock:
+            self._subscriptions = self._subscriptions + [subscription]
+        return subscription
+
+    def _remove_subscription(self, subscription):
+        with self._subscription_lock:
+            self._subscriptions = [other for other in self._subscriptions if other is not subscription]
+
+    def _check_subscriptions(self, sample):
+        with self._subscription_lock:
+            crossed = [subscription for subscription in self._subscriptions
+                       if sample.distance_cm >= subscription.target_cm]
+            if not crossed:
+                return
+            self._subscriptions = [other for other in self._subscriptions if other not in crossed]
+        for subscription in crossed:
+            subscription.crossed_sample = sample
+            if self.event_ring is not None:
+                self.event_ring.push(EventRing.TREADMILL, EventRing.THRESHOLD,
+                                     monotonic_ns=int(sample.monotonic * 1e9), wall_ns=int(sample.time * 1e9),
+                                     tag=subscription.id)
+
+    def latest(self):
+        """Newest TreadmillSample (None before the first one); never waits for the sampler."""
+        return self._latest
+
+    # close the streamed log and export it as csv
+    def treadmill_flush(self):
+        print("Flushing: " + self.treadmill_filename)
+        self.treadmill_log.close()
+        self.treadmill_log.export_csv(self.treadmill_filename)
 
-The problem that need to take into consideration
-"""
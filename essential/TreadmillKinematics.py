@@ -0,0 +1,151 @@
+# python3: TreadmillKinematics.py
+"""
+name: TreadmillKinematics.py
+goal: running speed and acceleration of the treadmill, online for the task and offline for analysis
+description:
+    causal Savitzky-Golay estimate: a polynomial of degree `order` is least-squares fitted to the
+    last `window` (time, distance) samples and evaluated at the newest sample, which gives the
+    smoothed distance, the speed (1st derivative, cm/s, negative when running backwards) and the
+    acceleration (2nd derivative, cm/s^2). only past samples are used, so the online value never
+    waits for future samples; the delay it adds is about window / 2 samples.
+    the fit uses the actual sample times instead of assuming a fixed rate, so samples skipped by a
+    slow I2C read and old csv files with irregular sampling give the right units.
+
+    TreadmillKinematics.update() runs the fit for one new sample on a small ring buffer (O(window),
+    plain python), kinematics() runs the same fit for every sample of a whole trace at once (numpy,
+    in blocks), so the online and offline values of a session agree up to rounding. the first window - 1 samples have
+    no estimate (nan).
+
+    usage:
+        python TreadmillKinematics.py <basename>_treadmill_output.csv [<output>.csv]
+
+"""
+import io
+import math
+import operator
+import os
+import sys
+
+import numpy as np
+
+BLOCK = 65536  # samples fitted at once by kinematics(), bounds the temporary memory
+
+
+def _fit(time, distance, order):
+    """(distance, speed, acceleration) at the last sample of every row of time/distance (n, window)."""
+    # relative to the newest sample, which keeps the normal equations well conditioned
+    tau = time - time[:, -1:]  # s, <= 0
+    offset = distance[:, -1:]
+    powers = np.empty(tau.shape + (2 * order + 1,))  # (n, window, 2 * order + 1): tau^0, tau^1, ...
+    powers[..., 0] = 1.0
+    for exponent in range(1, 2 * order + 1):
+        np.multiply(powers[..., exponent - 1], tau, out=powers[..., exponent])  # faster than ** for tau < 0
+    sums = powers.sum(axis=1)
+    exponents = np.arange(order + 1)
+    normal = sums[:, exponents[:, None] + exponents]  # (n, order + 1, order + 1), sum of tau^(i + j)
+    moments = np.einsum("nwi,nw->ni", powers[..., :order + 1], distance - offset)
+    try:
+        coefficients = np.linalg.solve(normal, moments[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        # windows without enough distinct sample times have no estimate
+        singular = np.linalg.matrix_rank(normal) < order + 1
+        normal[singular] = np.eye(order + 1)
+        coefficients = np.linalg.solve(normal, moments[..., None])[..., 0]
+        coefficients[singular] = np.nan
+    acceleration = 2 * coefficients[:, 2] if order >= 2 else np.zeros(len(tau))
+    return coefficients[:, 0] + offset[:, 0], coefficients[:, 1], acceleration
+
+
+def kinematics(time, distance, window=15, order=2):
+    """(distance, speed, acceleration) arrays for every sample of a trace, nan for the first window - 1."""
+    time = np.asarray(time, dtype=np.float64)
+    distance = np.asarray(distance, dtype=np.float64)
+    result = np.full((3, len(time)), np.nan)
+    if len(time) < window:
+        return result[0], result[1], result[2]
+    time_windows = np.lib.stride_tricks.sliding_window_view(time, window)
+    distance_windows = np.lib.stride_tricks.sliding_window_view(distance, window)
+    for start in range(0, len(time_windows), BLOCK):
+        end = min(start + BLOCK, len(time_windows))
+        result[:, window - 1 + start:window - 1 + end] = _fit(
+            time_windows[start:end], distance_windows[start:end], order)
+    return result[0], result[1], result[2]
+
+
+def kinematics_from_csv(filename, window=15, order=2):
+    """(time, distance, speed, acceleration) of a treadmill csv (time.time(), distance_bit, distance_cm)."""
+    data = np.loadtxt(filename, delimiter=",", skiprows=1, ndmin=2)
+    if data.shape[0] == 0:
+        return (np.zeros(0),) * 4
+    time = data[:, 0]
+    return (time,) + kinematics(time, data[:, 2], window, order)
+
+
+def _fit_one(time, distance, order):
+    """_fit() for a single window in plain python, about half the time of _fit() for one row."""
+    last_time, last_distance = time[-1], distance[-1]
+    size = order + 1
+    taus = [sample_time - last_time for sample_time in time]
+    deltas = [sample_distance - last_distance for sample_distance in distance]
+    sums = []
+    moments = []
+    powers = [1.0] * len(taus)
+    for exponent in range(2 * order + 1):
+        sums.append(sum(powers))
+        if exponent < size:
+            moments.append(sum(map(operator.mul, powers, deltas)))
+        powers = list(map(operator.mul, powers, taus))
+    # gaussian elimination with partial pivoting on the (order + 1)^2 normal equations
+    rows = [[sums[i + j] for j in range(size)] + [moments[i]] for i in range(size)]
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda row: abs(rows[row][column]))
+        if rows[pivot][column] == 0.0:
+            return math.nan, math.nan, math.nan  # no distinct sample times in the window
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        for row in range(column + 1, size):
+            factor = rows[row][column] / rows[column][column]
+            for j in range(column, size + 1):
+                rows[row][j] -= factor * rows[column][j]
+    coefficients = [0.0] * size
+    for row in reversed(range(size)):
+        coefficients[row] = (rows[row][size] - sum(rows[row][j] * coefficients[j]
+                                                   for j in range(row + 1, size))) / rows[row][row]
+    return (coefficients[0] + last_distance, coefficients[1] if order >= 1 else 0.0,
+            2 * coefficients[2] if order >= 2 else 0.0)
+
+
+class TreadmillKinematics(object):
+    """Online causal Savitzky-Golay fit over the last `window` samples, fed by Treadmill.sample()."""
+
+    def __init__(self, window=15, order=2):
+        self.window = window
+        self.order = order
+        # every sample is written twice, window apart, so the last window samples are always one
+        # contiguous slice of the buffer
+        self._time = [0.0] * (2 * window)
+        self._distance = [0.0] * (2 * window)
+        self.count = 0
+        self.distance = self.speed = self.acceleration = math.nan
+
+    def update(self, time, distance):
+        """Add a sample (s, cm); return the (distance, speed, acceleration) estimate at it."""
+        index = self.count % self.window
+        self._time[index] = self._time[index + self.window] = time
+        self._distance[index] = self._distance[index + self.window] = distance
+        self.count += 1
+        if self.count >= self.window:
+            start = index + 1
+            self.distance, self.speed, self.acceleration = _fit_one(
+                self._time[start:start + self.window], self._distance[start:start + self.window], self.order)
+        return self.distance, self.speed, self.acceleration
+
+
+if __name__ == "__main__":
+    csv_filename = sys.argv[1]
+    output_filename = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(csv_filename)[0] + "_kinematics.csv"
+    time, distance, speed, acceleration = kinematics_from_csv(csv_filename)
+    with io.open(output_filename, "w") as f:
+        f.write("time.time(), distance_cm, speed_cm_s, acceleration_cm_s2\n")
+        for row in zip(time, distance, speed, acceleration):
+            f.write('%f, %f, %f, %f\n' % row)
+    print("wrote %d samples to %s" % (len(time), output_filename))
@@ -0,0 +1,192 @@
+# python3: TreadmillLog.py
+"""
+name: TreadmillLog.py
+goal: write the treadmill samples to disk while the session runs, in bounded memory and crash-safe
+description:
+    add() only appends the sample to a deque and returns. a background writer thread drains the
+    queue every flush_interval seconds and appends the samples to <basename>.bin as one chunk:
+        chunk header: magic, number of records, crc32 of the records
+        records: wall time (s), monotonic (ns), distance_bit, distance_cm
+    the file is fsync'ed at most every fsync_interval seconds, so a power loss loses at most that
+    much of the trace. a chunk that was only partly written (crash, power loss) fails its length
+    or crc check: read_samples() stops before it and recover() truncates the file to the last
+    complete chunk, so the writer can append to it again.
+    export_csv() writes the usual '<basename>.csv' layout (time.time(), distance_bit, distance_cm).
+
+    with a VirtualClock the flushes are scheduled on the clock instead of the writer thread, so the
+    chunks, and the file, of two runs with the same seeds are the same.
+
+    usage, e.g. after a crash:
+        python TreadmillLog.py <basename>.bin [<output>.csv]
+
+"""
+import io
+import os
+import struct
+import sys
+import zlib
+from collections import deque
+from threading import Thread, Event
+
+import BoxClock
+
+MAGIC = b"TRDM"
+CHUNK_HEADER = struct.Struct("<4sII")  # magic, record count, crc32 of the records
+# wall time s, monotonic ns, distance_bit, distance_cm
+RECORD = struct.Struct("<dqdd")
+CSV_HEADER = "time.time(), distance_bit, distance_cm\n"
+
+
+class TreadmillLog(object):
+    def __init__(self, basename, flush_interval=0.5, fsync_interval=5.0, max_pending=65536):
+        self.basename = basename
+        self.binary_filename = basename + ".bin"
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.max_pending = max_pending  # samples queued at most, if the writer falls behind
+        self.clock = BoxClock.get_clock()
+
+        self._queue = deque()
+        self._file = None
+        self._writer_thread = None
+        self._flush_timer = None  # VirtualClock only
+        self._stopping = Event()
+        self._closed = False
+        self._unsynced_flushes = 0
+
+        self.record_count = 0
+        self.chunk_count = 0
+        self.dropped_count = 0  # samples not queued because max_pending were waiting
+
+    def start(self):
+        if self._file is not None:
+            return  # already writing
+        if os.path.exists(self.binary_filename):
+            recover(self.binary_filename)  # never append behind a torn chunk
+        self._file = io.open(self.binary_filename, "ab")
+        self._stopping.clear()
+        if self.clock.is_virtual:
+            self._flush_timer = self.clock.call_later(self.flush_interval, self._flush_tick)
+            return
+        self._writer_thread = Thread(target=self._write_loop, daemon=True)
+        self._writer_thread.start()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._stopping.set()
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self._writer_thread is not None:
+            self._writer_thread.join(5)
+            self._writer_thread = None
+        self.flush()
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    ###############################################################################################
+    # producer side - the treadmill sampler thread
+    ###############################################################################################
+    def add(self, wall_time, monotonic, distance_bit, distance_cm):
+        if self._closed:
+            return
+        if len(self._queue) >= self.max_pending:
+            self.dropped_count += 1
+            return
+        self._queue.append((wall_time, int(monotonic * 1e9), distance_bit, distance_cm))
+
+    ###############################################################################################
+    # writer side - background thread
+    ###############################################################################################
+    def _write_loop(self):
+        while not self._stopping.wait(self.flush_interval):
+            self.flush()
+
+    def _flush_tick(self):
+        # VirtualClock: the same flush_interval, in simulated time
+        if self._stopping.is_set():
+            return
+        self.flush()
+        self._flush_timer = self.clock.call_later(self.flush_interval, self._flush_tick)
+
+    def flush(self):
+        queue = self._queue
+        count = len(queue)
+        if count == 0 or self._file is None:
+            return
+        records = bytearray(count * RECORD.size)
+        offset = 0
+        for _ in range(count):
+            RECORD.pack_into(records, offset, *queue.popleft())
+            offset += RECORD.size
+        # header and records in one write: a torn chunk is always the last one in the file
+        self._file.write(CHUNK_HEADER.pack(MAGIC, count, zlib.crc32(records)) + records)
+        self._file.flush()
+        self.record_count += count
+        self.chunk_count += 1
+        self._unsynced_flushes += 1
+        if self._unsynced_flushes * self.flush_interval >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._unsynced_flushes = 0
+
+    def export_csv(self, filename=None):
+        if filename is None:
+            filename = self.basename + ".csv"
+        return export_csv(self.binary_filename, filename)
+
+
+def _chunks(data):
+    """Yield (end offset, records bytes) of every complete, valid chunk from the start of data."""
+    offset = 0
+    while offset + CHUNK_HEADER.size <= len(data):
+        magic, count, crc = CHUNK_HEADER.unpack_from(data, offset)
+        start = offset + CHUNK_HEADER.size
+        end = start + count * RECORD.size
+        if magic != MAGIC or end > len(data) or zlib.crc32(data[start:end]) != crc:
+            return
+        yield end, data[start:end]
+        offset = end
+
+
+def read_samples(binary_filename):
+    """Yield (wall time, monotonic_ns, distance_bit, distance_cm) of the complete chunks."""
+    with io.open(binary_filename, "rb") as f:
+        data = f.read()
+    for _, records in _chunks(data):
+        for record in RECORD.iter_unpack(records):
+            yield record
+
+
+def recover(binary_filename):
+    """Truncate a partly written last chunk; return the number of bytes removed."""
+    with io.open(binary_filename, "rb") as f:
+        data = f.read()
+    valid = 0
+    for valid, _ in _chunks(data):
+        pass
+    if valid < len(data):
+        with io.open(binary_filename, "r+b") as f:
+            f.truncate(valid)
+    return len(data) - valid
+
+
+def export_csv(binary_filename, filename):
+    """Write the samples in the treadmill csv layout; return the number of samples."""
+    count = 0
+    with io.open(filename, "w") as f:
+        f.write(CSV_HEADER)
+        for wall_time, _, distance_bit, distance_cm in read_samples(binary_filename):
+            f.write('%f, %f, %f\n' % (wall_time, distance_bit, distance_cm))
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    binary_filename = sys.argv[1]
+    csv_filename = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(binary_filename)[0] + ".csv"
+    print("removed %d bytes of a partly written chunk" % recover(binary_filename))
+    print("exported %d samples to %s" % (export_csv(binary_filename, csv_filename), csv_filename))
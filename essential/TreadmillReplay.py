@@ -0,0 +1,131 @@
+# python3: TreadmillReplay.py
+"""
+name: TreadmillReplay.py
+goal: run the task logic against recorded treadmill running instead of a live treadmill
+description:
+    ReplayBus stands in for the I2C bus of the treadmill Arduino (like SimulatedHardware's
+    FakeTreadmillBus) and answers every read with the distance recorded at the current replay
+    position: a <basename>_treadmill_output.csv or a TreadmillLog .bin file, played at `speed` times
+    real time from `seek` s into the recording. the position follows the box clock, so with a
+    VirtualClock a whole session replays as fast as the cpu allows.
+    TreadmillReplay is a Treadmill on a ReplayBus: start(), close(), distance_cm, latest(),
+    subscribe_distance() ... behave as with the hardware. in a simulated session BehavBox uses it
+    when session_info['treadmill_replay'] = {'filename': ..., 'speed': 1.0, 'seek': 0.0} is set.
+
+    threshold_crossings() re-evaluates distance thresholds (distance_initiation, distance_cue) on a
+    whole recording at once, without running a session:
+        python TreadmillReplay.py <recording> <distance cm> [<distance cm> ...] [--timeout s] [--interval s]
+
+"""
+import argparse
+import struct
+
+import numpy as np
+
+import BoxClock
+import Treadmill
+import TreadmillLog
+
+
+def load_recording(filename):
+    """(time s from the first sample, distance_cm) of a treadmill csv or TreadmillLog .bin file."""
+    if filename.endswith(".bin"):
+        records = np.array(list(TreadmillLog.read_samples(filename)), dtype=np.float64).reshape(-1, 4)
+        time, distance = records[:, 1] / 1e9, records[:, 3]  # monotonic, distance_cm
+    else:
+        data = np.loadtxt(filename, delimiter=",", skiprows=1, ndmin=2)
+        time, distance = data[:, 0], data[:, 2]  # time.time(), distance_cm
+    if len(time) == 0:
+        raise ValueError("no treadmill samples in " + filename)
+    return time - time[0], distance
+
+
+class ReplayBus(object):
+    """Stand-in for the treadmill's I2C bus that returns the recorded distance (in bits)."""
+
+    def __init__(self, filename, speed=1.0, seek=0.0, treadmill_calibrate=9.14):
+        self.filename = filename
+        self.time, self.distance_cm = load_recording(filename)
+        self.duration = float(self.time[-1])
+        self.treadmill_calibrate = treadmill_calibrate  # bit per cm, as in Treadmill
+        self.clock = BoxClock.get_clock()
+        self.speed = speed
+        self._seek = seek  # recording s at _started
+        self._started = self.clock.monotonic()
+
+    def position(self):
+        """Current replay position in s from the start of the recording."""
+        return self._seek + (self.clock.monotonic() - self._started) * self.speed
+
+    def seek(self, position, speed=None):
+        """Continue the replay from position s of the recording, optionally at a new speed."""
+        if speed is not None:
+            self.speed = speed
+        self._seek = position
+        self._started = self.clock.monotonic()
+
+    @property
+    def finished(self):
+        return self.position() >= self.duration
+
+    def distance_at(self, position):
+        """Distance of the last recorded sample at or before position (the first one before it)."""
+        index = max(int(np.searchsorted(self.time, position, side="right")) - 1, 0)
+        return float(self.distance_cm[index])
+
+    def read_i2c_block_data(self, address, cmd, length=32):
+        block = struct.pack("<f", self.distance_at(self.position()) * self.treadmill_calibrate)
+        return list(block) + [0] * (length - len(block))
+
+    def close(self):
+        pass
+
+
+class TreadmillReplay(Treadmill.Treadmill):
+    def __init__(self, session_info, filename, speed=1.0, seek=0.0):
+        self.replay = ReplayBus(filename, speed, seek)
+        self._start_position = seek  # the replay starts playing with the first start()
+        super(TreadmillReplay, self).__init__(session_info, bus=self.replay)
+
+    def start(self, background=True):
+        if self._start_position is not None:
+            self.replay.seek(self._start_position)
+            self._start_position = None
+        super(TreadmillReplay, self).start(background)
+
+    def seek(self, position, speed=None):
+        self.replay.seek(position, speed)
+
+
+def threshold_crossings(time, distance, start_times, advance_cm, timeout):
+    """Latency (s) until the distance advanced advance_cm past its value at every start time.
+
+    nan where that did not happen within timeout s; the same rule as Treadmill.subscribe_distance().
+    """
+    starts = np.searchsorted(time, start_times, side="right") - 1
+    ends = np.searchsorted(time, np.asarray(start_times) + timeout, side="right")
+    latency = np.full(len(starts), np.nan)
+    for index, (start, end) in enumerate(zip(starts, ends)):
+        start = max(start, 0)
+        reached = np.flatnonzero(distance[start + 1:end] >= distance[start] + advance_cm)
+        if len(reached):
+            latency[index] = time[start + 1 + reached[0]] - start_times[index]
+    return latency
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="success rate of distance thresholds on a treadmill recording")
+    parser.add_argument("recording", help="<basename>_treadmill_output.csv or .bin")
+    parser.add_argument("distances", type=float, nargs="+", help="thresholds in cm")
+    parser.add_argument("-t", "--timeout", type=float, default=5.0, help="s allowed per attempt")
+    parser.add_argument("-i", "--interval", type=float, default=1.0, help="s between two attempt starts")
+    args = parser.parse_args()
+    time, distance = load_recording(args.recording)
+    start_times = np.arange(0, max(time[-1] - args.timeout, 0) + 1e-9, args.interval)
+    print("%d attempts over %.1f s, timeout %.1f s" % (len(start_times), time[-1], args.timeout))
+    for advance_cm in args.distances:
+        latency = threshold_crossings(time, distance, start_times, advance_cm, args.timeout)
+        reached = ~np.isnan(latency)
+        print("    %6.1f cm: reached %5.1f %%, median latency %s s" % (
+            advance_cm, 100.0 * reached.mean() if len(latency) else 0.0,
+            "%.2f" % np.median(latency[reached]) if reached.any() else "-"))
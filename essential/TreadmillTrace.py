@@ -0,0 +1,103 @@
+# python3: TreadmillTrace.py
+"""
+name: TreadmillTrace.py
+goal: live running speed for the status window at a cost that does not grow with the session
+description:
+    Treadmill.sample() adds every (monotonic time, distance_cm) sample to a fixed-size ring buffer.
+    decimated() turns the samples of the last `window` seconds into a speed trace of exactly `points`
+    points: the window is split into points/2 equal time buckets and each bucket contributes the min
+    and the max speed of its samples (min/max decimation), so short sprints and stops stay visible
+    however many samples fall into a bucket. buckets without a sample are nan (a gap in the line).
+    the cost of decimated() only depends on the buffer capacity, never on the session length.
+    capacity_for() is the capacity that holds a whole window at a sampling rate (Treadmill uses it
+    unless session_info['treadmill_trace'] sets a capacity).
+
+"""
+import math
+from threading import Lock
+
+import numpy as np
+
+import BoxClock
+
+DEFAULT_WINDOW = 120.0  # s
+CAPACITY_MARGIN = 1.25  # room for a sampling rate above the nominal one
+
+
+def capacity_for(window, rate):
+    """Buffer capacity (samples) holding `window` s of samples taken at `rate` Hz."""
+    return int(math.ceil(window * rate * CAPACITY_MARGIN))
+
+
+class TreadmillTrace(object):
+    def __init__(self, window=DEFAULT_WINDOW, points=400, capacity=capacity_for(DEFAULT_WINDOW, 100)):
+        self.clock = BoxClock.get_clock()
+        self.window = window  # s of running shown
+        self.points = points - points % 2  # min/max pairs
+        self.capacity = capacity
+        self._lock = Lock()
+        self.time = np.zeros(capacity)  # monotonic s
+        self.distance = np.zeros(capacity)  # cm
+        self.count = 0  # samples added, also the ring write index
+
+    def add(self, monotonic, distance_cm):
+        with self._lock:
+            index = self.count % self.capacity
+            self.time[index] = monotonic
+            self.distance[index] = distance_cm
+            self.count += 1
+
+    def latest_distance(self):
+        if self.count == 0:
+            return 0.0
+        return float(self.distance[(self.count - 1) % self.capacity])
+
+    def _samples(self):
+        """(time, distance) of the buffered samples, oldest first."""
+        with self._lock:
+            count = self.count
+            if count <= self.capacity:
+                return self.time[:count].copy(), self.distance[:count].copy()
+            start = count % self.capacity
+            return (np.concatenate((self.time[start:], self.time[:start])),
+                    np.concatenate((self.distance[start:], self.distance[:start])))
+
+    def decimated(self, now=None):
+        """(time relative to now in s, speed in cm/s): points values each, min/max per time bucket."""
+        if now is None:
+            now = self.clock.monotonic()
+        time, distance = self._samples()
+        speed_time, speed = speed_from_distance(time, distance)
+        bucket_time, values = minmax_decimate(speed_time, speed, now - self.window, now, self.points // 2)
+        return bucket_time - now, values
+
+
+def speed_from_distance(time, distance):
+    """(time, speed) between consecutive samples; samples without a time step are skipped."""
+    if len(time) < 2:
+        return np.zeros(0), np.zeros(0)
+    dt = np.diff(time)
+    valid = dt > 0
+    return time[1:][valid], np.diff(distance)[valid] / dt[valid]
+
+
+def minmax_decimate(time, values, start, end, n_buckets):
+    """Split [start, end) into n_buckets equal time buckets; return (bucket centers, min/max values).
+
+    both arrays have 2 * n_buckets entries: every bucket center twice, with the min and the max of
+    the values in the bucket (nan for a bucket without values). time must be sorted.
+    """
+    width = (end - start) / n_buckets
+    centers = start + width * (np.arange(n_buckets) + 0.5)
+    low = np.full(n_buckets, np.nan)
+    high = np.full(n_buckets, np.nan)
+    if len(time) and width > 0:
+        bucket = np.floor((time - start) / width).astype(np.int64)
+        inside = (bucket >= 0) & (bucket < n_buckets)
+        values, bucket = values[inside], bucket[inside]
+        if len(bucket):
+            # time is sorted, so each bucket is one run of the array
+            starts = np.flatnonzero(np.diff(bucket, prepend=-1))
+            low[bucket[starts]] = np.minimum.reduceat(values, starts)
+            high[bucket[starts]] = np.maximum.reduceat(values, starts)
+    return np.repeat(centers, 2), np.column_stack((low, high)).ravel()
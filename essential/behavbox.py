@@ -12,39 +12,53 @@ description:
 # contains the behavior box class, which includes pin numbers and whether DIO pins are
 # configured as input or output
 
+import StartupProfile
 from gpiozero import PWMLED, LED, Button
+import functools
 import os
 import socket
-import time
-from collections import deque
-import pygame
-import pygame.display
 
-import numpy as np
-import matplotlib
-matplotlib.use('module://pygame_matplotlib.backend_pygame')
-import matplotlib.pyplot as plt
-import matplotlib.figure as fg
+# pygame, matplotlib and scipy are only imported when first used, see StartupProfile
+pygame = StartupProfile.lazy_import("pygame")
+plt = StartupProfile.lazy_pyplot()
 
 import logging
 from colorama import Fore, Style
-from visualstim import VisualStim
 
-import scipy.io, pickle
+import pickle
 
-import Treadmill
 import ADS1x15
+import BoxClock
+import EventRing
+import EventLogger
+import EdgeFilter
+import I2CBus
+import LickAnalytics
+import LatencyMonitor
+import PulseScheduler
+import PumpCalibration
+import SimulatedHardware
+import StatusDisplay
 
 # for the flipper
 from FlipperOutput import FlipperOutput
 
+StartupProfile.lap(StartupProfile.IMPORT, "behavbox")
 
-class BehavBox(object):
-    event_list = (
-        deque()
-    )  # all detected events are added to this queue to be read out by the behavior class
 
+class BehavBox(object):
     def __init__(self, session_info):
+        StartupProfile.mark()
+        # virtual clock: timeouts, sleeps and timestamps run on simulated time (see BoxClock)
+        if session_info.get("virtual_clock", False):
+            BoxClock.set_clock(BoxClock.VirtualClock(session_info.get("virtual_clock_start")))
+        self.clock = BoxClock.get_clock()
+
+        # simulated hardware: mock pins, fake treadmill, stub screen, local video RPi stand-in
+        self.simulation = session_info.get("simulation", False)
+        if self.simulation:
+            SimulatedHardware.setup(session_info)
+
         try:
             # set up the external hard drive path for the flipper output
             self.session_info = session_info
@@ -53,9 +67,10 @@ class BehavBox(object):
                 'basename'] + '_flipper_output'
 
             # make data directory and initialize logfile
+            # file_basename first: the event logger below needs it even if the directory already exists
+            session_info['file_basename'] = session_info['dir_name'] + '/' + session_info['mouse_name'] + "_" + session_info['datetime']
             os.makedirs(session_info['dir_name'])
             os.chdir(session_info['dir_name'])
-            session_info['file_basename'] = session_info['dir_name'] + '/' + session_info['mouse_name'] + "_" + session_info['datetime']
             logging.basicConfig(
                 level=logging.INFO,
                 format="%(asctime)s.%(msecs)03d,[%(levelname)s],%(message)s",
@@ -65,24 +80,61 @@ class BehavBox(object):
                     logging.StreamHandler()  # sends copy of log output to screen
                 ]
             )
-            logging.info(";" + str(time.time()) + ";[initialization];behavior_box_initialized")
+            logging.info(";" + str(self.clock.time()) + ";[initialization];behavior_box_initialized")
         except Exception as error_message:
             print("Logging error")
             print(str(error_message))
 
+        ###############################################################################################
+        # binary event logger: callbacks and transitions queue compact records, a background thread
+        # writes them to disk; the ;time;[tag];event;flag text log is exported at the end of the session
+        ###############################################################################################
+        self.event_logger = EventLogger.EventLogger(session_info['file_basename'] + '_events')
+        self.event_logger.start()
+        StartupProfile.lap(StartupProfile.INIT, "logging")
+
         from subprocess import check_output
-        IP_address = check_output(['hostname', '-I']).decode('ascii')[:-2]
+        if self.simulation:
+            IP_address = "127.0.0.1"
+            self.video_system = SimulatedHardware.LocalVideoPi(self.session_info).system
+        else:
+            IP_address = check_output(['hostname', '-I']).decode('ascii')[:-2]
+            self.video_system = os.system  # runs the commands for the video RPi
         self.IP_address = IP_address
         IP_address_video_list = list(IP_address)
         # IP_address_video_list[-3] = "2"
         IP_address_video_list[-1] = "2"
         self.IP_address_video = "".join(IP_address_video_list)
 
+        ###############################################################################################
+        # event ring: all detected events are written here (with their edge timestamps) to be read
+        # out by the behavior class. event_list is the old deque-like interface on the same ring.
+        ###############################################################################################
+        self.event_ring = EventRing.EventRing(self.session_info.get("event_ring_capacity", 1024))
+        self.event_list = EventRing.EventNameQueue(self.event_ring)
+
+        # edge-to-handler latency histograms, the ring reports the enqueue and dequeue times
+        if self.session_info.get("latency_monitor", True):
+            self.latency = LatencyMonitor.LatencyMonitor()
+            self.event_ring.latency = self.latency
+        else:
+            self.latency = None
+        self._latency_font = None
+
+        # online lick statistics (inter-lick intervals, bouts, rate per state, latency per trial)
+        self.lick_analytics = LickAnalytics.LickAnalytics(bout_gap=self.session_info.get("lick_bout_gap", 0.5))
+
+        # debounce stage between the gpiozero callbacks and the event ring, see EdgeFilter
+        self.edge_filter = EdgeFilter.EdgeFilter(self.accept_edge, self.session_info.get("debounce"))
+        if self.session_info.get("debounce", True) is False:
+            self.edge_filter.disable()
+
         ###############################################################################################
         # event list trigger by the interaction between the RPi and the animal for visualization
         # interact_list: lick, choice interaction between the board and the animal for visualization
         ###############################################################################################
         self.interact_list = []
+        StartupProfile.lap(StartupProfile.INIT, "event ring")
 
         ###############################################################################################
         # below are all the pin numbers for Yi's breakout board
@@ -159,10 +211,17 @@ class BehavBox(object):
         self.sound1 = LED(23) # branch new_lick modification
         self.sound2 = LED(24) # branch new_lick modification
 
+        # timed pulses (reward valves, sound TTLs, cue LEDs) are switched by one scheduler thread
+        self.pulses = PulseScheduler.PulseScheduler(self.event_logger)
+        for name in ("cueLED1", "cueLED2", "cueLED3", "cueLED4", "sound1", "sound2"):
+            self.pulses.register(name, getattr(self, name))
+        StartupProfile.lap(StartupProfile.INIT, "pins")
+
         ###############################################################################################
         # pump: trigger signal output to a driver board induce the solenoid valve to deliver reward
         ###############################################################################################
-        self.pump = Pump(self.session_info)
+        self.pump = Pump(self.session_info, self.pulses)
+        StartupProfile.lap(StartupProfile.INIT, "pump")
 
         ###############################################################################################
         # flipper strobe signal (previously called camera strobe signal)
@@ -175,50 +234,90 @@ class BehavBox(object):
         except Exception as error_message:
             print("flipper issue\n")
             print(str(error_message))
+        StartupProfile.lap(StartupProfile.INIT, "flipper")
 
         ###############################################################################################
         # visual stimuli initiation
         ###############################################################################################
         if self.session_info["visual_stimulus"]:
             try:
-                self.visualstim = VisualStim(self.session_info)
+                if self.simulation:
+                    self.visualstim = SimulatedHardware.StubVisualStim(self.session_info)
+                else:
+                    from visualstim import VisualStim
+                    self.visualstim = VisualStim(self.session_info)
             except Exception as error_message:
                 print("visualstim issue\n")
                 print(str(error_message))
         else:
             pass
+        StartupProfile.lap(StartupProfile.INIT, "visualstim")
+        # ###############################################################################################
+        # # treadmill setup
+        # ###############################################################################################
+        if self.simulation:
+            self.virtual_mouse = SimulatedHardware.VirtualMouse(self, self.session_info.get("virtual_mouse"))
+        else:
+            self.virtual_mouse = None
+        # one I2CBus owns /dev/i2c-1 for the treadmill, the ADC and any other I2C device
+        self.i2c_bus = None
+        try:
+            if self.simulation:
+                self.i2c_bus = I2CBus.I2CBus(SimulatedHardware.FakeTreadmillBus(self.virtual_mouse))
+            else:
+                self.i2c_bus = I2CBus.I2CBus()
+        except Exception as error_message:
+            print("I2C bus issue\n")
+            print(str(error_message))
         ###############################################################################################
         # ADC(Adafruit_ADS1x15) setup
         ###############################################################################################
+        # self.ADC() creates an ADS1015 on the shared bus (on its own Adafruit bus without one)
         try:
-            self.ADC = ADS1x15.ADS1015
+            self.ADC = functools.partial(ADS1x15.ADS1015, i2c=self.i2c_bus)
         except Exception as error_message:
             print("ADC issue\n")
             print(str(error_message))
-
-        # ###############################################################################################
-        # # treadmill setup
-        # ###############################################################################################
         if session_info['treadmill'] == True:
             try:
-                self.treadmill = Treadmill.Treadmill(self.session_info)
+                import Treadmill
+                if self.simulation and self.session_info.get("treadmill_replay"):
+                    # recorded running instead of the virtual mouse, see TreadmillReplay
+                    import TreadmillReplay
+                    self.treadmill = TreadmillReplay.TreadmillReplay(self.session_info,
+                                                                     **self.session_info["treadmill_replay"])
+                else:
+                    self.treadmill = Treadmill.Treadmill(self.session_info, bus=self.i2c_bus)
+                self.treadmill.event_ring = self.event_ring  # distance threshold events
             except Exception as error_message:
+                self.treadmill = False  # the box and the task run on without a treadmill
                 print("treadmill issue\n")
                 # print("Ignore following erro if no treadmill is connected: ")
                 print(str(error_message))
         else:
             self.treadmill = False
             print("No treadmill I2C connection detected!")
+        StartupProfile.lap(StartupProfile.INIT, "treadmill")
         ###############################################################################################
         # pygame window setup and keystroke handler
         ###############################################################################################
+        # "process": a StatusDisplay renderer process owns the window and draws the LivePlot, the
+        # task thread only publishes its data and reads the forwarded keys; "inline" (the default,
+        # needed by the tasks that draw their own figures with check_plot): the task thread draws
+        # into its own window
+        self.status_display = None
         try:
-            pygame.init()
-            self.main_display = pygame.display.set_mode((800, 600))
-            pygame.display.set_caption(session_info["box_name"])
-            fig, axes = plt.subplots(1, 1, )
-            axes.plot()
-            self.check_plot(fig)
+            if self.session_info.get("status_display", "inline") == "process":
+                self.status_display = StatusDisplay.StatusDisplay(
+                    session_info, treadmill_trace=self.treadmill.trace if self.treadmill else None)
+            else:
+                pygame.init()
+                self.main_display = pygame.display.set_mode((800, 600))
+                pygame.display.set_caption(session_info["box_name"])
+                # blank window, matplotlib is only loaded for the first real plot
+                self.main_display.fill((255, 255, 255))
+                self.draw_latency_counter()
+                pygame.display.update()
             print(
                 "\nKeystroke handler initiated. In order for keystrokes to register, the pygame window"
             )
@@ -248,6 +347,11 @@ class BehavBox(object):
         except Exception as error_message:
             print("pygame issue\n")
             print(str(error_message))
+        StartupProfile.lap(StartupProfile.INIT, "pygame")
+
+        if StartupProfile.requested(session_info):
+            StartupProfile.report(session_info['file_basename'] + '_startup.csv',
+                                  session_info.get("startup_budget"))
     ###############################################################################################
     # check for data visualization - uses pygame window to show behavior progress
     ###############################################################################################
@@ -256,15 +360,45 @@ class BehavBox(object):
     2. show a x,y axis with a count of trial
     """
     def check_plot(self, figure=None, FPS=144):
+        if self.status_display is not None:
+            # the renderer process owns the window and draws the published LivePlot, a figure of
+            # the task process can not be shown there
+            return
         if figure:
             FramePerSec = pygame.time.Clock()
             figure.canvas.draw()
             self.main_display.blit(figure, (0, 0))
-            pygame.display.update()
+            # only the parts of the window that changed are pushed to the display
+            rects = figure.canvas.pop_dirty_rects()
+            rects.append(self.draw_latency_counter())
+            pygame.display.update([rect for rect in rects if rect])
             FramePerSec.tick(FPS)
         else:
             print("No figure available")
 
+    def status_text(self):
+        # text line under the plot of the status display: treadmill distance and input latency
+        parts = []
+        if self.treadmill and self.treadmill.distance_cm is not None:
+            parts.append("treadmill %.1f cm" % self.treadmill.distance_cm)
+        if self.latency is not None:
+            parts.append(self.latency.summary_text())
+        return "   ".join(parts)
+
+    def draw_latency_counter(self):
+        # live p50/p99/max edge-to-dequeue latency per input at the bottom of the pygame window
+        text = self.status_text()
+        if not text:
+            return
+        if self._latency_font is None:
+            self._latency_font = pygame.font.Font(None, 18)
+        text_surface = self._latency_font.render(text, True, (0, 0, 0), (255, 255, 255))
+        line = pygame.Rect(0, self.main_display.get_height() - text_surface.get_height() - 5,
+                           self.main_display.get_width(), text_surface.get_height())
+        self.main_display.fill((255, 255, 255), line)
+        self.main_display.blit(text_surface, (5, line.y))
+        return line
+
     ###############################################################################################
     # check for key presses - uses pygame window to simulate nosepokes and licks
     ###############################################################################################
@@ -273,29 +407,32 @@ class BehavBox(object):
         reward_size = self.session_info['reward_size']
         # pump = Pump()
         if self.keyboard_active:
-            # event = pygame.event.get()
-            for event in pygame.event.get():
+            if self.status_display is not None:
+                events = self.status_display.key_events()  # forwarded by the renderer process
+            else:
+                events = pygame.event.get()
+            for event in events:
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_ESCAPE:
                         self.keyboard_active = False
                     elif event.key == pygame.K_1:
                         self.left_entry()
                         self.left_IR_entry()
-                        logging.info(";" + str(time.time()) + ";[action];key_pressed_left_entry()")
+                        self.event_logger.log("action", "key_pressed_left_entry()")
                     elif event.key == pygame.K_2:
                         self.center_entry()
                         self.center_IR_entry()
-                        logging.info(";" + str(time.time()) + ";[action];key_pressed_center_entry()")
+                        self.event_logger.log("action", "key_pressed_center_entry()")
                     elif event.key == pygame.K_3:
                         self.right_entry()
                         self.right_IR_entry()
-                        logging.info(";" + str(time.time()) + ";[action];key_pressed_right_entry()")
+                        self.event_logger.log("action", "key_pressed_right_entry()")
                     # elif event.key == pygame.K_4:
                     #     self.reserved_rx1_pressed()
-                    #     logging.info(";" + str(time.time()) + ";[action];key_pressed_reserved_rx1_pressed()")
+                    #     self.event_logger.log("action", "key_pressed_reserved_rx1_pressed()")
                     # elif event.key == pygame.K_5:
                     #     self.reserved_rx2_pressed()
-                    #     logging.info(";" + str(time.time()) + ";[action];key_pressed_reserved_rx2_pressed()")
+                    #     self.event_logger.log("action", "key_pressed_reserved_rx2_pressed()")
                     elif event.key == pygame.K_q:
                         # print("Q down: syringe pump 1 moves")
                         # logging.info(";" + str(time.time()) + ";[reward];key_pressed_pump1")
@@ -343,20 +480,20 @@ class BehavBox(object):
         # Preview check per Kelly request
         print(Fore.YELLOW + "Killing any python process prior to this session!\n" + Style.RESET_ALL)
         try:
-            os.system("ssh pi@" + IP_address_video + " pkill python")
+            self.video_system("ssh pi@" + IP_address_video + " pkill python")
             print(Fore.CYAN + "\nStart Previewing ..." + Style.RESET_ALL)
             print(Fore.RED + "\n CRTL + C to quit previewing and start recording" + Style.RESET_ALL)
 
-            os.system("ssh pi@" + IP_address_video + " '/home/pi/RPi4_behavior_boxes/start_preview.py'")
+            self.video_system("ssh pi@" + IP_address_video + " '/home/pi/RPi4_behavior_boxes/start_preview.py'")
             # Kill any python process before start recording
             print(Fore.GREEN + "\nKilling any python process before start recording!" + Style.RESET_ALL)
 
-            os.system("ssh pi@" + IP_address_video + " pkill python")
-            time.sleep(2)
+            self.video_system("ssh pi@" + IP_address_video + " pkill python")
+            self.clock.sleep(2)
 
             # Prepare the path for recording
-            os.system("ssh pi@" + IP_address_video + " mkdir " + dir_name)
-            os.system("ssh pi@" + IP_address_video + " 'date >> ~/video/videolog.log' ")  # I/O redirection
+            self.video_system("ssh pi@" + IP_address_video + " mkdir " + dir_name)
+            self.video_system("ssh pi@" + IP_address_video + " 'date >> ~/video/videolog.log' ")  # I/O redirection
             tempstr = (
                     "ssh pi@" + IP_address_video + " 'nohup /home/pi/RPi4_behavior_boxes/video_acquisition/start_acquisition.py "
                     + file_name
@@ -370,6 +507,10 @@ class BehavBox(object):
                 print("flipper can't run\n")
                 print(str(error_message))
 
+            # virtual mouse starts licking, poking and running
+            if self.virtual_mouse is not None:
+                self.virtual_mouse.start()
+
             # Treadmill initiation
             if self.treadmill is not False:
                 try:
@@ -380,12 +521,13 @@ class BehavBox(object):
 
             # start recording
             print(Fore.GREEN + "\nStart Recording!" + Style.RESET_ALL)
-            os.system(tempstr)
+            self.video_system(tempstr)
 
             print(
                 Fore.RED + Style.BRIGHT + "Please check if the preview screen is on! Cancel the session if it's not!" + Style.RESET_ALL)
 
             # start initiating the dumping of the session information when available
+            import scipy.io
             scipy.io.savemat(hd_dir + "/" + basename + '_session_info.mat', {'session_info': self.session_info})
             print("dumping session_info")
             pickle.dump(self.session_info, open(hd_dir + "/" + basename + '_session_info.pkl', "wb"))
@@ -401,20 +543,26 @@ class BehavBox(object):
         IP_address_video = self.IP_address_video
         try:
             # Run the stop_video script in the box video
-            os.system(
+            self.video_system(
                 "ssh pi@" + IP_address_video + " /home/pi/RPi4_behavior_boxes/video_acquisition/stop_acquisition.sh")
-            time.sleep(2)
+            self.clock.sleep(2)
             # now stop the flipper after the video stopped recording
             try:  # try to stop the flipper
                 self.flipper.close()
             except:
                 pass
-            time.sleep(2)
+            self.clock.sleep(2)
+            if self.status_display is not None:
+                self.status_display.close()
+            if self.virtual_mouse is not None:
+                self.virtual_mouse.stop()
             if self.treadmill is not False:
                 try:  # try to stop recording the treadmill
                     self.treadmill.close()
                 except:
                     pass
+            self.pulses.close()
+            self.event_log_flush()
             hostname = socket.gethostname()
             print("Moving video files from " + hostname + "video to " + hostname + ":")
 
@@ -422,21 +570,22 @@ class BehavBox(object):
             base_dir = self.session_info['external_storage'] + '/'
             hd_dir = base_dir + basename
 
+            import scipy.io
             scipy.io.savemat(hd_dir + "/" + basename + '_session_info.mat', {'session_info': self.session_info})
             print("dumping session_info")
             pickle.dump(self.session_info, open(hd_dir + "/" + basename + '_session_info.pkl', "wb"))
 
             # Move the video + log from the box_video SD card to the box_behavior external hard drive
-            os.system(
+            self.video_system(
                 "rsync -av --progress --remove-source-files pi@" + IP_address_video + ":" + dir_name + "/ "
                 + hd_dir
             )
-            os.system(
+            self.video_system(
                 "rsync -av --progress --remove-source-files pi@" + IP_address_video + ":~/video/*.log "
                 + hd_dir
             )
 
-            os.system(
+            self.video_system(
                 "rsync -arvz --progress --remove-source-files " + self.session_info['dir_name'] + "/ "
                 + hd_dir
             )
@@ -445,98 +594,100 @@ class BehavBox(object):
         except Exception as e:
             print(e)
 
+    def event_log_flush(self):
+        # stop the event logger thread and write the text version of the log next to the .bin file
+        try:
+            for name, raw, suppressed in self.edge_filter.summary():
+                print("debounce " + name + ": " + str(suppressed) + " of " + str(raw) + " raw edges suppressed")
+                self.event_logger.log("debounce", name + "_suppressed", value=suppressed)
+            self.event_logger.close()
+            if self.session_info.get("export_event_log", True):
+                self.event_logger.export_text()
+        except Exception as error_message:
+            print("event log issue\n")
+            print(str(error_message))
+
     ###############################################################################################
     # callbacks
     ###############################################################################################
+    def accept_edge(self, source, edge, monotonic_ns):
+        # called by the edge filter for every edge that passes the debounce stage
+        name = EventRing.EVENT_NAMES[source][edge]
+        wall_ns = self.clock.time_ns() - (self.clock.monotonic_ns() - monotonic_ns)
+        if source in EdgeFilter.GROUPS["lick"]:
+            self.interact_list.append((wall_ns / 1e9, name))
+            if edge == EventRing.ENTRY:
+                # before the push: the task woken by it already sees this lick in the analytics
+                self.lick_analytics.lick(source, monotonic_ns)
+        self.event_ring.push(source, edge, monotonic_ns, wall_ns)
+        self.event_logger.log("action", name)
+
     def left_entry(self):
-        self.event_list.append("left_entry")
-        self.interact_list.append((time.time(), "left_entry"))
-        logging.info(";" + str(time.time()) + ";[action];left_entry")
+        self.edge_filter.edge(EventRing.LEFT, EventRing.ENTRY)
 
     def center_entry(self):
-        self.event_list.append("center_entry")
-        self.interact_list.append((time.time(), "center_entry"))
-        logging.info(";" + str(time.time()) + ";[action];center_entry")
+        self.edge_filter.edge(EventRing.CENTER, EventRing.ENTRY)
 
     def right_entry(self):
-        self.event_list.append("right_entry")
-        self.interact_list.append((time.time(), "right_entry"))
-        logging.info(";" + str(time.time()) + ";[action];right_entry")
+        self.edge_filter.edge(EventRing.RIGHT, EventRing.ENTRY)
 
     def left_exit(self):
-        self.event_list.append("left_exit")
-        self.interact_list.append((time.time(), "left_exit"))
-        logging.info(";" + str(time.time()) + ";[action];left_exit")
+        self.edge_filter.edge(EventRing.LEFT, EventRing.EXIT)
 
     def center_exit(self):
-        self.event_list.append("center_exit")
-        self.interact_list.append((time.time(), "center_exit"))
-        logging.info(";" + str(time.time()) + ";[action];center_exit")
+        self.edge_filter.edge(EventRing.CENTER, EventRing.EXIT)
 
     def right_exit(self):
-        self.event_list.append("right_exit")
-        self.interact_list.append((time.time(), "right_exit"))
-        logging.info(";" + str(time.time()) + ";[action];right_exit")
+        self.edge_filter.edge(EventRing.RIGHT, EventRing.EXIT)
 
     # def reserved_rx1_pressed(self):
     #     self.event_list.append("reserved_rx1_pressed")
     #     self.interact_list.append((time.time(), "reserved_rx1_pressed"))
-    #     logging.info(";" + str(time.time()) + ";[action];reserved_rx1_pressed")
+    #     self.event_logger.log("action", "reserved_rx1_pressed")
     #
     # def reserved_rx2_pressed(self):
     #     self.event_list.append("reserved_rx2_pressed")
     #     self.interact_list.append((time.time(), "reserved_rx2_pressed"))
-    #     logging.info(";" + str(time.time()) + ";[action];reserved_rx2_pressed")
+    #     self.event_logger.log("action", "reserved_rx2_pressed")
     #
     # def reserved_rx1_released(self):
     #     self.event_list.append("reserved_rx1_released")
     #     self.interact_list.append((time.time(), "reserved_rx1_released"))
-    #     logging.info(";" + str(time.time()) + ";[action];reserved_rx1_released")
+    #     self.event_logger.log("action", "reserved_rx1_released")
     #
     # def reserved_rx2_released(self):
     #     self.event_list.append("reserved_rx2_released")
     #     self.interact_list.append((time.time(), "reserved_rx2_released"))
-    #     logging.info(";" + str(time.time()) + ";[action];reserved_rx2_released")
+    #     self.event_logger.log("action", "reserved_rx2_released")
     def IR_1_entry(self):
-        self.event_list.append("IR_1_entry")
-        logging.info(str(time.time()) + ", IR_1_entry")
+        self.edge_filter.edge(EventRing.IR_1, EventRing.ENTRY)
 
     def IR_2_entry(self):
-        self.event_list.append("IR_2_entry")
-        logging.info(str(time.time()) + ", IR_2_entry")
+        self.edge_filter.edge(EventRing.IR_2, EventRing.ENTRY)
 
     def IR_3_entry(self):
-        self.event_list.append("IR_3_entry")
-        logging.info(str(time.time()) + ", IR_3_entry")
+        self.edge_filter.edge(EventRing.IR_3, EventRing.ENTRY)
 
     def IR_4_entry(self):
-        self.event_list.append("IR_4_entry")
-        logging.info(str(time.time()) + ", IR_4_entry")
+        self.edge_filter.edge(EventRing.IR_4, EventRing.ENTRY)
 
     def IR_5_entry(self):
-        self.event_list.append("IR_5_entry")
-        logging.info(str(time.time()) + ", IR_5_entry")
+        self.edge_filter.edge(EventRing.IR_5, EventRing.ENTRY)
 
     def IR_1_exit(self):
-        self.event_list.append("IR_1_exit")
-        logging.info(str(time.time()) + ", IR_1_exit")
+        self.edge_filter.edge(EventRing.IR_1, EventRing.EXIT)
 
     def IR_2_exit(self):
-        self.event_list.append("IR_2_exit")
-        # self.cueLED2.off()
-        logging.info(str(time.time()) + ", IR_2_exit")
+        self.edge_filter.edge(EventRing.IR_2, EventRing.EXIT)
 
     def IR_3_exit(self):
-        self.event_list.append("IR_3_exit")
-        logging.info(str(time.time()) + ", IR_3_exit")
+        self.edge_filter.edge(EventRing.IR_3, EventRing.EXIT)
 
     def IR_4_exit(self):
-        self.event_list.append("IR_4_exit")
-        logging.info(str(time.time()) + ", IR_4_exit")
+        self.edge_filter.edge(EventRing.IR_4, EventRing.EXIT)
 
     def IR_5_exit(self):
-        self.event_list.append("IR_5_exit")
-        logging.info(str(time.time()) + ", IR_5_exit")
+        self.edge_filter.edge(EventRing.IR_5, EventRing.EXIT)
 
 # this is for the cue LEDs. BoxLED.value is the intensity value (PWM duty cycle, from 0 to 1)
 # currently. BoxLED.set_value is the saved intensity value that determines how bright the
@@ -552,7 +703,7 @@ class BoxLED(PWMLED):
 
 
 class Pump(object):
-    def __init__(self, session_info):
+    def __init__(self, session_info, pulses=None):
         self.session_info = session_info
         self.pump1 = LED(19)
         self.pump2 = LED(20)
@@ -560,77 +711,55 @@ class Pump(object):
         self.pump4 = LED(7)
         self.pump_air = LED(8)
         self.pump_vacuum = LED(25)
+        self.clock = BoxClock.get_clock()
+        # the valves are pulsed by the box's PulseScheduler, not by blink()
+        self.pulses = pulses if pulses is not None else PulseScheduler.PulseScheduler()
+        for name in ("pump1", "pump2", "pump3", "pump4", "pump_air", "pump_vacuum"):
+            self.pulses.register(name, getattr(self, name))
         self.reward_list = [] # a list of tuple (pump_x, reward_amount) with information of reward history for data
         # visualization
 
+        # reward volume -> valve duration, fitted and checked once here instead of at every reward
+        self.calibrations = PumpCalibration.session_calibrations(session_info)
+        for pump, calibration in sorted(self.calibrations.items()):
+            logging.info(";" + str(self.clock.time()) + ";[configuration];pump" + pump + "_calibration(" +
+                         str(calibration) + ", range_ul: " + str(calibration.volume_range) + ")")
+        # which_pump -> (handler, valve output name, pump, log tag)
+        self._dispatch = {}
+        for tag, prefix in (("reward", ""), ("key", "key_")):
+            for pump in ("1", "2", "3", "4"):
+                self._dispatch[prefix + pump] = (self._calibrated_reward, "pump" + pump, pump, tag)
+            self._dispatch[prefix + "air_puff"] = (self._air_puff, "pump_air", "air_puff", tag)
+            self._dispatch[prefix + "vacuum"] = (self._vacuum, "pump_vacuum", "vacuum", tag)
+
     def reward(self, which_pump, reward_size):
-        # import coefficient from the session_information
-        coefficient_p1 = self.session_info["calibration_coefficient"]['1']
-        coefficient_p2 = self.session_info["calibration_coefficient"]['2']
-        coefficient_p3 = self.session_info["calibration_coefficient"]['3']
-        coefficient_p4 = self.session_info["calibration_coefficient"]['4']
-        duration_air = self.session_info['air_duration']
+        entry = self._dispatch.get(which_pump)
+        if entry is None:
+            # like the former if/elif chain, an unknown pump does nothing (e.g. "vaccum" of the
+            # self_admin tasks), but it is logged
+            logging.info(";" + str(self.clock.time()) + ";[warning];unknown_pump_" + str(which_pump))
+            return
+        handler, valve, pump, tag = entry
+        handler(valve, pump, tag, reward_size)
+
+    def _calibrated_reward(self, valve, pump, tag, reward_size):
+        calibration = self.calibrations[pump]
+        out_of_range_count = calibration.out_of_range_count
+        duration = round(calibration.duration(reward_size), 5)
+        if calibration.out_of_range_count != out_of_range_count:
+            logging.info(";" + str(self.clock.time()) + ";[" + tag + "];pump" + pump + "_out_of_range(reward_amount: " +
+                         str(reward_size) + ", range_ul: " + str(calibration.volume_range) + ")")
+        self.pulses.pulse(valve, duration, 0.1, 1)
+        self.reward_list.append(("pump" + pump + "_reward", reward_size))
+        logging.info(";" + str(self.clock.time()) + ";[" + tag + "];pump" + pump + "_reward(reward_coeff: " +
+                     str(calibration) + ", reward_amount: " + str(reward_size) + "duration: " + str(duration) + ")")
+
+    def _air_puff(self, valve, pump, tag, reward_size):
+        self.pulses.pulse(valve, self.session_info['air_duration'], 0.1, 1)
+        self.reward_list.append(("air_puff", reward_size))
+        logging.info(";" + str(self.clock.time()) + ";[" + tag + "];pump4_reward_" + str(reward_size))
+
+    def _vacuum(self, valve, pump, tag, reward_size):
         duration_vac = self.session_info["vacuum_duration"]
-
-        if which_pump == "1":
-            duration = round((coefficient_p1[0] * (reward_size / 1000) + coefficient_p1[1]), 5)  # linear function
-            self.pump1.blink(duration, 0.1, 1)
-            self.reward_list.append(("pump1_reward", reward_size))
-            logging.info(";" + str(time.time()) + ";[reward];pump1_reward(reward_coeff: " + str(coefficient_p1) +
-                         ", reward_amount: " + str(reward_size) + "duration: " + str(duration) + ")")
-        elif which_pump == "2":
-            duration = round((coefficient_p2[0] * (reward_size / 1000) + coefficient_p2[1]), 5)  # linear function
-            self.pump2.blink(duration, 0.1, 1)
-            self.reward_list.append(("pump2_reward", reward_size))
-            logging.info(";" + str(time.time()) + ";[reward];pump2_reward(reward_coeff: " + str(coefficient_p2) +
-                         ", reward_amount: " + str(reward_size) + "duration: " + str(duration) + ")")
-        elif which_pump == "3":
-            duration = round((coefficient_p3[0] * (reward_size / 1000) + coefficient_p3[1]), 5)  # linear function
-            self.pump3.blink(duration, 0.1, 1)
-            self.reward_list.append(("pump3_reward", reward_size))
-            logging.info(";" + str(time.time()) + ";[reward];pump3_reward(reward_coeff: " + str(coefficient_p3) +
-                         ", reward_amount: " + str(reward_size) + "duration: " + str(duration) + ")")
-        elif which_pump == "4":
-            duration = round((coefficient_p4[0] * (reward_size / 1000) + coefficient_p4[1]), 5)  # linear function
-            self.pump4.blink(duration, 0.1, 1)
-            self.reward_list.append(("pump4_reward", reward_size))
-            logging.info(";" + str(time.time()) + ";[reward];pump4_reward(reward_coeff: " + str(coefficient_p4) +
-                         ", reward_amount: " + str(reward_size) + "duration: " + str(duration) + ")")
-        elif which_pump == "air_puff":
-            self.pump_air.blink(duration_air, 0.1, 1)
-            self.reward_list.append(("air_puff", reward_size))
-            logging.info(";" + str(time.time()) + ";[reward];pump4_reward_" + str(reward_size))
-        elif which_pump == "vacuum":
-            self.pump_vacuum.blink(duration_vac, 0.1, 1)
-            logging.info(";" + str(time.time()) + ";[reward];pump_vacuum" + str(duration_vac))
-        elif which_pump == "key_1":
-            duration = round((coefficient_p1[0] * (reward_size / 1000) + coefficient_p1[1]), 5)  # linear function
-            self.pump1.blink(duration, 0.1, 1)
-            self.reward_list.append(("pump1_reward", reward_size))
-            logging.info(";" + str(time.time()) + ";[key];pump1_reward(reward_coeff: " + str(coefficient_p1) +
-                         ", reward_amount: " + str(reward_size) + "duration: " + str(duration) + ")")
-        elif which_pump == "key_2":
-            duration = round((coefficient_p2[0] * (reward_size / 1000) + coefficient_p2[1]), 5)  # linear function
-            self.pump2.blink(duration, 0.1, 1)
-            self.reward_list.append(("pump2_reward", reward_size))
-            logging.info(";" + str(time.time()) + ";[key];pump2_reward(reward_coeff: " + str(coefficient_p2) +
-                         ", reward_amount: " + str(reward_size) + "duration: " + str(duration) + ")")
-        elif which_pump == "key_3":
-            duration = round((coefficient_p3[0] * (reward_size / 1000) + coefficient_p3[1]), 5)  # linear function
-            self.pump3.blink(duration, 0.1, 1)
-            self.reward_list.append(("pump3_reward", reward_size))
-            logging.info(";" + str(time.time()) + ";[key];pump3_reward(reward_coeff: " + str(coefficient_p3) +
-                         ", reward_amount: " + str(reward_size) + "duration: " + str(duration) + ")")
-        elif which_pump == "key_4":
-            duration = round((coefficient_p4[0] * (reward_size / 1000) + coefficient_p4[1]), 5)  # linear function
-            self.pump4.blink(duration, 0.1, 1)
-            self.reward_list.append(("pump4_reward", reward_size))
-            logging.info(";" + str(time.time()) + ";[key];pump4_reward(reward_coeff: " + str(coefficient_p4) +
-                         ", reward_amount: " + str(reward_size) + "duration: " + str(duration) + ")")
-        elif which_pump == "key_air_puff":
-            self.pump_air.blink(duration_air, 0.1, 1)
-            self.reward_list.append(("air_puff", reward_size))
-            logging.info(";" + str(time.time()) + ";[key];pump4_reward_" + str(reward_size))
-        elif which_pump == "key_vacuum":
-            self.pump_vacuum.blink(duration_vac, 0.1, 1)
-            logging.info(";" + str(time.time()) + ";[key];pump_vacuum" + str(duration_vac))
\ No newline at end of file
+        self.pulses.pulse(valve, duration_vac, 0.1, 1)
+        logging.info(";" + str(self.clock.time()) + ";[" + tag + "];pump_vacuum" + str(duration_vac))
@@ -9,6 +9,7 @@ with ::
 """
 from __future__ import annotations
 
+from collections import OrderedDict
 from typing import List
 import matplotlib
 from matplotlib.artist import Artist
@@ -19,7 +20,6 @@ import numpy as np
 from matplotlib.transforms import Affine2D
 import pygame
 import pygame.image
-from pygame import gfxdraw
 from matplotlib._pylab_helpers import Gcf
 from matplotlib.backend_bases import (
     FigureCanvasBase,
@@ -122,7 +122,11 @@ class FigureSurface(pygame.Surface, Figure):
             key=lambda artist: artist.get_zorder(),
         )
 
-        for ax in self._localaxes.as_list():
+        # _localaxes is an _AxesStack before matplotlib 3.6 and a list since
+        local_axes = self._localaxes
+        if hasattr(local_axes, "as_list"):
+            local_axes = local_axes.as_list()
+        for ax in local_axes:
             locator = ax.get_axes_locator()
 
             if locator:
@@ -145,6 +149,86 @@ class FigureSurface(pygame.Surface, Figure):
         return artists
 
 
+def _path_color(gc, rgbFace):
+    """pygame color of a path: the face color if it is filled, else the line color."""
+    if rgbFace is not None:
+        return tuple([int(val * 255) for i, val in enumerate(rgbFace) if i < 3])
+    return tuple([int(val * 255) for i, val in enumerate(gc.get_rgb()) if i < 3])
+
+
+class TextCache:
+    """LRU caches for pygame Font objects and rendered (rotated) text surfaces.
+
+    Fonts are keyed by (font file, size) and bounded by count, text surfaces are
+    keyed by (font, string, color, antialiased, angle) and bounded by the memory
+    of their pixels. hits/misses count the text surface lookups,
+    font_hits/font_misses the font lookups.
+    """
+
+    def __init__(self, max_fonts=32, max_bytes=8 * 1024 * 1024):
+        self.max_fonts = max_fonts
+        self.max_bytes = max_bytes
+        self._fonts = OrderedDict()
+        self._surfaces = OrderedDict()  # key: (surface, bytes)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.font_hits = 0
+        self.font_misses = 0
+
+    def font(self, filename, size):
+        key = (filename, size)
+        font = self._fonts.get(key)
+        if font is not None:
+            self._fonts.move_to_end(key)
+            self.font_hits += 1
+            return font
+        self.font_misses += 1
+        font = pygame.font.Font(filename, size)
+        self._fonts[key] = font
+        if len(self._fonts) > self.max_fonts:
+            self._fonts.popitem(last=False)
+        return font
+
+    def text(self, font_key, s, color, antialiased, angle):
+        """The rendered surface of s, rotated by angle degrees."""
+        key = (font_key, s, color, antialiased, angle)
+        entry = self._surfaces.get(key)
+        if entry is not None:
+            self._surfaces.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        surface = self.font(*font_key).render(s, antialiased, color)
+        if angle:
+            surface = pygame.transform.rotate(surface, angle)
+        size = surface.get_width() * surface.get_height() * surface.get_bytesize()
+        self._surfaces[key] = (surface, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and len(self._surfaces) > 1:
+            _, (_, old_size) = self._surfaces.popitem(last=False)
+            self.bytes -= old_size
+        return surface
+
+    def clear(self):
+        self._fonts.clear()
+        self._surfaces.clear()
+        self.bytes = 0
+
+
+# shared by all renderers, the tick labels are the same from figure to figure
+text_cache = TextCache()
+
+
+def _union(a: pygame.Rect, b: pygame.Rect) -> pygame.Rect:
+    """Union of two rects, ignoring empty ones."""
+    if not a.width or not a.height:
+        return b
+    if not b.width or not b.height:
+        return a
+    return a.union(b)
+
+
 class RendererPygame(RendererBase):
     """The renderer handles drawing/rendering operations.
 
@@ -152,92 +236,221 @@ class RendererPygame(RendererBase):
     """
 
     surface: pygame.Surface
+    # larger markers/collection paths are drawn directly instead of from a cached stamp
+    max_stamp_size: int = 256
+    max_stamps: int = 256
 
     def __init__(self, dpi):
         super().__init__()
         self.dpi = dpi
+        self._flip_height = None
+        self._flip_transform = None
+        self._stamps = {}  # rasterized markers, see _stamp
+        # pixels covered by the text drawn since the last reset: get_text_width_height_descent()
+        # does not measure text, so a Text's window extent does not cover what draw_text() blits
+        self.text_rect = pygame.Rect(0, 0, 0, 0)
 
     def rect_from_bbox(self, bbox: Bbox) -> pygame.Rect:
-        """Convert a matplotlib bbox to the equivalent pygame Rect."""
-        raise NotImplementedError()
+        """Convert a matplotlib bbox to the equivalent pygame Rect.
 
-    def draw_path(self, gc, path, transform, rgbFace=None):
-        """Draw a path using pygame functions."""
-        if rgbFace is not None:
-            color = tuple(
-                [int(val * 255) for i, val in enumerate(rgbFace) if i < 3]
-            )
-        else:
-            color = tuple(
-                [int(val * 255) for i, val in enumerate(gc.get_rgb()) if i < 3]
+        The rect covers every pixel the bbox touches; an empty or
+        infinite bbox gives an empty rect.
+        """
+        x0, y0, x1, y1 = bbox.extents
+        if not np.isfinite((x0, y0, x1, y1)).all():
+            return pygame.Rect(0, 0, 0, 0)
+        height = self.surface.get_height()
+        left, top = int(np.floor(min(x0, x1))), int(np.floor(height - max(y0, y1)))
+        right, bottom = int(np.ceil(max(x0, x1))), int(np.ceil(height - min(y0, y1)))
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def _to_pygame_axis(self):
+        """Transform from matplotlib pixels (origin bottom left) to pygame pixel indices (top left).
+
+        Matplotlib puts the center of a pixel at +0.5, pygame at +0.
+        """
+        height = self.surface.get_height()
+        if self._flip_height != height:
+            self._flip_transform = (
+                Affine2D().scale(1, -1).translate(-0.5, height - 0.5)
             )
-
-        linewidth = int(gc.get_linewidth())
-
-        transfrom_to_pygame_axis = Affine2D()
-        transfrom_to_pygame_axis.set_matrix(
-            [[1, 0, 0], [0, -1, self.surface.get_height()], [0, 0, 1]]
+            self._flip_height = height
+        return self._flip_transform
+
+    def _subpaths(self, gc, path, transform, flip=True):
+        """Yield (points, closed) for each subpath, points as a list of pygame pixel coordinates."""
+        # one vectorized pass: transform, drop nans (they start a new subpath), simplify long
+        # lines, snap rectilinear paths to the pixel grid and approximate curves with segments
+        cleaned = path.cleaned(
+            transform,
+            remove_nans=True,
+            simplify=path.should_simplify,
+            snap=gc.get_snap(),
+            stroke_width=gc.get_linewidth(),
         )
-        if not isinstance(transform, IdentityTransform):
-            transform += transfrom_to_pygame_axis
+        vertices, codes = cleaned.vertices, cleaned.codes
+        keep = codes != Path.STOP
+        vertices, codes = vertices[keep], codes[keep]
+        if flip:
+            vertices = self._to_pygame_axis().transform(vertices)
+        starts = np.flatnonzero(codes == Path.MOVETO)
+        for begin, end in zip(starts, np.append(starts[1:], len(codes))):
+            closed = codes[end - 1] == Path.CLOSEPOLY
+            yield vertices[begin:end - 1 if closed else end].tolist(), closed
+
+    def _draw_subpaths(self, surface, subpaths, color, linewidth, antialiased):
+        for points, closed in subpaths:
+            if closed and len(points) > 2:
+                pygame.draw.polygon(surface, color, points)
+            elif len(points) > 1:
+                if antialiased:
+                    pygame.draw.aalines(surface, color, False, points)
+                else:
+                    pygame.draw.lines(
+                        surface, color, False, points, max(linewidth, 1)
+                    )
 
-        draw_func = (  # Select whether antialiased will be used in pygame
-            pygame.draw.aaline if gc.get_antialiased() else pygame.draw.line
+    def draw_path(self, gc, path, transform, rgbFace=None):
+        """Draw a path using pygame functions, one draw call per subpath."""
+        flip = not isinstance(transform, IdentityTransform)
+        self._draw_subpaths(
+            self.surface,
+            self._subpaths(gc, path, transform, flip),
+            _path_color(gc, rgbFace),
+            int(gc.get_linewidth()),
+            gc.get_antialiased(),
         )
 
-        previous_point = (0, 0)
-        poly_points = []
+    def _stamp(self, gc, path, transform, rgbFace):
+        """Surface with path drawn around the origin, and the offset to blit it at.
 
-        for point, code in path.iter_segments(transform):
-            logger.debug(point, code)
-            if code == Path.LINETO:
-                draw_func(
-                    self.surface, color, previous_point, point, linewidth
-                )
-                previous_point = point
-                poly_points.append(point)
-            elif code == Path.CURVE3 or code == Path.CURVE4:
-                end_point = point[2:]
-                points_curve = np.concatenate((previous_point, point)).reshape(
-                    (-1, 2)
-                )
-                gfxdraw.bezier(
-                    self.surface, points_curve, len(points_curve), color
+        The stamps are cached by path, transform and style, so a marker is only rasterized once.
+        Returns None if the path is too large to be worth a stamp.
+        """
+        color = _path_color(gc, rgbFace)
+        linewidth = int(gc.get_linewidth())
+        antialiased = bool(gc.get_antialiased())
+        key = (
+            path.vertices.tobytes(),
+            None if path.codes is None else path.codes.tobytes(),
+            transform.get_matrix().tobytes(),
+            color,
+            linewidth,
+            antialiased,
+        )
+        if key in self._stamps:
+            return self._stamps[key]
+
+        subpaths = list(
+            self._subpaths(gc, path, transform + Affine2D().scale(1, -1), False)
+        )
+        points = np.array(
+            [point for subpath, _ in subpaths for point in subpath]
+        ).reshape(-1, 2)
+        stamp = None
+        if len(points):
+            pad = linewidth + 1
+            low = np.floor(points.min(axis=0)) - pad
+            size = np.ceil(points.max(axis=0)) + pad - low + 1
+            if size.max() <= self.max_stamp_size:
+                surface = pygame.Surface(size.astype(int), pygame.SRCALPHA)
+                shifted = [
+                    ((np.array(subpath) - low).tolist(), closed)
+                    for subpath, closed in subpaths
+                ]
+                self._draw_subpaths(
+                    surface, shifted, color, linewidth, antialiased
                 )
-                previous_point = end_point
-                poly_points.append(end_point)
-            elif code == Path.CLOSEPOLY:
-                if len(poly_points) > 2:
-                    gfxdraw.filled_polygon(self.surface, poly_points, color)
-            elif code == Path.MOVETO:
-                poly_points.append(point)
-                previous_point = point
-            else:  # STOP
-                previous_point = point
-
-    # draw_markers is optional, and we get more correct relative
-    # timings by leaving it out.  backend implementers concerned with
-    # performance will probably want to implement it
-    #     def draw_markers(self, gc, marker_path, marker_trans, path, trans,
-    #                      rgbFace=None):
-    #         pass
-
-    # draw_path_collection is optional, and we get more correct
-    # relative timings by leaving it out. backend implementers concerned with
-    # performance will probably want to implement it
-    #     def draw_path_collection(self, gc, master_transform, paths,
-    #                              all_transforms, offsets, offsetTrans,
-    #                              facecolors, edgecolors, linewidths, linestyles,
-    #                              antialiaseds):
-    #         pass
-
-    # draw_quad_mesh is optional, and we get more correct
-    # relative timings by leaving it out.  backend implementers concerned with
-    # performance will probably want to implement it
-    #     def draw_quad_mesh(self, gc, master_transform, meshWidth, meshHeight,
-    #                        coordinates, offsets, offsetTrans, facecolors,
-    #                        antialiased, edgecolors):
-    #         pass
+                stamp = (surface, low)
+        if len(self._stamps) >= self.max_stamps:
+            self._stamps.pop(next(iter(self._stamps)))
+        self._stamps[key] = stamp
+        return stamp
+
+    def draw_markers(
+        self, gc, marker_path, marker_trans, path, trans, rgbFace=None
+    ):
+        """Rasterize the marker once and blit it at every vertex of path."""
+        stamp = self._stamp(gc, marker_path, marker_trans, rgbFace)
+        if stamp is None:
+            return super().draw_markers(
+                gc, marker_path, marker_trans, path, trans, rgbFace
+            )
+        surface, low = stamp
+        vertices = path.vertices
+        if path.codes is not None:
+            vertices = vertices[
+                (path.codes != Path.CLOSEPOLY) & (path.codes != Path.STOP)
+            ]
+        vertices = trans.transform(vertices)
+        vertices = vertices[np.isfinite(vertices).all(axis=1)]
+        positions = np.rint(self._to_pygame_axis().transform(vertices) + low)
+        self.surface.blits(
+            [(surface, position) for position in positions.tolist()],
+            doreturn=False,
+        )
+
+    def draw_path_collection(
+        self,
+        gc,
+        master_transform,
+        paths,
+        all_transforms,
+        offsets,
+        offset_trans,
+        facecolors,
+        edgecolors,
+        linewidths,
+        linestyles,
+        antialiaseds,
+        urls,
+        offset_position,
+        hatchcolors=None,
+    ):
+        """Draw a collection; offset paths (scatter plots, markers) are blitted as cached stamps."""
+        path_ids = list(
+            self._iter_collection_raw_paths(
+                master_transform, paths, all_transforms
+            )
+        )
+        args = (
+            gc, path_ids, offsets, offset_trans, facecolors, edgecolors,
+            linewidths, linestyles, antialiaseds, urls, offset_position,
+        )
+        try:
+            items = self._iter_collection(
+                *args, hatchcolors=[] if hatchcolors is None else hatchcolors
+            )
+        except TypeError:  # matplotlib < 3.11
+            items = self._iter_collection(*args)
+
+        # stamps only pay off when few different path/style combinations are repeated at the offsets
+        styles = len(path_ids) * max(len(facecolors), 1) * max(len(edgecolors), 1) * max(len(linewidths), 1)
+        use_stamps = len(offsets) > 0 and styles <= self.max_stamps // 4
+
+        flip = self._to_pygame_axis()
+        blits = []  # consecutive stamps, blitted in one call
+        for xo, yo, (path, transform), gc0, rgbFace in items:
+            stamp = None
+            if use_stamps and transform.is_affine:
+                stamp = self._stamp(gc0, path, transform, rgbFace)
+            if stamp is not None:
+                surface, low = stamp
+                x, y = flip.transform((xo, yo)) + low
+                blits.append((surface, (round(x), round(y))))
+                continue
+            if blits:
+                self.surface.blits(blits, doreturn=False)
+                blits = []
+            if xo != 0 or yo != 0:
+                transform = transform.frozen()
+                transform.translate(xo, yo)
+            self.draw_path(gc0, path, transform, rgbFace)
+        if blits:
+            self.surface.blits(blits, doreturn=False)
+
+    # draw_quad_mesh is optional, the default implementation goes through
+    # draw_path_collection
 
     def draw_image(self, gc, x, y, im):
         img_surf = pygame.image.frombuffer(
@@ -256,15 +469,19 @@ class RendererPygame(RendererBase):
         # make sure font module is initialized
         if not pygame.font.get_init():
             pygame.font.init()
+            text_cache.clear()  # fonts from before a pygame.font.quit() are unusable
         # prop is the font properties
-        font_size = prop.get_size_in_points() * 2
-        myfont = pygame.font.Font(prop.get_file(), int(font_size))
-        # apply it to text on a label
-        font_surface = myfont.render(
-            s, gc.get_antialiased(), [val * 255 for val in gc.get_rgb()]
+        font_key = (prop.get_file(), int(prop.get_size_in_points() * 2))
+        # apply it to text on a label, from the cache if it was rendered before
+        font_surface = text_cache.text(
+            font_key,
+            s,
+            tuple([int(val * 255) for val in gc.get_rgb()[:3]]),
+            bool(gc.get_antialiased()),
+            angle,
         )
-        # Get the expected size of the font
-        width, height = myfont.size(s)
+        # Get the size of the (rotated) text
+        width, height = font_surface.get_size()
         # Tuple for the position of the font
         font_surf_position = (x, self.surface.get_height() - y)
         if mtext is not None:
@@ -299,7 +516,7 @@ class RendererPygame(RendererBase):
             x + h_offset,
             self.surface.get_height() - y + v_offset,
         )
-        self.surface.blit(font_surface, font_surf_position)
+        self.text_rect = _union(self.text_rect, self.surface.blit(font_surface, font_surf_position))
 
     def flipy(self):
         # docstring inherited
@@ -328,9 +545,20 @@ class RendererPygame(RendererBase):
         self.surface.fill("white")
 
     def copy_from_bbox(self, bbox):
-        copy = self.surface.copy()
-        copy.bbox = bbox
-        return copy
+        """Copy of the pixels in bbox, to be put back with restore_region."""
+        rect = self.rect_from_bbox(bbox).clip(self.surface.get_rect())
+        region = Region(rect.size)
+        region.blit(self.surface, (0, 0), area=rect)
+        region.rect = rect
+        region.bbox = bbox
+        return region
+
+
+class Region(pygame.Surface):
+    """Pixels saved by copy_from_bbox, with the rect they were copied from."""
+
+    rect: pygame.Rect
+    bbox: Bbox
 
 
 class GraphicsContextPygame(GraphicsContextBase):
@@ -420,6 +648,8 @@ class FigureCanvasPygame(FigureCanvasBase):
     """
 
     blitting: bool = False
+    # figure without its animated artists, saved by the last full draw while blitting
+    background: pygame.Surface = None
 
     # File types allowed for saving
     filetypes = {
@@ -435,6 +665,8 @@ class FigureCanvasPygame(FigureCanvasBase):
 
     def __init__(self, figure=None):
         super().__init__(figure)
+        self.dirty_rects = []
+        self._artist_rects = {}  # where each animated artist was drawn last
 
         # You should provide a print_xxx function for every file format
         # you can write.
@@ -446,15 +678,29 @@ class FigureCanvasPygame(FigureCanvasBase):
         return renderer.copy_from_bbox(bbox)
 
     def restore_region(self, region, bbox=None, xy=None):
-        rect = (
-            pygame.Rect(
-                *(0, 0 if xy is None else xy),
-                *self.get_renderer().surface.get_size(),
+        """Put back a region saved by copy_from_bbox.
+
+        If bbox is given only that part of the region is restored; xy moves
+        the region's lower left corner to a new position (in display
+        coordinates), as in the agg backend.
+        """
+        renderer = self.get_renderer()
+        renderer.surface = self.figure
+        destination = region.rect.copy()
+        if xy is not None:
+            destination.bottomleft = (
+                int(xy[0]),
+                self.figure.get_height() - int(xy[1]),
             )
-            if bbox is None
-            else self.rect_from_bbox(bbox)
-        )
-        self.figure.blit(region, rect)
+        area = pygame.Rect((0, 0), region.get_size())
+        if bbox is not None:
+            part = renderer.rect_from_bbox(
+                bbox if isinstance(bbox, Bbox) else Bbox.from_extents(*bbox)
+            )
+            area = part.move(-region.rect.x, -region.rect.y).clip(area)
+            destination = area.move(destination.topleft)
+        self.figure.blit(region, destination.topleft, area=area)
+        self.dirty_rects.append(destination)
 
     def draw(self):
         """
@@ -464,22 +710,70 @@ class FigureCanvasPygame(FigureCanvasBase):
         even if not output is produced because this will trigger
         deferred work (like computing limits auto-limits and tick
         values) that users may want access to before saving to disk.
+
+        The changed parts of the figure are added to dirty_rects.
         """
+        if self.blitting and self.background is not None:
+            # Restore the saved background and draw only the interactive artists
+            self.renderer = self.get_renderer(cleared=False)
+            self.renderer.surface = self.figure
+            artists = self.figure.get_interactive_artists(self.renderer)
+            previous = [self._artist_rects.get(a) for a in artists]
+            if None in previous:
+                self.figure.blit(self.background, (0, 0))
+                self.draw_interactive_artists(artists)
+                self.dirty_rects.append(self.figure.get_rect())
+                return
+            # only where the artists were drawn last time
+            for rect in previous:
+                self.figure.blit(self.background, rect, area=rect)
+            current = self.draw_interactive_artists(artists)
+            self.dirty_rects.extend(
+                _union(old, new) for old, new in zip(previous, current)
+            )
+            return
         self.renderer = self.get_renderer(cleared=True)
         self.renderer.surface = self.figure
+        # Full redraw of the figure (animated artists are skipped)
+        self.figure.draw(self.renderer)
         if self.blitting:
-            # Draw only interactive artists
+            self.background = self.figure.copy()
+            self.draw_interactive_artists()
+        self.dirty_rects.append(self.figure.get_rect())
+
+    def draw_interactive_artists(self, artists=None):
+        """Draw the animated artists; return the rect each of them covers."""
+        if artists is None:
             artists = self.figure.get_interactive_artists(self.renderer)
-            for a in artists:
-                a.draw(self.renderer)
-        else:
-            # Full redraw of the figure
-            self.figure.draw(self.renderer)
+        rects = []
+        bounds = self.figure.get_rect()
+        for a in artists:
+            self.renderer.text_rect = pygame.Rect(0, 0, 0, 0)
+            a.draw(self.renderer)
+            # + 2 px for the antialiasing and the marker stamps' rounding
+            rect = _union(
+                self.renderer.rect_from_bbox(a.get_window_extent(self.renderer)),
+                self.renderer.text_rect,
+            ).inflate(4, 4).clip(bounds)
+            self._artist_rects[a] = rect
+            rects.append(rect)
+        return rects
+
+    def pop_dirty_rects(self):
+        """Figure rects changed since the last call, for pygame.display.update(rects)."""
+        rects, self.dirty_rects = self.dirty_rects, []
+        return rects
+
+    def invalidate_background(self):
+        """Make the next draw() a full redraw, e.g. after axes limits changed."""
+        self.background = None
 
     def blit(self, bbox=None):
         self.renderer = self.get_renderer(cleared=False)
         self.renderer.surface = self.figure
         self.blitting = True
+        if bbox is not None:
+            self.dirty_rects.append(self.renderer.rect_from_bbox(bbox))
 
     def get_renderer(self, cleared=False) -> RendererPygame:
         fig = self.figure
@@ -9,7 +9,7 @@ the reward that is delivered to the animal separate from the choices
 
 from transitions import Machine
 from transitions import State
-from transitions.extensions.states import add_state_features, Timeout
+from transitions.extensions.states import add_state_features
 import pysistence, collections
 from icecream import ic
 import logging
@@ -30,9 +30,10 @@ logging.config.dictConfig(
 import sys
 sys.path.insert(0,'/home/pi/RPi4_behavior_boxes/essential')
 import behavbox
+from ClockTimeout import ClockTimeout
 
 # adding timing capability to the state machine
-@add_state_features(Timeout)
+@add_state_features(ClockTimeout)
 class TimedStateMachine(Machine):
     pass
 
@@ -72,24 +73,24 @@ class EFOTask(object):
         ########################################################################
         self.states = [
             State(name="standby", on_enter=["enter_standby"], on_exit=["exit_standby"]),
-            Timeout(
+            ClockTimeout(
                 name="trial_available",
                 on_enter=["enter_trial_available"],
                 on_exit=["exit_trial_available"],
             ),
-            Timeout(
+            ClockTimeout(
                 name="start_cue",
                 on_enter=["enter_start_cue"],
                 on_exit=["exit_start_cue"],
                 timeout=self.session_info["timeout_length"],
                 on_timeout=["timeup"],
             ),
-            Timeout(
+            ClockTimeout(
                 name="choice_available",
                 on_enter=["enter_choice_available"],
                 on_exit=["exit_choice_available"],
             ),
-            Timeout(
+            ClockTimeout(
                 name="reward_available",
                 on_enter=["enter_reward_available"],
                 on_exit=["exit_reward_available"],
@@ -136,7 +137,7 @@ class EFOTask(object):
     def enter_reward_available(self):
         print("entering reward_available")
         print("start white noise")
-        self.box.sound1.blink(0.5, 0.1, 1)
+        self.box.pulses.pulse('sound1', 0.5)
         self.box.visualstim.show_grating(list(self.box.visualstim.gratings)[0])
         self.trial_running = True
 
@@ -146,7 +147,7 @@ class EFOTask(object):
     def enter_cue(self):
         print("deliver reward")
         self.box.cueLED4.on()
-        self.box.sound3.blink(0.5, 0.1, 1)
+        self.box.pulses.pulse('sound3', 0.5)
         # self.pump.reward("left", self.session_info["reward_size"])
         print("start cue")
         self.box.cueLED4.off()
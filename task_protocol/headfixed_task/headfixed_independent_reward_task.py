@@ -11,11 +11,10 @@ description:
 import importlib
 from transitions import Machine
 from transitions import State
-from transitions.extensions.states import add_state_features, Timeout
+from transitions.extensions.states import add_state_features
 import pysistence, collections
 from icecream import ic
 import logging
-import time
 from datetime import datetime
 import os
 from gpiozero import PWMLED, LED, Button
@@ -40,10 +39,11 @@ logging.config.dictConfig(
 import sys
 sys.path.insert(0,'/home/pi/RPi4_behavior_boxes/essential')
 import behavbox
+from ClockTimeout import ClockTimeout
 
 
 # adding timing capability to the state machine
-@add_state_features(Timeout)
+@add_state_features(ClockTimeout)
 class TimedStateMachine(Machine):
     pass
 
@@ -84,17 +84,17 @@ class HeadfixedIndependentRewardTask(object):
             State(name='standby',
                   on_enter=["enter_standby"],
                   on_exit=["exit_standby"]),
-            Timeout(name="initiate",
+            ClockTimeout(name="initiate",
                     on_enter=["enter_initiate"],
                     on_exit=["exit_initiate"],
                     timeout=self.session_info["initiation_timeout"],
                     on_timeout=["restart"]),
-            Timeout(name='cue_state',
+            ClockTimeout(name='cue_state',
                     on_enter=["enter_cue_state"],
                     on_exit=["exit_cue_state"],
                     timeout=self.session_info["cue_timeout"],
                     on_timeout=["restart"]),
-            Timeout(name='reward_available',
+            ClockTimeout(name='reward_available',
                     on_enter=["enter_reward_available"],
                     on_exit=["exit_reward_available"],
                     timeout=self.session_info["wait_for_choice"],
@@ -213,12 +213,12 @@ class HeadfixedIndependentRewardTask(object):
                 side_mice = 'left'
                 self.left_poke_count += 1
                 self.left_poke_count_list.append(self.left_poke_count)
-                self.timeline_left_poke.append(time.time())
+                self.timeline_left_poke.append(self.box.clock.time())
             elif self.event_name == "right_entry":
                 side_mice = 'right'
                 self.right_poke_count += 1
                 self.right_poke_count_list.append(self.right_poke_count)
-                self.timeline_right_poke.append(time.time())
+                self.timeline_right_poke.append(self.box.clock.time())
             if side_mice:
                 self.side_mice_buffer = side_mice
                 self.cue_state = cue_state # cue state for foraging
@@ -260,21 +260,21 @@ class HeadfixedIndependentRewardTask(object):
         self.box.check_keybd()
 
     def enter_standby(self):
-        logging.info(";" + str(time.time()) + ";[transition];enter_standby;" + str(self.error_repeat))
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];enter_standby;" + str(self.error_repeat))
         self.update_plot_choice()
         # self.update_plot_error()
         self.trial_running = False
         # self.reward_error = False
         if self.early_lick_error:
             self.error_list.append("early_lick_error")
-            logging.info(";" + str(time.time()) + ";[error];early_lick_error;" + str(self.error_repeat))
+            logging.info(";" + str(self.box.clock.time()) + ";[error];early_lick_error;" + str(self.error_repeat))
             self.check_cue('sound2')
             self.early_lick_error = False
-        print(str(time.time()) + ", Total reward up till current session: " + str(self.total_reward))
-        logging.info(";" + str(time.time()) + ";[trial];trial_" + str(self.actual_trial_number) + ";" + str(self.error_repeat))
+        print(str(self.box.clock.time()) + ", Total reward up till current session: " + str(self.total_reward))
+        logging.info(";" + str(self.box.clock.time()) + ";[trial];trial_" + str(self.actual_trial_number) + ";" + str(self.error_repeat))
 
     def exit_standby(self):
-        logging.info(";" + str(time.time()) + ";[transition];exit_standby;" + str(self.error_repeat))
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];exit_standby;" + str(self.error_repeat))
         self.lick_count = 0
         self.side_mice_buffer = None
         self.box.event_list.clear()
@@ -283,66 +283,66 @@ class HeadfixedIndependentRewardTask(object):
     def enter_initiate(self):
         # print("!!!!!!!!!!!event name is " + self.event_name) # for debugging purposes
         # check error_repeat
-        logging.info(";" + str(time.time()) + ";[transition];enter_initiate;" + str(self.error_repeat))
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];enter_initiate;" + str(self.error_repeat))
         self.check_cue('sound1')
         self.trial_running = True
         # wait for treadmill signal and process the treadmill signal
         self.distance_buffer = self.get_distance()
         logging.info(
-            ";" + str(time.time()) + ";[treadmill];" + str(self.distance_buffer) + ";" + str(self.error_repeat))
+            ";" + str(self.box.clock.time()) + ";[treadmill];" + str(self.distance_buffer) + ";" + str(self.error_repeat))
 
     def exit_initiate(self):
         # check the flag to see whether to shuffle or keep the original card
-        logging.info(";" + str(time.time()) + ";[transition];exit_initiate;" + str(self.error_repeat))
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];exit_initiate;" + str(self.error_repeat))
         print("EVENT NAME: " + str(self.box.event_list))
         self.cue_off('sound1')
         if self.initiate_error:
             self.error_list.append('initiate_error')
             self.error_repeat = True
-            logging.info(";" + str(time.time()) + ";[error];initiate_error;" + str(self.error_repeat))
+            logging.info(";" + str(self.box.clock.time()) + ";[error];initiate_error;" + str(self.error_repeat))
             self.error_count += 1
 
     def enter_cue_state(self):
-        logging.info(";" + str(time.time()) + ";[transition];enter_cue_state;" + str(self.error_repeat))
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];enter_cue_state;" + str(self.error_repeat))
         # turn on the cue according to the current card
         self.check_cue(self.current_card[0])
         # wait for treadmill signal and process the treadmill signal
         self.distance_buffer = self.get_distance()
         logging.info(
-            ";" + str(time.time()) + ";[treadmill];" + str(self.distance_buffer) + ";" + str(self.error_repeat))
+            ";" + str(self.box.clock.time()) + ";[treadmill];" + str(self.distance_buffer) + ";" + str(self.error_repeat))
 
     def exit_cue_state(self):
-        logging.info(";" + str(time.time()) + ";[transition];exit_cue_state;" + str(self.error_repeat))
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];exit_cue_state;" + str(self.error_repeat))
         self.cue_off(self.current_card[0])
         if not self.early_lick_error:
             if self.cue_state_error:
                 self.check_cue("sound2")
                 self.error_list.append('cue_state_error')
                 self.error_repeat = True
-                logging.info(";" + str(time.time()) + ";[error];cue_state_error;" + str(self.error_repeat))
+                logging.info(";" + str(self.box.clock.time()) + ";[error];cue_state_error;" + str(self.error_repeat))
                 self.error_count += 1
                 self.cue_state_error = False
 
     def enter_reward_available(self):
-        logging.info(";" + str(time.time()) + ";[transition];enter_reward_available;" + str(self.error_repeat))
-        print(str(time.time()) + ", " + str(self.actual_trial_number) + ", cue_state distance satisfied")
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];enter_reward_available;" + str(self.error_repeat))
+        print(str(self.box.clock.time()) + ", " + str(self.actual_trial_number) + ", cue_state distance satisfied")
 
     def exit_reward_available(self):
-        logging.info(";" + str(time.time()) + ";[transition];exit_reward_available;" + str(self.error_repeat))
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];exit_reward_available;" + str(self.error_repeat))
         if self.lick_count == 0:
-            logging.info(";" + str(time.time()) + ";[error];no_choice_error;" + str(self.error_repeat))
+            logging.info(";" + str(self.box.clock.time()) + ";[error];no_choice_error;" + str(self.error_repeat))
             self.check_cue('sound2')
             self.error_repeat = True
             self.error_count += 1
             self.error_list.append('no_choice_error')
         elif self.wrong_choice_error:
-            logging.info(";" + str(time.time()) + ";[error];wrong_choice_error;" + str(self.error_repeat))
+            logging.info(";" + str(self.box.clock.time()) + ";[error];wrong_choice_error;" + str(self.error_repeat))
             self.check_cue('sound2')
             self.error_repeat = True
             self.error_count += 1
             self.error_list.append('wrong_choice_error')
         elif self.reward_check:
-            logging.info(";" + str(time.time()) + ";[error];correct_trial;" + str(self.error_repeat))
+            logging.info(";" + str(self.box.clock.time()) + ";[error];correct_trial;" + str(self.error_repeat))
             self.pump.reward(self.pump_num, self.reward_size)
             self.error_repeat = False
             self.total_reward += 1
@@ -355,21 +355,21 @@ class HeadfixedIndependentRewardTask(object):
 
     def check_cue(self, cue):
         if cue == 'sound1':
-            logging.info(";" + str(time.time()) + ";[cue];cue_sound1_on;" + str(self.error_repeat))
+            logging.info(";" + str(self.box.clock.time()) + ";[cue];cue_sound1_on;" + str(self.error_repeat))
             self.box.sound1.on()
         if cue == 'sound2':
-            logging.info(";" + str(time.time()) + ";[cue];cue_sound2_on;" + str(self.error_repeat))
-            self.box.sound2.blink(1, 0.1, 1)
+            logging.info(";" + str(self.box.clock.time()) + ";[cue];cue_sound2_on;" + str(self.error_repeat))
+            self.box.pulses.pulse('sound2', 1)
         elif cue == 'LED_L':
             self.box.cueLED1.on()
-            logging.info(";" + str(time.time()) + ";[cue];cueLED_L_on;" + str(self.error_repeat))
+            logging.info(";" + str(self.box.clock.time()) + ";[cue];cueLED_L_on;" + str(self.error_repeat))
         elif cue == 'LED_R':
             self.box.cueLED2.on()
-            logging.info(";" + str(time.time()) + ";[cue];cueLED_R_on;" + str(self.error_repeat))
+            logging.info(";" + str(self.box.clock.time()) + ";[cue];cueLED_R_on;" + str(self.error_repeat))
         elif cue == 'all':
             self.box.cueLED1.on()
             self.box.cueLED2.on()
-            logging.info(";" + str(time.time()) + ";[cue];LED_L+R_on; " + str(self.error_repeat))
+            logging.info(";" + str(self.box.clock.time()) + ";[cue];LED_L+R_on; " + str(self.error_repeat))
 
     def cue_off(self, cue):
         if cue == 'all':
@@ -377,22 +377,22 @@ class HeadfixedIndependentRewardTask(object):
             self.box.cueLED2.off()
         elif cue == 'sound1':
             self.box.sound1.off()
-            logging.info(";" + str(time.time()) + ";[cue];cue_sound1_off;" + str(self.error_repeat))
+            logging.info(";" + str(self.box.clock.time()) + ";[cue];cue_sound1_off;" + str(self.error_repeat))
         elif cue == 'sound2':
-            self.box.sound2.off()
-            logging.info(";" + str(time.time()) + ";[cue];cue_sound2_off;" + str(self.error_repeat))
+            self.box.pulses.cancel('sound2')
+            logging.info(";" + str(self.box.clock.time()) + ";[cue];cue_sound2_off;" + str(self.error_repeat))
         elif cue == 'LED_L':
             self.box.cueLED1.off()
-            logging.info(";" + str(time.time()) + ";[cue];cueLED1_off;" + str(self.error_repeat))
+            logging.info(";" + str(self.box.clock.time()) + ";[cue];cueLED1_off;" + str(self.error_repeat))
         elif cue == 'LED_R':
             self.box.cueLED2.off()
-            logging.info(";" + str(time.time()) + ";[cue];cueLED2_off;" + str(self.error_repeat))
+            logging.info(";" + str(self.box.clock.time()) + ";[cue];cueLED2_off;" + str(self.error_repeat))
 
     def get_distance(self):
         try:
             distance = self.treadmill.distance_cm
         except Exception as e:
-            logging.info(";" + str(time.time()) + ";[system_error];" + str(e) + ";" + str(self.error_repeat))
+            logging.info(";" + str(self.box.clock.time()) + ";[system_error];" + str(e) + ";" + str(self.error_repeat))
             self.treadmill = self.box.treadmill
             distance = self.treadmill.distance_cm
         return distance
@@ -8,26 +8,24 @@ description:
     an updated test version of headfixed_task.py & add foraging reward condition
 
 """
+import sys
+sys.path.insert(0,'/home/pi/RPi4_behavior_boxes/essential')
+import StartupProfile  # first, so the imports below are timed
 import importlib
 from transitions import Machine
 from transitions import State
-from transitions.extensions.states import add_state_features, Timeout
-import pysistence, collections
+from transitions.extensions.states import add_state_features
+import collections
 from icecream import ic
 import logging
-import time
 from datetime import datetime
 import os
 from gpiozero import PWMLED, LED, Button
 from colorama import Fore, Style
 import logging.config
-from time import sleep
 import random
 import threading
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.figure as fg
-import numpy as np
+StartupProfile.lap(StartupProfile.IMPORT, "task dependencies")
 
 logging.config.dictConfig(
     {
@@ -36,13 +34,17 @@ logging.config.dictConfig(
     }
 )
 # all modules above this line will have logging disabled
-import sys
-sys.path.insert(0,'/home/pi/RPi4_behavior_boxes/essential')
 import behavbox
+import LatencyMonitor
+import LivePlot
+from ClockTimeout import ClockTimeout
+
+plt = StartupProfile.lazy_pyplot()  # imported with the first plot
+StartupProfile.lap(StartupProfile.IMPORT, "headfixed_task")
 
 
 # adding timing capability to the state machine
-@add_state_features(Timeout)
+@add_state_features(ClockTimeout)
 class TimedStateMachine(Machine):
     pass
 
@@ -51,6 +53,7 @@ class HeadfixedTask(object):
     # Define states. States where the animals is waited to make their decision
 
     def __init__(self, **kwargs):  # name and session_info should be provided as kwargs
+        StartupProfile.mark()
 
         # if no name or session, make fake ones (for testing purposes)
         if kwargs.get("name", None) is None:
@@ -83,17 +86,17 @@ class HeadfixedTask(object):
             State(name='standby',
                   on_enter=["enter_standby"],
                   on_exit=["exit_standby"]),
-            Timeout(name="initiate",
+            ClockTimeout(name="initiate",
                     on_enter=["enter_initiate"],
                     on_exit=["exit_initiate"],
                     timeout=self.session_info["initiation_timeout"],
                     on_timeout=["restart"]),
-            Timeout(name='cue_state',
+            ClockTimeout(name='cue_state',
                     on_enter=["enter_cue_state"],
                     on_exit=["exit_cue_state"],
                     timeout=self.session_info["cue_timeout"],
                     on_timeout=["restart"]),
-            Timeout(name='reward_available',
+            ClockTimeout(name='reward_available',
                     on_enter=["enter_reward_available"],
                     on_exit=["exit_reward_available"],
                     timeout=self.session_info["wait_for_choice"],
@@ -110,7 +113,9 @@ class HeadfixedTask(object):
             model=self,
             states=self.states,
             transitions=self.transitions,
-            initial='standby'
+            initial='standby',
+            before_state_change=["mark_transition_latency"],
+            after_state_change=["update_lick_state"]
         )
         self.trial_running = False
 
@@ -137,14 +142,18 @@ class HeadfixedTask(object):
         self.current_card = None
         self.left_poke_count = 0
         self.right_poke_count = 0
-        self.timeline_left_poke = []
-        self.left_poke_count_list = []
-        self.timeline_right_poke = []
-        self.right_poke_count_list = []
         self.event_name = ""
+        self.event_time = None
+        self.event_source = None  # source and callback time of the event being handled, for latency
+        self.event_monotonic_ns = None
+        StartupProfile.lap(StartupProfile.INIT, "state machine")
         # initialize behavior box
         self.box = behavbox.BehavBox(self.session_info)
         self.pump = self.box.pump
+        self.live_plot = LivePlot.LivePlot(
+            self.box, lick_analytics=self.box.lick_analytics,
+            treadmill_trace=self.box.treadmill.trace if self.box.treadmill else None,
+            treadmill_fps=self.session_info.get("treadmill_plot_fps", 2))
 
         self.treadmill = self.box.treadmill
 
@@ -152,6 +161,10 @@ class HeadfixedTask(object):
         self.distance_cue = self.session_info['treadmill_setup']['distance_cue']
         self.distance_buffer = None
         self.distance_diff = 0
+        # the treadmill pushes a treadmill_threshold event when the distance of the current state is
+        # reached, so the task does not need to be woken up by every treadmill sample
+        self.distance_subscription = None
+        self.wake_on_treadmill_sample = False
 
         # for foragaing parameters
         self.side_choice = None  # whether free choice is left or right
@@ -174,14 +187,35 @@ class HeadfixedTask(object):
     # functions called when state transitions occur
     ########################################################################
     def run(self):
-        if self.box.event_list:
-            self.event_name = self.box.event_list.popleft()
+        self.handle_event(self.box.event_ring.pop())
+        # look for keystrokes
+        self.box.check_keybd()
+
+    def handle_event(self, event):
+        # event is a record of box.event_ring, or None when woken up without a new event
+        # (treadmill sample, state timeout) so the treadmill distance is checked again
+        if event is not None:
+            self.event_name = self.box.event_ring.event_name(event)
+            self.event_time = self.box.event_ring.event_time(event)  # time of the edge itself
+            self.event_source = int(event["source"])
+            self.event_monotonic_ns = int(event["monotonic_ns"])
         else:
             self.event_name = ""
+            self.event_source = None
         # there can only be lick during the reward available state
         # if lick detected prior to reward available state
         # the trial will restart and transition to standby
-        if self.event_name is "left_entry" or self.event_name == "right_entry":
+        if self.event_name == "treadmill_threshold":
+            subscription = self.distance_subscription
+            if subscription is None or int(event["tag"]) != subscription.id:
+                # crossing of a subscription cancelled after it was queued (previous state or trial)
+                self.event_name = ""
+            else:
+                self.distance_subscription = None
+                # the distance of the sample that crossed, not the one at handling time
+                self.distance_diff = subscription.crossed_sample.distance_cm - self.distance_buffer
+                self.box.event_logger.log("treadmill", "threshold", self.error_repeat, value=self.distance_diff)
+        if self.event_name == "left_entry" or self.event_name == "right_entry":
             # print("EVENT NAME !!!!!! " + self.event_name)
             if self.state == "reward_available" or self.state == "standby" or self.state == "initiate":
                 pass
@@ -192,32 +226,27 @@ class HeadfixedTask(object):
         if self.state == "standby":
             pass
         elif self.state == "initiate":
-            self.distance_diff = self.get_distance() - self.distance_buffer
-            if self.distance_diff >= self.distance_initiation:
+            if self.event_name == "treadmill_threshold":  # distance_initiation reached
                 self.initiate_error = False
                 self.start_cue()
-            else:
-                self.initiate_error = True
         elif self.state == "cue_state":
-            self.distance_diff = self.get_distance() - self.distance_buffer
-            if self.distance_diff >= self.distance_cue:
+            if self.event_name == "treadmill_threshold":  # distance_cue reached
                 self.cue_state_error = False
                 self.evaluate_reward()
-            else:
-                self.cue_state_error = True
         elif self.state == "reward_available":
             cue_state = self.current_card[0]
             side_mice = None
             if self.event_name == "left_entry":
                 side_mice = 'left'
                 self.left_poke_count += 1
-                self.left_poke_count_list.append(self.left_poke_count)
-                self.timeline_left_poke.append(time.time())
+                self.live_plot.add_choice(side_mice, self.event_time)
             elif self.event_name == "right_entry":
                 side_mice = 'right'
                 self.right_poke_count += 1
-                self.right_poke_count_list.append(self.right_poke_count)
-                self.timeline_right_poke.append(time.time())
+                self.live_plot.add_choice(side_mice, self.event_time)
+            if side_mice and self.box.lick_analytics.state_lick(self.event_source) < self.lick_threshold:
+                # the choice counts once lick_threshold licks hit the same spout in this state
+                side_mice = None
             if side_mice:
                 self.side_mice_buffer = side_mice
                 self.cue_state = cue_state # cue state for foraging
@@ -254,95 +283,117 @@ class HeadfixedTask(object):
                         self.wrong_choice_error = True
                         self.lick_count += 1
                         self.restart()
+        self.event_source = None
 
-        # look for keystrokes
-        self.box.check_keybd()
+    def idle(self):
+        # called by the TaskDispatcher when no event is pending: the running speed panel is
+        # refreshed here (at most treadmill_plot_fps times per s), never while handling a lick
+        self.live_plot.update_treadmill()
+
+    def mark_latency(self, stage):
+        # record the latency from the edge of the event being handled to this stage
+        if self.event_source is not None and self.box.latency is not None:
+            self.box.latency.record(self.event_source, stage, self.event_monotonic_ns)
+
+    def mark_transition_latency(self):
+        self.mark_latency(LatencyMonitor.TRANSITION)
+
+    def update_lick_state(self):
+        # lick rate per state and the lick count of the current state (for lick_threshold)
+        self.box.lick_analytics.set_state(self.state)
 
     def enter_standby(self):
-        logging.info(";" + str(time.time()) + ";[transition];enter_standby;" + str(self.error_repeat))
+        self.box.event_logger.log("transition", "enter_standby", self.error_repeat)
         self.update_plot_choice()
         # self.update_plot_error()
         self.trial_running = False
         # self.reward_error = False
         if self.early_lick_error:
             self.error_list.append("early_lick_error")
-            logging.info(";" + str(time.time()) + ";[error];early_lick_error;" + str(self.error_repeat))
+            self.box.event_logger.log("error", "early_lick_error", self.error_repeat)
             self.check_cue('sound2')
             self.early_lick_error = False
-        print(str(time.time()) + ", Total reward up till current session: " + str(self.total_reward))
-        logging.info(";" + str(time.time()) + ";[trial];trial_" + str(self.actual_trial_number) + ";" + str(self.error_repeat))
+        print(str(self.box.clock.time()) + ", Total reward up till current session: " + str(self.total_reward))
+        self.box.event_logger.log("trial", "trial_" + str(self.actual_trial_number), self.error_repeat)
 
     def exit_standby(self):
-        logging.info(";" + str(time.time()) + ";[transition];exit_standby;" + str(self.error_repeat))
+        self.box.event_logger.log("transition", "exit_standby", self.error_repeat)
         self.lick_count = 0
         self.side_mice_buffer = None
-        self.box.event_list.clear()
+        self.box.event_ring.clear()
         pass
 
     def enter_initiate(self):
         # print("!!!!!!!!!!!event name is " + self.event_name) # for debugging purposes
         # check error_repeat
-        logging.info(";" + str(time.time()) + ";[transition];enter_initiate;" + str(self.error_repeat))
+        self.box.event_logger.log("transition", "enter_initiate", self.error_repeat)
         self.check_cue('sound1')
         self.trial_running = True
+        self.box.lick_analytics.start_trial()
         # wait for treadmill signal and process the treadmill signal
         self.distance_buffer = self.get_distance()
-        logging.info(
-            ";" + str(time.time()) + ";[treadmill];" + str(self.distance_buffer) + ";" + str(self.error_repeat))
+        self.box.event_logger.log("treadmill", "", self.error_repeat, value=self.distance_buffer)
+        self.initiate_error = True  # until the treadmill_threshold event
+        self.subscribe_distance(self.distance_initiation)
 
     def exit_initiate(self):
         # check the flag to see whether to shuffle or keep the original card
-        logging.info(";" + str(time.time()) + ";[transition];exit_initiate;" + str(self.error_repeat))
+        self.box.event_logger.log("transition", "exit_initiate", self.error_repeat)
+        self.cancel_distance()
         print("EVENT NAME: " + str(self.box.event_list))
         self.cue_off('sound1')
         if self.initiate_error:
             self.error_list.append('initiate_error')
             self.error_repeat = True
-            logging.info(";" + str(time.time()) + ";[error];initiate_error;" + str(self.error_repeat))
+            self.box.event_logger.log("error", "initiate_error", self.error_repeat)
             self.error_count += 1
 
     def enter_cue_state(self):
-        logging.info(";" + str(time.time()) + ";[transition];enter_cue_state;" + str(self.error_repeat))
+        self.box.event_logger.log("transition", "enter_cue_state", self.error_repeat)
         # turn on the cue according to the current card
         self.check_cue(self.current_card[0])
         # wait for treadmill signal and process the treadmill signal
         self.distance_buffer = self.get_distance()
-        logging.info(
-            ";" + str(time.time()) + ";[treadmill];" + str(self.distance_buffer) + ";" + str(self.error_repeat))
+        self.box.event_logger.log("treadmill", "", self.error_repeat, value=self.distance_buffer)
+        self.cue_state_error = True  # until the treadmill_threshold event
+        self.subscribe_distance(self.distance_cue)
 
     def exit_cue_state(self):
-        logging.info(";" + str(time.time()) + ";[transition];exit_cue_state;" + str(self.error_repeat))
+        self.box.event_logger.log("transition", "exit_cue_state", self.error_repeat)
+        self.cancel_distance()
         self.cue_off(self.current_card[0])
         if not self.early_lick_error:
             if self.cue_state_error:
                 self.check_cue("sound2")
                 self.error_list.append('cue_state_error')
                 self.error_repeat = True
-                logging.info(";" + str(time.time()) + ";[error];cue_state_error;" + str(self.error_repeat))
+                self.box.event_logger.log("error", "cue_state_error", self.error_repeat)
                 self.error_count += 1
                 self.cue_state_error = False
 
     def enter_reward_available(self):
-        logging.info(";" + str(time.time()) + ";[transition];enter_reward_available;" + str(self.error_repeat))
-        print(str(time.time()) + ", " + str(self.actual_trial_number) + ", cue_state distance satisfied")
+        self.box.event_logger.log("transition", "enter_reward_available", self.error_repeat)
+        self.box.lick_analytics.set_reference()  # lick latency of this trial
+        print(str(self.box.clock.time()) + ", " + str(self.actual_trial_number) + ", cue_state distance satisfied")
 
     def exit_reward_available(self):
-        logging.info(";" + str(time.time()) + ";[transition];exit_reward_available;" + str(self.error_repeat))
+        self.box.event_logger.log("transition", "exit_reward_available", self.error_repeat)
         if self.lick_count == 0:
-            logging.info(";" + str(time.time()) + ";[error];no_choice_error;" + str(self.error_repeat))
+            self.box.event_logger.log("error", "no_choice_error", self.error_repeat)
             self.check_cue('sound2')
             self.error_repeat = True
             self.error_count += 1
             self.error_list.append('no_choice_error')
         elif self.wrong_choice_error:
-            logging.info(";" + str(time.time()) + ";[error];wrong_choice_error;" + str(self.error_repeat))
+            self.box.event_logger.log("error", "wrong_choice_error", self.error_repeat)
             self.check_cue('sound2')
             self.error_repeat = True
             self.error_count += 1
             self.error_list.append('wrong_choice_error')
         elif self.reward_check:
-            logging.info(";" + str(time.time()) + ";[error];correct_trial;" + str(self.error_repeat))
+            self.box.event_logger.log("error", "correct_trial", self.error_repeat)
             self.pump.reward(self.pump_num, self.reward_size)
+            self.mark_latency(LatencyMonitor.OUTPUT)
             self.error_repeat = False
             self.total_reward += 1
             self.reward_check = False
@@ -354,21 +405,21 @@ class HeadfixedTask(object):
 
     def check_cue(self, cue):
         if cue == 'sound1':
-            logging.info(";" + str(time.time()) + ";[cue];cue_sound1_on;" + str(self.error_repeat))
+            self.box.event_logger.log("cue", "cue_sound1_on", self.error_repeat)
             self.box.sound1.on()
         if cue == 'sound2':
-            logging.info(";" + str(time.time()) + ";[cue];cue_sound2_on;" + str(self.error_repeat))
-            self.box.sound2.blink(1, 0.1, 1)
+            self.box.event_logger.log("cue", "cue_sound2_on", self.error_repeat)
+            self.box.pulses.pulse('sound2', 1)
         elif cue == 'LED_L':
             self.box.cueLED1.on()
-            logging.info(";" + str(time.time()) + ";[cue];cueLED_L_on;" + str(self.error_repeat))
+            self.box.event_logger.log("cue", "cueLED_L_on", self.error_repeat)
         elif cue == 'LED_R':
             self.box.cueLED2.on()
-            logging.info(";" + str(time.time()) + ";[cue];cueLED_R_on;" + str(self.error_repeat))
+            self.box.event_logger.log("cue", "cueLED_R_on", self.error_repeat)
         elif cue == 'all':
             self.box.cueLED1.on()
             self.box.cueLED2.on()
-            logging.info(";" + str(time.time()) + ";[cue];LED_L+R_on; " + str(self.error_repeat))
+            self.box.event_logger.log("cue", "LED_L+R_on", self.error_repeat)
 
     def cue_off(self, cue):
         if cue == 'all':
@@ -376,25 +427,41 @@ class HeadfixedTask(object):
             self.box.cueLED2.off()
         elif cue == 'sound1':
             self.box.sound1.off()
-            logging.info(";" + str(time.time()) + ";[cue];cue_sound1_off;" + str(self.error_repeat))
+            self.box.event_logger.log("cue", "cue_sound1_off", self.error_repeat)
         elif cue == 'sound2':
-            self.box.sound2.off()
-            logging.info(";" + str(time.time()) + ";[cue];cue_sound2_off;" + str(self.error_repeat))
+            self.box.pulses.cancel('sound2')
+            self.box.event_logger.log("cue", "cue_sound2_off", self.error_repeat)
         elif cue == 'LED_L':
             self.box.cueLED1.off()
-            logging.info(";" + str(time.time()) + ";[cue];cueLED1_off;" + str(self.error_repeat))
+            self.box.event_logger.log("cue", "cueLED1_off", self.error_repeat)
         elif cue == 'LED_R':
             self.box.cueLED2.off()
-            logging.info(";" + str(time.time()) + ";[cue];cueLED2_off;" + str(self.error_repeat))
+            self.box.event_logger.log("cue", "cueLED2_off", self.error_repeat)
 
     def get_distance(self):
+        # newest sample of the treadmill sampler thread, never waits for an I2C read
         try:
-            distance = self.treadmill.distance_cm
+            sample = self.treadmill.latest()
         except Exception as e:
-            logging.info(";" + str(time.time()) + ";[system_error];" + str(e) + ";" + str(self.error_repeat))
+            logging.info(";" + str(self.box.clock.time()) + ";[system_error];" + str(e) + ";" + str(self.error_repeat))
             self.treadmill = self.box.treadmill
-            distance = self.treadmill.distance_cm
-        return distance
+            sample = self.treadmill.latest()
+        return sample.distance_cm if sample is not None else 0.0
+
+    def subscribe_distance(self, distance):
+        # one treadmill_threshold event once the treadmill ran distance cm past distance_buffer
+        self.cancel_distance()
+        self.distance_subscription = self.treadmill.subscribe_distance(distance, self.distance_buffer)
+
+    def cancel_distance(self):
+        if self.distance_subscription is not None:
+            self.distance_subscription.cancel()
+            self.distance_subscription = None
+
+    def get_speed(self):
+        # running speed (cm/s, negative backwards) of the newest treadmill sample, nan until known
+        sample = self.treadmill.latest() if self.treadmill else None
+        return sample.speed if sample is not None else float("nan")
 
     def update_plot(self):
         fig, axes = plt.subplots(1, 1, )
@@ -402,59 +469,22 @@ class HeadfixedTask(object):
         self.box.check_plot(fig)
 
     def update_plot_error(self):
-        error_event = self.error_list
-        labels, counts = np.unique(error_event, return_counts=True)
-        ticks = range(len(counts))
-        fig, ax = plt.subplots(1, 1, )
-        ax.bar(ticks, counts, align='center', tick_label=labels)
-        ax = plt.gca()
-        ax.set_xticks(ticks, labels)
-        ax.set_xticklabels(labels=labels, rotation=70)
-
-        self.box.check_plot(fig)
+        self.update_plot_choice()
 
     def update_plot_choice(self, save_fig=False):
-        trajectory_left = self.left_poke_count_list
-        time_left = self.timeline_left_poke
-        trajectory_right = self.right_poke_count_list
-        time_right = self.timeline_right_poke
-        fig, ax = plt.subplots(1, 1, )
-        print(type(fig))
-
-        ax.plot(time_left, trajectory_left, color='b', marker="o", label='left_lick_trajectory')
-        ax.plot(time_right, trajectory_right, color='r', marker="o", label='right_lick_trajectory')
+        # the live plot updates its lick trajectories and outcome bars in place
+        self.live_plot.add_outcomes(self.error_list)
+        self.live_plot.update()
         if save_fig:
-            plt.savefig(self.session_info['basedir'] + "/" + self.session_info['basename'] + "/" + \
-                        self.session_info['basename'] + "_choice_plot" + '.png')
-        self.box.check_plot(fig)
+            self.live_plot.save(self.session_info['basedir'] + "/" + self.session_info['basename'] + "/" + \
+                                self.session_info['basename'] + "_choice_plot" + '.png')
 
     def integrate_plot(self, save_fig=False):
-
-        fig, ax = plt.subplots(2, 1)
-
-        trajectory_left = self.left_poke_count_list
-        time_left = self.timeline_left_poke
-        trajectory_right = self.right_poke_count_list
-        time_right = self.timeline_right_poke
-        print(type(fig))
-
-        ax[0].plot(time_left, trajectory_left, color='b', marker="o", label='left_lick_trajectory')
-        ax[0].plot(time_right, trajectory_right, color='r', marker="o", label='right_lick_trajectory')
-
-        error_event = self.error_list
-        labels, counts = np.unique(error_event, return_counts=True)
-        ticks = range(len(counts))
-        ax[1].bar(ticks, counts, align='center', tick_label=labels)
-        # plt.xticks(ticks, labels)
-        # plt.title(session_name)
-        ax[1] = plt.gca()
-        ax[1].set_xticks(ticks, labels)
-        ax[1].set_xticklabels(labels=labels, rotation=70)
-
+        self.live_plot.add_outcomes(self.error_list)
+        self.live_plot.update()
         if save_fig:
-            plt.savefig(self.session_info['basedir'] + "/" + self.session_info['basename'] + "/" + \
-                        self.session_info['basename'] + "_summery" + '.png')
-        self.box.check_plot(fig)
+            self.live_plot.save(self.session_info['basedir'] + "/" + self.session_info['basename'] + "/" + \
+                                self.session_info['basename'] + "_summery" + '.png')
 
     ########################################################################
     # methods to start and end the behavioral session
@@ -466,5 +496,14 @@ class HeadfixedTask(object):
 
     def end_session(self):
         ic("TODO: stop video")
-        self.update_plot_choice(save_fig=True)
+        # without save_session_plots the summary figures are left to essential/SessionReport.py
+        self.update_plot_choice(save_fig=self.session_info.get("save_session_plots", True))
+        if self.box.latency is not None:
+            self.box.latency.dump(self.session_info['file_basename'] + '_latency.csv')
+        if self.box.i2c_bus is not None:
+            self.box.i2c_bus.dump(self.session_info['file_basename'] + '_i2c.csv')
+        print(self.box.lick_analytics.summary_text())
+        if self.treadmill:
+            print(self.treadmill.jitter.summary_text())
+        self.box.pulses.dump(self.session_info['file_basename'] + '_pulses.csv')
         self.box.video_stop()
\ No newline at end of file
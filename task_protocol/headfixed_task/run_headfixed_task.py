@@ -9,25 +9,22 @@ description:
     an updated test version of run_headfixed_task.py & add foraging task
 
 """
+import StartupProfile  # first, so the imports below are timed
 import random
-import numpy as np
-from transitions import Machine
-from transitions import State
 from icecream import ic
 import logging
 from datetime import datetime
 import os
 import logging.config
-import pysistence, collections
-import socket
 import importlib
-import colorama
-import warnings
-import scipy.io, pickle
-import pygame
 from colorama import Fore, Style
-import time
-from time import sleep
+
+# imported where they are first used
+np = StartupProfile.lazy_import("numpy")
+scipy_io = StartupProfile.lazy_import("scipy.io")
+pickle = StartupProfile.lazy_import("pickle")
+pygame = StartupProfile.lazy_import("pygame")
+StartupProfile.lap(StartupProfile.IMPORT, "run script")
 
 debug_enable = False
 
@@ -47,6 +44,7 @@ if debug_enable:
 
 # import your task class here
 from headfixed_task import HeadfixedTask
+from TaskDispatcher import TaskDispatcher
 
 try:
     # load in session_info file, check that dates are correct, put in automatic
@@ -93,6 +91,8 @@ try:
     task_information = TaskInformation()
     # print("Imported task_information_headfixed: " + str(task_information.name))
     task = HeadfixedTask(name="headfixed_task", session_info=session_info)
+    dispatcher = TaskDispatcher(task)
+    clock = task.box.clock  # real time, or simulated time with session_info['virtual_clock']
 
 
     def cumsum_positive(input_list):
@@ -167,18 +167,18 @@ try:
 
     # start session
     task.start_session()
-    scipy.io.savemat(session_info['file_basename'] + '_session_info.mat', {'session_info': session_info})
+    scipy_io.savemat(session_info['file_basename'] + '_session_info.mat', {'session_info': session_info})
     pickle.dump(session_info, open(session_info['file_basename'] + '_session_info.pkl', "wb"))
-    sleep(10)
+    clock.sleep(10)
     # loop over trials
     # Set a timer
     t_minute = int(input("Enter the time in minutes: ")) # wll add in the session info
-    t_end = time.time() + 60 * t_minute
-    while time.time() < t_end: # time check
+    t_end = clock.time() + 60 * t_minute
+    while clock.time() < t_end: # time check
         if task.error_repeat:  # error repeat check
             task.error_repeat = False
             print("punishment_time_out: " + str(session_info["punishment_timeout"]))
-            sleep(session_info["punishment_timeout"])
+            clock.sleep(session_info["punishment_timeout"])
             print("Trial " + str(task.actual_trial_number) + " \n")
             task.actual_trial_number += 1
             print("*******************************\n")
@@ -190,7 +190,7 @@ try:
         else:
             if not first_trial_of_the_session:
                 print("reward_time_out: " + str(session_info["reward_timeout"]))
-                sleep(session_info["reward_timeout"])
+                clock.sleep(session_info["reward_timeout"])
             else:
                 first_trial_of_the_session = False
             # setup the beginning of a new trial
@@ -231,17 +231,16 @@ try:
                     task.current_reward = reward_distribution
 
 
-        logging.info(";" + str(time.time()) + ";[condition];current_card_" + str(task.current_card) +
+        logging.info(";" + str(clock.time()) + ";[condition];current_card_" + str(task.current_card) +
                          ";current_reward_" + str(task.current_reward)[1:-1])
 
         print(" - Current card condition: \n" +
                   "*******************************\n" +
                   "*reward_side: " + str(task.current_card[0]) + "\n" +
                   "*reward_size: " + str(task.current_reward)[1:-1] + "\n")
-        logging.info(";" + str(time.time()) + ";[transition];start_trial()")
+        logging.info(";" + str(clock.time()) + ";[transition];start_trial()")
         task.start_trial()  # initiate the time state machine, start_trial() is a trigger
-        while task.trial_running:
-            task.run()  # run command trigger additional functions outside of the state machine
+        dispatcher.run_trial()  # sleeps until an event, treadmill sample, key or timeout
         print("error_count: " + str(task.error_count))
     raise SystemExit
 
@@ -252,7 +251,7 @@ except (KeyboardInterrupt, SystemExit):
     task.end_session()
     ic('just called end_session()')
     # save dicts to disk
-    scipy.io.savemat(session_info['file_basename'] + '_session_info.mat', {'session_info': session_info})
+    scipy_io.savemat(session_info['file_basename'] + '_session_info.mat', {'session_info': session_info})
     pickle.dump(session_info, open(session_info['file_basename'] + '_session_info.pkl', "wb"))
     pygame.quit()
 
@@ -260,6 +259,6 @@ except (KeyboardInterrupt, SystemExit):
 except RuntimeError as ex:
     print(Fore.RED + Style.BRIGHT + 'ERROR: Exiting now' + Style.RESET_ALL)
     # save dicts to disk
-    scipy.io.savemat(session_info['file_basename'] + '_session_info.mat', {'session_info': session_info})
+    scipy_io.savemat(session_info['file_basename'] + '_session_info.mat', {'session_info': session_info})
     pickle.dump(session_info, open(session_info['file_basename'] + '_session_info.pkl', "wb"))
     task.end_session()
\ No newline at end of file
@@ -2,8 +2,6 @@ from datetime import datetime
 import os
 import pysistence, collections
 import socket
-import pandas as pd
-import numpy as np
 
 # defining immutable mouse dict (once defined for a mouse, NEVER EDIT IT)
 mouse_info = pysistence.make_dict({'mouse_name': 'test',
@@ -60,39 +58,18 @@ session_info["vacuum_duration"] = 1
 
 """ solenoid calibration information configuration """
 
-solenoid_coeff = None
-def get_coefficient():
-    df_calibration = pd.read_csv("~/experiment_info/calibration_info/calibration.csv")
-    pump_coefficient = {}
-
-    for pump_num in range(1, 5):
-        df_pump = df_calibration[df_calibration['pump_number'] == pump_num]
-        mg_per_pulse = df_pump['weight_fluid'].div(df_pump['iteration'])
-        on_time = df_pump['on_time']
-
-        fit_calibration = np.polyfit(mg_per_pulse, on_time, 1)  # output with highest power first
-        pump_coefficient[str(pump_num)] = fit_calibration
-    return pump_coefficient
-
-try:
-    solenoid_coeff = get_coefficient()
-except Exception as e:
-    print(e)
+# fitted once when the box starts (essential/PumpCalibration.py), per pump from the calibration
+# measurements: 'linear', 'poly' (of 'degree') or 'spline' (monotone through the measured points)
+session_info['pump_calibration'] = {'filename': os.path.expanduser("~/experiment_info/calibration_info/calibration.csv"),
+                                    'kind': 'linear', 'degree': 2}
 
+# used when the calibration file can not be read or fitted
+# solenoid valve linear fit coefficient for each pump
 session_info["calibration_coefficient"] = {}
-
-if solenoid_coeff:
-    session_info["calibration_coefficient"]['1'] = solenoid_coeff["1"]
-    session_info["calibration_coefficient"]['2'] = solenoid_coeff["2"]
-    session_info["calibration_coefficient"]['3'] = solenoid_coeff["3"]
-    session_info["calibration_coefficient"]['4'] = solenoid_coeff["4"]
-else:
-    print("No coefficients, generate the default")
-    # solenoid valve linear fit coefficient for each pump
-    session_info["calibration_coefficient"]['1'] = [0.13, 0]  # highest power first
-    session_info["calibration_coefficient"]['2'] = [0.13, 0]
-    session_info["calibration_coefficient"]['3'] = [0.13, 0.0]
-    session_info["calibration_coefficient"]['4'] = [0.13, 0.0]
+session_info["calibration_coefficient"]['1'] = [0.13, 0]  # highest power first
+session_info["calibration_coefficient"]['2'] = [0.13, 0]
+session_info["calibration_coefficient"]['3'] = [0.13, 0.0]
+session_info["calibration_coefficient"]['4'] = [0.13, 0.0]
 
 # define timeout during each condition
 session_info['initiation_timeout'] = 120  # s
@@ -2,8 +2,6 @@ from datetime import datetime
 import os
 import pysistence, collections
 import socket
-import pandas as pd
-import numpy as np
 
 # defining immutable mouse dict (once defined for a mouse, NEVER EDIT IT)
 mouse_info = pysistence.make_dict({'mouse_name': 'test',
@@ -33,9 +31,26 @@ session_info["lick_threshold"] = 1
 # visual stimulus
 session_info["visual_stimulus"] = False
 
+# simulated hardware for running the task on a plain linux machine (see essential/SimulatedHardware.py)
+session_info['simulation'] = False
+session_info['virtual_clock'] = False  # with simulation: run on simulated time, see BoxClock
+session_info['virtual_mouse'] = {'seed': None, 'lick_bout_rate': 0.2, 'running_speed': 10.0}
+
+session_info['profile_startup'] = False  # print import/init times per subsystem (or run with --profile-startup)
+session_info['startup_budget'] = 5.0  # s, a warning is logged when the box takes longer to start
+
+session_info['debounce'] = {'lick': {'min_pulse': 0.01, 'refractory': 0.02}, 'IR': {'min_pulse': 0.005, 'refractory': 0.0}}  # s, False to turn off
+session_info['lick_bout_gap'] = 0.5  # s without a lick that ends a lick bout (LickAnalytics)
+session_info['status_display'] = 'process'  # 'process': plots drawn by a separate renderer process, 'inline': by the task thread
+
 session_info['config'] = 'headfixed2FC'
 session_info['treadmill_setup'] = {}
 session_info['treadmill'] = True
+session_info['treadmill_rate'] = 100  # Hz, treadmill samples on a fixed grid of deadlines
+session_info['treadmill_kinematics'] = {'window': 15, 'order': 2}  # causal Savitzky-Golay fit: samples, polynomial degree
+session_info['treadmill_trace'] = {'window': 120.0, 'points': 400}  # live running speed panel: s shown, plotted points (the buffer follows window * treadmill_rate)
+session_info['treadmill_plot_fps'] = 2  # max refreshes per s of the running speed panel
+session_info['save_session_plots'] = False  # True: save the choice plot in end_session(), False: leave it to essential/SessionReport.py
 session_info['fraction'] = 0.3     # 0.3, 0.5,0.7,1 # free choice fraction 1 for all free choice
 session_info['phase'] = 'foraging_reward' # 'forced_choice', 'sine_reward'
 
@@ -60,39 +75,18 @@ session_info["vacuum_duration"] = 1
 
 """ solenoid calibration information configuration """
 
-solenoid_coeff = None
-def get_coefficient():
-    df_calibration = pd.read_csv("~/experiment_info/calibration_info/calibration.csv")
-    pump_coefficient = {}
-
-    for pump_num in range(1, 5):
-        df_pump = df_calibration[df_calibration['pump_number'] == pump_num]
-        mg_per_pulse = df_pump['weight_fluid'].div(df_pump['iteration'])
-        on_time = df_pump['on_time']
-
-        fit_calibration = np.polyfit(mg_per_pulse, on_time, 1)  # output with highest power first
-        pump_coefficient[str(pump_num)] = fit_calibration
-    return pump_coefficient
-
-try:
-    solenoid_coeff = get_coefficient()
-except Exception as e:
-    print(e)
+# fitted once when the box starts (essential/PumpCalibration.py), per pump from the calibration
+# measurements: 'linear', 'poly' (of 'degree') or 'spline' (monotone through the measured points)
+session_info['pump_calibration'] = {'filename': os.path.expanduser("~/experiment_info/calibration_info/calibration.csv"),
+                                    'kind': 'linear', 'degree': 2}
 
+# used when the calibration file can not be read or fitted
+# solenoid valve linear fit coefficient for each pump
 session_info["calibration_coefficient"] = {}
-
-if solenoid_coeff:
-    session_info["calibration_coefficient"]['1'] = solenoid_coeff["1"]
-    session_info["calibration_coefficient"]['2'] = solenoid_coeff["2"]
-    session_info["calibration_coefficient"]['3'] = solenoid_coeff["3"]
-    session_info["calibration_coefficient"]['4'] = solenoid_coeff["4"]
-else:
-    print("No coefficients, generate the default")
-    # solenoid valve linear fit coefficient for each pump
-    session_info["calibration_coefficient"]['1'] = [0.13, 0]  # highest power first
-    session_info["calibration_coefficient"]['2'] = [0.13, 0]
-    session_info["calibration_coefficient"]['3'] = [0.13, 0.0]
-    session_info["calibration_coefficient"]['4'] = [0.13, 0.0]
+session_info["calibration_coefficient"]['1'] = [0.13, 0]  # highest power first
+session_info["calibration_coefficient"]['2'] = [0.13, 0]
+session_info["calibration_coefficient"]['3'] = [0.13, 0.0]
+session_info["calibration_coefficient"]['4'] = [0.13, 0.0]
 
 # define timeout during each condition
 session_info['initiation_timeout'] = 120  # s
@@ -1,6 +1,6 @@
 from transitions import Machine
 from transitions import State
-from transitions.extensions.states import add_state_features, Timeout
+from transitions.extensions.states import add_state_features
 import pysistence, collections
 from icecream import ic
 import logging
@@ -21,9 +21,10 @@ logging.config.dictConfig(
 import sys
 sys.path.insert(0,'/home/pi/RPi4_behavior_boxes/essential')
 import behavbox
+from ClockTimeout import ClockTimeout
 
 # adding timing capability to the state machine
-@add_state_features(Timeout)
+@add_state_features(ClockTimeout)
 class TimedStateMachine(Machine):
     pass
 
@@ -62,12 +63,12 @@ class KellyTask(object):
         ########################################################################
         self.states = [
             State(name="standby", on_enter=["enter_standby"], on_exit=["exit_standby"]),
-            Timeout(
+            ClockTimeout(
                 name="reward_available",
                 on_enter=["enter_reward_available"],
                 on_exit=["exit_reward_available"],
             ),
-            Timeout(
+            ClockTimeout(
                 name="cue",
                 on_enter=["enter_cue"],
                 on_exit=["exit_cue"],
@@ -116,7 +117,7 @@ class KellyTask(object):
     def enter_reward_available(self):
         print("entering reward_available")
         print("start white noise")
-        self.box.sound1.blink(0.5, 0.1, 1)
+        self.box.pulses.pulse('sound1', 0.5)
         self.box.visualstim.show_grating(list(self.box.visualstim.gratings)[0])
         self.trial_running = True
 
@@ -126,7 +127,7 @@ class KellyTask(object):
     def enter_cue(self):
         print("deliver reward")
         self.box.cueLED4.on()
-        self.box.sound3.blink(0.5, 0.1, 1)
+        self.box.pulses.pulse('sound3', 0.5)
         # self.pump.reward("left", self.session_info["reward_size"])
         print("start cue")
         self.box.cueLED4.off()
@@ -2,25 +2,20 @@
 
 debug_enable = False
 
-from transitions import Machine
-from transitions import State
-from transitions.extensions.states import add_state_features, Timeout
+import StartupProfile  # first, so the imports below are timed
 from icecream import ic
 import logging
 from datetime import datetime
 import os
-from gpiozero import PWMLED, LED, Button
 import logging.config
-import pysistence, collections
-import socket
 import importlib
-import colorama
-import warnings
-import scipy.io, pickle
-import pygame
 from colorama import Fore, Style
-import time
-from time import sleep
+
+# imported where they are first used
+scipy_io = StartupProfile.lazy_import("scipy.io")
+pickle = StartupProfile.lazy_import("pickle")
+pygame = StartupProfile.lazy_import("pygame")
+StartupProfile.lap(StartupProfile.IMPORT, "run script")
 # all modules above this line will have logging disabled
 logging.config.dictConfig({
     'version': 1,
@@ -36,6 +31,7 @@ if debug_enable:
 
 # import your task class here
 from kelly_task import KellyTask
+from TaskDispatcher import TaskDispatcher
 
 try:
     # load in session_info file, check that dates are correct, put in automatic
@@ -80,25 +76,26 @@ try:
 
     # initiate task object\
     task = KellyTask(name="fentanyl_task", session_info=session_info)
+    dispatcher = TaskDispatcher(task)
+    clock = task.box.clock  # real time, or simulated time with session_info['virtual_clock']
 
     # # you can change various parameters if you want 
     # task.machine.states['cue'].timeout = 2
 
     # start session
     task.start_session()
-    scipy.io.savemat(session_info['file_basename'] + '_session_info.mat', {'session_info' : session_info})
+    scipy_io.savemat(session_info['file_basename'] + '_session_info.mat', {'session_info' : session_info})
     pickle.dump(session_info, open( session_info['file_basename'] + '_session_info.pkl', "wb" ) )
-    sleep(10)
+    clock.sleep(10)
     # loop over trials
     for i in range(2):
         logging.info(str("##############################\n" +
-                         str(time.time())) + ", starting_trial, " + str(i) +
+                         str(clock.time())) + ", starting_trial, " + str(i) +
                      str("\n##############################"))
 
         task.trial_start()
 
-        while task.trial_running:
-            task.run()
+        dispatcher.run_trial()  # sleeps until an event, treadmill sample, key or timeout
 
     raise SystemExit
 
@@ -109,7 +106,7 @@ except (KeyboardInterrupt, SystemExit):
     task.end_session()
     ic('just called end_session()')
     # save dicts to disk
-    scipy.io.savemat(session_info['file_basename'] + '_session_info.mat', {'session_info' : session_info})
+    scipy_io.savemat(session_info['file_basename'] + '_session_info.mat', {'session_info' : session_info})
     pickle.dump( session_info, open( session_info['file_basename'] + '_session_info.pkl', "wb" ) )
     pygame.quit()
 
@@ -2,16 +2,14 @@
 
 debug_enable = False
 
+import StartupProfile  # first, so the imports below are timed
 import logging
 from datetime import datetime
 import os
 import logging.config
-import socket
 import importlib
-import colorama
 from colorama import Fore, Style
-import scipy.io, pickle
-from time import sleep
+StartupProfile.lap(StartupProfile.IMPORT, "run script")
 
 # all modules above this line will have logging disabled
 logging.config.dictConfig({
@@ -66,7 +64,7 @@ try:
     duration_buffer = 10  # it takes 8 seconds for the camera and the video_start function to be set up
     duration = int(input("Enter the time in seconds: ")) + duration_buffer
     task.start_session()
-    sleep(duration)
+    task.box.clock.sleep(duration)  # simulated time with session_info['virtual_clock']
     task.end_session()
     dir_name = session_info['dir_name']
     basename = session_info['basename']
@@ -21,7 +21,7 @@ description:
 import importlib
 from transitions import Machine
 from transitions import State
-from transitions.extensions.states import add_state_features, Timeout
+from transitions.extensions.states import add_state_features
 import pysistence, collections
 from icecream import ic
 import logging
@@ -50,6 +50,7 @@ logging.config.dictConfig(
 import sys
 sys.path.insert(0,'/home/pi/RPi4_behavior_boxes/essential')
 import behavbox
+from ClockTimeout import ClockTimeout
 # import ivsa_syringe_pump  # I will need to add the ivsa_syringe_pump class to the behavbox code
 
 
@@ -110,7 +111,7 @@ class ivsa_syringe_pump(object,session_info):  # changed this to syringe pump
 
 
 # adding timing capability to the state machine
-@add_state_features(Timeout)
+@add_state_features(ClockTimeout)
 class TimedStateMachine(Machine):
     pass
 
@@ -151,7 +152,7 @@ class RemiSelfAdminTask(object):
             State(name='standby',
                   on_enter=["enter_standby"],
                   on_exit=["exit_standby"]),
-            Timeout(name='reward_available',
+            ClockTimeout(name='reward_available',
                     on_enter=["enter_reward_available"],
                     on_exit=["exit_reward_available"],
                     timeout=self.session_info["reward_timeout"],
@@ -182,7 +183,7 @@ class RemiSelfAdminTask(object):
         self.reward_time = 10 # sec. could be incorporate into the session_info; available time for reward
         self.reward_times_up = False
         self.reward_time_delay = self.session_info["reward_time_delay"]
-        self.reward_time_recent = time.time()
+        self.reward_time_recent = None  # box clock time of the last reward, set with the box below
         self.reward_pump = self.session_info["reward_pump"]
         self.reward_size = self.session_info["reward_size"]
 
@@ -203,6 +204,7 @@ class RemiSelfAdminTask(object):
         # initialize behavior box
         self.box = behavbox.BehavBox(self.session_info)
         self.pump = self.box.pump
+        self.reward_time_recent = self.box.clock.time()
         self.treadmill = self.box.treadmill
 
         # self.distance_initiation = self.session_info['treadmill_setup']['distance_initiation']
@@ -232,7 +234,7 @@ class RemiSelfAdminTask(object):
         self.syringe_pump.blink(infusion_duration, 0.1,
                                 1)  # season's edit: this is a shorter implement without having a function
         self.reward_list.append(("syringe_pump_reward", infusion_duration))
-        logging.info(";" + str(time.time()) + ";[reward];syringe_pump_reward" + str(infusion_duration))
+        logging.info(";" + str(self.box.clock.time()) + ";[reward];syringe_pump_reward" + str(infusion_duration))
         # self.inject(infusion_duration) # season's' edit: a function requires the input - infusion duration
     ########################################################################
     # functions called when state transitions occur
@@ -246,19 +248,19 @@ class RemiSelfAdminTask(object):
             pass
         elif self.state == "reward_available":
             if self.event_name == "reserved_rx1_pressed":
-                lever_pressed_time_temp = time.time()
+                lever_pressed_time_temp = self.box.clock.time()
                 lever_pressed_dt = lever_pressed_time_temp - self.lever_pressed_time
-                if lever_pressed_dt >= self.lever_press_interval and (time.time() - self.reward_time_recent > self.reward_time_delay):
+                if lever_pressed_dt >= self.lever_press_interval and (self.box.clock.time() - self.reward_time_recent > self.reward_time_delay):
                     self.reward()
                     self.lever_pressed_time = lever_pressed_time_temp
-                    self.reward_time_recent = time.time()
+                    self.reward_time_recent = self.box.clock.time()
                     self.total_reward += 1
 
             # look for keystrokes
             self.box.check_keybd()
 
     def enter_standby(self):
-        logging.info(";" + str(time.time()) + ";[transition];enter_standby;" + str(self.error_repeat))
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];enter_standby;" + str(self.error_repeat))
         # self.cue_off('all')
         self.update_plot_choice()
         # self.update_plot_error()
@@ -269,31 +271,31 @@ class RemiSelfAdminTask(object):
         #     self.early_lick_error = False
         self.lick_count = 0
         self.side_mice_buffer = None
-        print(str(time.time()) + ", Total reward up till current session: " + str(self.total_reward))
-        logging.info(";" + str(time.time()) + ";[trial];trial_" + str(self.trial_number) + ";" + str(self.error_repeat))
+        print(str(self.box.clock.time()) + ", Total reward up till current session: " + str(self.total_reward))
+        logging.info(";" + str(self.box.clock.time()) + ";[trial];trial_" + str(self.trial_number) + ";" + str(self.error_repeat))
 
     def enter_standby(self):
-        logging.info(";" + str(time.time()) + ";[transition];enter_standby;" + str(self.error_repeat))
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];enter_standby;" + str(self.error_repeat))
         # self.cue_off('all')
         self.update_plot_choice()
         # self.update_plot_error()
         self.trial_running = False
-        print(str(time.time()) + ", Total reward up till current session: " + str(self.total_reward))
-        logging.info(";" + str(time.time()) + ";[trial];trial_" + str(self.trial_number) + ";" + str(self.error_repeat))
+        print(str(self.box.clock.time()) + ", Total reward up till current session: " + str(self.total_reward))
+        logging.info(";" + str(self.box.clock.time()) + ";[trial];trial_" + str(self.trial_number) + ";" + str(self.error_repeat))
 
     def exit_standby(self):
         # self.error_repeat = False
-        logging.info(";" + str(time.time()) + ";[transition];exit_standby;" + str(self.error_repeat))
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];exit_standby;" + str(self.error_repeat))
         self.box.event_list.clear()
         pass
 
     def enter_reward_available(self):
-        logging.info(";" + str(time.time()) + ";[transition];enter_reward_available;" + str(self.error_repeat))
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];enter_reward_available;" + str(self.error_repeat))
         self.trial_running = True
         # self.reward_times_up = False
 
     def exit_reward_available(self):
-        logging.info(";" + str(time.time()) + ";[transition];exit_reward_available;" + str(self.error_repeat))
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];exit_reward_available;" + str(self.error_repeat))
         # self.cue_off('sound2')
         # self.reward_times_up = True
         self.pump.reward("vaccum", 0)
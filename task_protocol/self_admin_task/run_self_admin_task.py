@@ -11,24 +11,20 @@ description:
     adapted from Mitch's run_self_admin_task.py
 
 """
-import random
-from transitions import Machine
-from transitions import State
+import StartupProfile  # first, so the imports below are timed
 from icecream import ic
 import logging
 from datetime import datetime
 import os
 import logging.config
-import pysistence, collections
-import socket
 import importlib
-import colorama
-import warnings
-import scipy.io, pickle
-import pygame
 from colorama import Fore, Style
-import time
-from time import sleep
+
+# imported where they are first used
+scipy_io = StartupProfile.lazy_import("scipy.io")
+pickle = StartupProfile.lazy_import("pickle")
+pygame = StartupProfile.lazy_import("pygame")
+StartupProfile.lap(StartupProfile.IMPORT, "run script")
 
 debug_enable = False
 
@@ -48,6 +44,7 @@ if debug_enable:
 
 # import your task class here
 from self_admin_task import SelfAdminTask
+from TaskDispatcher import TaskDispatcher
 
 try:
     # load in session_info file, check that dates are correct, put in automatic
@@ -91,26 +88,27 @@ try:
 
 
     task = SelfAdminTask(name="self_admin_task", session_info=session_info)
+    dispatcher = TaskDispatcher(task)
+    clock = task.box.clock  # real time, or simulated time with session_info['virtual_clock']
 
     # start session
     task.start_session()
-    scipy.io.savemat(session_info['file_basename'] + '_session_info.mat', {'session_info': session_info})
+    scipy_io.savemat(session_info['file_basename'] + '_session_info.mat', {'session_info': session_info})
     pickle.dump(session_info, open(session_info['file_basename'] + '_session_info.pkl', "wb"))
-    sleep(10)
+    clock.sleep(10)
     # loop over trials
     # Set a timer
     t_minute = int(input("Enter the time in minutes: "))
-    t_end = time.time() + 60 * t_minute
+    t_end = clock.time() + 60 * t_minute
 
     for i in range(session_info['max_trial_number']):
         print("Trial " + str(i) + "\n")
-        if time.time() >= t_end:
+        if clock.time() >= t_end:
             print("Times up, finishing up")
             break
-        logging.info(";" + str(time.time()) + ";[transition];start_trial()")
+        logging.info(";" + str(clock.time()) + ";[transition];start_trial()")
         task.start_trial()  # initiate the time state machine, start_trial() is a trigger
-        while task.trial_running:
-            task.run()  # run command trigger additional functions outside of the state machine
+        dispatcher.run_trial()  # sleeps until an event, treadmill sample, key or timeout
         print("error_count: " + str(task.error_count))
     raise SystemExit
 
@@ -121,7 +119,7 @@ except (KeyboardInterrupt, SystemExit):
     task.end_session()
     ic('just called end_session()')
     # save dicts to disk
-    scipy.io.savemat(session_info['file_basename'] + '_session_info.mat', {'session_info': session_info})
+    scipy_io.savemat(session_info['file_basename'] + '_session_info.mat', {'session_info': session_info})
     pickle.dump(session_info, open(session_info['file_basename'] + '_session_info.pkl', "wb"))
     pygame.quit()
 
@@ -129,6 +127,6 @@ except (KeyboardInterrupt, SystemExit):
 except RuntimeError as ex:
     print(Fore.RED + Style.BRIGHT + 'ERROR: Exiting now' + Style.RESET_ALL)
     # save dicts to disk
-    scipy.io.savemat(session_info['file_basename'] + '_session_info.mat', {'session_info': session_info})
+    scipy_io.savemat(session_info['file_basename'] + '_session_info.mat', {'session_info': session_info})
     pickle.dump(session_info, open(session_info['file_basename'] + '_session_info.pkl', "wb"))
     task.end_session()
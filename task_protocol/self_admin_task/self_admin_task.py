@@ -11,11 +11,10 @@ description:
 import importlib
 from transitions import Machine
 from transitions import State
-from transitions.extensions.states import add_state_features, Timeout
+from transitions.extensions.states import add_state_features
 import pysistence, collections
 from icecream import ic
 import logging
-import time
 from datetime import datetime
 import os
 from gpiozero import PWMLED, LED, Button
@@ -40,10 +39,11 @@ logging.config.dictConfig(
 import sys
 sys.path.insert(0,'/home/pi/RPi4_behavior_boxes/essential')
 import behavbox
+from ClockTimeout import ClockTimeout
 
 
 # adding timing capability to the state machine
-@add_state_features(Timeout)
+@add_state_features(ClockTimeout)
 class TimedStateMachine(Machine):
     pass
 
@@ -84,7 +84,7 @@ class SelfAdminTask(object):
             State(name='standby',
                   on_enter=["enter_standby"],
                   on_exit=["exit_standby"]),
-            Timeout(name='reward_available',
+            ClockTimeout(name='reward_available',
                     on_enter=["enter_reward_available"],
                     on_exit=["exit_reward_available"],
                     timeout=self.session_info["reward_timeout"],
@@ -166,7 +166,7 @@ class SelfAdminTask(object):
             pass
         elif self.state == "reward_available":
             if self.event_name == "reserved_rx1_pressed":
-                lever_pressed_time_temp = time.time()
+                lever_pressed_time_temp = self.box.clock.time()
                 lever_pressed_dt = lever_pressed_time_temp - self.lever_pressed_time
                 if lever_pressed_dt >= self.lever_press_interval:
                     self.pump.reward(self.reward_pump, self.reward_size)
@@ -192,7 +192,7 @@ class SelfAdminTask(object):
         self.box.check_keybd()
 
     def enter_standby(self):
-        logging.info(";" + str(time.time()) + ";[transition];enter_standby;" + str(self.error_repeat))
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];enter_standby;" + str(self.error_repeat))
         # self.cue_off('all')
         self.update_plot_choice()
         # self.update_plot_error()
@@ -203,22 +203,22 @@ class SelfAdminTask(object):
         #     self.early_lick_error = False
         # self.lick_count = 0
         # self.side_mice_buffer = None
-        print(str(time.time()) + ", Total reward up till current session: " + str(self.total_reward))
-        logging.info(";" + str(time.time()) + ";[trial];trial_" + str(self.trial_number) + ";" + str(self.error_repeat))
+        print(str(self.box.clock.time()) + ", Total reward up till current session: " + str(self.total_reward))
+        logging.info(";" + str(self.box.clock.time()) + ";[trial];trial_" + str(self.trial_number) + ";" + str(self.error_repeat))
 
     def exit_standby(self):
         # self.error_repeat = False
-        logging.info(";" + str(time.time()) + ";[transition];exit_standby;" + str(self.error_repeat))
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];exit_standby;" + str(self.error_repeat))
         self.box.event_list.clear()
         pass
 
     def enter_reward_available(self):
-        logging.info(";" + str(time.time()) + ";[transition];enter_reward_available;" + str(self.error_repeat))
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];enter_reward_available;" + str(self.error_repeat))
         self.trial_running = True
         # self.reward_times_up = False
 
     def exit_reward_available(self):
-        logging.info(";" + str(time.time()) + ";[transition];exit_reward_available;" + str(self.error_repeat))
+        logging.info(";" + str(self.box.clock.time()) + ";[transition];exit_reward_available;" + str(self.error_repeat))
         # self.cue_off('sound2')
         # self.reward_times_up = True
         self.pump.reward("vaccum", 0)